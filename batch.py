@@ -0,0 +1,155 @@
+import os
+import time
+from datetime import datetime
+
+from core import default_output_name, error_text, export_database, summarize
+from history import recorded
+from progress import format_duration
+
+
+DEFAULT_CONCURRENCY = 2
+
+# Dumps currently running per "host:port", shared by every batch in this
+# process so two batches against the same server respect one limit
+_running_per_host = {}
+_active_batches = []
+
+
+def host_key(conn):
+    return f"{conn['host']}:{conn['port']}"
+
+
+def last_line(text):
+    lines = text.strip().splitlines()
+    return lines[-1] if lines else ""
+
+
+class BatchExport:
+    def __init__(self, runner, profile_name, conn, databases, output_dir, concurrency=DEFAULT_CONCURRENCY,
+                 export_type="full", archive_format="plain", codec="none", level=None, jobs=None,
+                 on_update=None, on_finished=None, throttle=None):
+        self.runner = runner
+        self.profile_name = profile_name
+        self.conn = conn
+        self.output_dir = output_dir
+        self.concurrency = max(1, int(concurrency))
+        self.options = (export_type, archive_format, codec, level, jobs)
+        # Applies to each dump on its own, not to the batch as a whole
+        self.throttle = throttle
+        self.on_update = on_update
+        self.on_finished = on_finished
+        self.queue = list(databases)
+        self.jobs = {}
+        self.started = None
+        self.finished = False
+        self.cancelled = False
+        self.status = {
+            database: {"state": "queued", "message": "", "output": None, "meter": None,
+                       "error": None, "seconds": None}
+            for database in databases
+        }
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.started = time.monotonic()
+        _active_batches.append(self)
+        self._fill()
+
+    def _fill(self):
+        # Called from the runner's polling thread, so no locking is needed
+        key = host_key(self.conn)
+        while self.queue and not self.cancelled and _running_per_host.get(key, 0) < self.concurrency:
+            self._launch(self.queue.pop(0))
+
+        if not self.queue and not self.jobs and not self.finished:
+            self.finished = True
+            _active_batches.remove(self)
+            if self.on_finished:
+                self.on_finished(self)
+
+    def _launch(self, database):
+        export_type, archive_format, codec, level, jobs = self.options
+        conn = dict(self.conn, database=database)
+        output = os.path.join(
+            self.output_dir, default_output_name(self.profile_name, database, archive_format, codec)
+        )
+        key = host_key(self.conn)
+        _running_per_host[key] = _running_per_host.get(key, 0) + 1
+        started = time.monotonic()
+
+        def finish(state, message, meter=None, error=None):
+            _running_per_host[key] -= 1
+            del self.jobs[database]
+            self._set(database, state, message, meter=meter, error=error,
+                      seconds=time.monotonic() - started)
+            # A freed slot may belong to another batch waiting on the same host
+            for batch in list(_active_batches):
+                if host_key(batch.conn) == key:
+                    batch._fill()
+
+        self.jobs[database] = self.runner.submit(
+            f"Export {database}",
+            recorded(
+                lambda job: export_database(
+                    job, conn, output, export_type, archive_format, codec, level, jobs, throttle=self.throttle
+                ),
+                self.profile_name, conn, "export", archive_format,
+                {"type": export_type, "compress": codec, "level": level, "jobs": jobs, "batch": True,
+                 "throttle": self.throttle}, output,
+            ),
+            on_status=lambda message: self._set(database, "running", message),
+            on_progress=lambda fraction, message: self._set(database, "running", message),
+            on_done=lambda meter: finish("done", summarize(meter) if meter else "completed", meter=meter),
+            on_error=lambda e: finish("failed", last_line(error_text(e)), error=e),
+            on_cancel=lambda: finish("cancelled", "cancelled"),
+        )
+        self._set(database, "running", "starting", output=output)
+
+    def _set(self, database, state, message, **fields):
+        entry = self.status[database]
+        entry["state"] = state
+        entry["message"] = message
+        entry.update(fields)
+        if self.on_update:
+            self.on_update(database, entry)
+
+    def cancel(self):
+        self.cancelled = True
+        for database in self.queue:
+            self._set(database, "cancelled", "not started")
+        self.queue = []
+        for job in list(self.jobs.values()):
+            job.cancel()
+        self._fill()
+
+    def counts(self):
+        counts = {}
+        for entry in self.status.values():
+            counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+        return counts
+
+    def ok(self):
+        return all(entry["state"] == "done" for entry in self.status.values())
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        counts = self.counts()
+        lines = [
+            f"Batch export of {len(self.status)} databases from {self.profile_name} ({host_key(self.conn)})",
+            f"Finished {datetime.now():%Y-%m-%d %H:%M:%S} after {format_duration(elapsed)}, "
+            f"concurrency {self.concurrency}",
+            ", ".join(f"{state}: {count}" for state, count in sorted(counts.items())),
+            "",
+        ]
+        for database, entry in self.status.items():
+            duration = format_duration(entry["seconds"]) if entry["seconds"] is not None else "-"
+            lines.append(f"{entry['state'].upper():10} {database:30} {duration:>9}  {entry['message']}")
+            if entry["state"] == "done" and entry["output"]:
+                lines.append(f"{'':10} {entry['output']}")
+        return "\n".join(lines)
+
+    def write_report(self):
+        path = os.path.join(self.output_dir, f"batch_report_{datetime.now():%Y%m%d_%H%M%S}.txt")
+        with open(path, "w") as f:
+            f.write(self.summary() + "\n")
+        return path
@@ -0,0 +1,336 @@
+import glob
+import json
+import os
+import platform
+import re
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from compression import available_codecs
+from core import psql_command
+from progress import MB, format_bytes
+from repository import is_repository, list_backups
+from toolchain import PG_BIN_GLOBS
+
+
+# Runs every export/import mode of the CLI against a throwaway cluster and
+# records wall time, throughput, peak RSS and CPU per mode. Each mode is a
+# separate `main.py` process, so its resource usage (and that of the pg_dump/
+# psql/pg_restore processes it starts) comes from wait4(); the server runs
+# detached under pg_ctl and is not counted.
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+USER = "bench"
+SOURCE_DB = "bench_source"
+TARGET_DB = "bench_target"
+# A mode more than this much slower than in the compared run is reported as a regression
+REGRESSION_THRESHOLD = 0.10
+# Part size for the split export, small enough for several parts from the default dataset
+SPLIT_PART = "32M"
+
+# Share of the dataset per table; rows are sized from the approximate on-disk row width
+DATASET_SQL = """
+CREATE SCHEMA bench;
+CREATE TABLE bench.accounts (
+    id bigint PRIMARY KEY, name text NOT NULL, email text NOT NULL,
+    balance numeric(12, 2) NOT NULL, created timestamptz NOT NULL
+);
+CREATE TABLE bench.events (
+    id bigint PRIMARY KEY, account_id bigint NOT NULL REFERENCES bench.accounts,
+    kind integer NOT NULL, payload jsonb NOT NULL, created timestamptz NOT NULL
+);
+CREATE TABLE bench.documents (id bigint PRIMARY KEY, title text NOT NULL, body text NOT NULL);
+INSERT INTO bench.accounts
+SELECT i, 'user ' || i, 'user' || i || '@example.com', (random() * 100000)::numeric(12, 2),
+       now() - i * interval '1 second'
+FROM generate_series(1, {accounts}) i;
+INSERT INTO bench.events
+SELECT i, 1 + i % {accounts}, i % 17,
+       jsonb_build_object('seq', i, 'tag', md5(i::text), 'value', random()),
+       now() - i * interval '10 milliseconds'
+FROM generate_series(1, {events}) i;
+INSERT INTO bench.documents
+SELECT i, 'document ' || i, repeat(md5(i::text) || ' ', 60)
+FROM generate_series(1, {documents}) i;
+CREATE INDEX events_account_idx ON bench.events (account_id);
+CREATE INDEX events_created_idx ON bench.events (created);
+CREATE INDEX accounts_email_idx ON bench.accounts (email);
+ANALYZE;
+"""
+TABLE_SHARES = {"accounts": (0.15, 110), "events": (0.60, 200), "documents": (0.25, 2000)}
+
+
+def find_pg_bin(pg_bin=None):
+    # Server binaries aren't always on PATH (Debian/RHEL keep them per version)
+    if pg_bin:
+        if not os.path.exists(os.path.join(pg_bin, "initdb")):
+            raise RuntimeError(f"initdb not found in {pg_bin}")
+        return pg_bin
+    initdb = shutil.which("initdb")
+    if initdb:
+        return os.path.dirname(initdb)
+    candidates = [path for pattern in PG_BIN_GLOBS for path in glob.glob(pattern)
+                  if os.path.exists(os.path.join(path, "initdb"))]
+    if not candidates:
+        raise RuntimeError("initdb not found; pass --pg-bin with the PostgreSQL bin directory")
+    # Highest version number wins
+    return max(candidates, key=lambda path: [int(number) for number in re.findall(r"\d+", path)])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TempCluster:
+    # initdb + pg_ctl in a temporary directory, reachable only over a Unix socket
+    def __init__(self, pg_bin, workdir):
+        self.pg_bin = pg_bin
+        self.data = os.path.join(workdir, "data")
+        self.socket_dir = os.path.join(workdir, "socket")
+        self.log = os.path.join(workdir, "server.log")
+        self.port = free_port()
+        self.env = dict(os.environ, PATH=pg_bin + os.pathsep + os.environ.get("PATH", ""))
+        self.env.pop("PGOPTIONS", None)
+
+    def conn(self, database=SOURCE_DB):
+        return {"host": self.socket_dir, "port": str(self.port), "username": USER, "password": None,
+                "database": database}
+
+    def run(self, cmd, **kwargs):
+        result = subprocess.run(cmd, env=self.env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                **kwargs)
+        if result.returncode != 0:
+            raise RuntimeError(f"{os.path.basename(cmd[0])} failed:\n{result.stdout.strip()}")
+        return result.stdout
+
+    def start(self):
+        os.makedirs(self.socket_dir)
+        self.run([os.path.join(self.pg_bin, "initdb"), "-D", self.data, "-U", USER, "-A", "trust",
+                  "-E", "UTF8", "--no-sync"])
+        options = f"-p {self.port} -k {shlex.quote(self.socket_dir)} -c listen_addresses='' -c max_wal_size=4GB"
+        self.run([os.path.join(self.pg_bin, "pg_ctl"), "-D", self.data, "-l", self.log, "-o", options,
+                  "-w", "start"])
+
+    def stop(self):
+        if os.path.exists(os.path.join(self.data, "postmaster.pid")):
+            self.run([os.path.join(self.pg_bin, "pg_ctl"), "-D", self.data, "-m", "fast", "-w", "stop"])
+
+    def sql(self, sql, database="postgres"):
+        conn = self.conn(database)
+        return self.run(psql_command(conn, "-X", "-q", "-t", "-A", "-v", "ON_ERROR_STOP=1", "-c", sql),
+                        input="").strip()
+
+    def recreate(self, database):
+        self.sql(f"DROP DATABASE IF EXISTS {database}")
+        self.sql(f"CREATE DATABASE {database}")
+
+    def database_size(self, database):
+        return int(self.sql(f"SELECT pg_database_size('{database}')"))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def generate_dataset(cluster, size_mb):
+    rows = {table: max(1, int(size_mb * MB * share / width)) for table, (share, width) in TABLE_SHARES.items()}
+    cluster.recreate(SOURCE_DB)
+    cluster.run(psql_command(cluster.conn(), "-X", "-q", "-v", "ON_ERROR_STOP=1"), input=DATASET_SQL.format(**rows))
+    return rows
+
+
+def export_modes():
+    # (name, CLI arguments, output name)
+    modes = [("plain", ["--format", "plain"], "plain.sql")]
+    for codec in available_codecs():
+        if codec != "none":
+            modes.append((f"plain-{codec}", ["--format", "plain", "--compress", codec], f"plain.sql.{codec}"))
+    modes += [
+        ("directory", ["--format", "dir"], "directory.dir"),
+        ("copy", ["--format", "copy"], "copy.tables"),
+        # Runs right after "copy" with nothing changed, so it measures the change detection itself
+        ("incremental", ["--format", "incremental"], "incremental.incr.tables"),
+        ("plain-split", ["--format", "plain", "--split", SPLIT_PART], "plain.parts"),
+        ("repository", ["--format", "repo"], "bench.repo"),
+        # A second backup into the same repository: every chunk is already stored
+        ("repository-repeat", ["--format", "repo"], "bench.repo"),
+    ]
+    return modes
+
+
+def import_modes():
+    # (name, export it reads, extra CLI arguments)
+    modes = [("plain", "plain", [])]
+    for codec in available_codecs():
+        if codec != "none":
+            modes.append((f"plain-{codec}", f"plain-{codec}", []))
+    modes += [
+        ("plain-bulk", "plain", ["--bulk"]),
+        ("plain-batches", "plain", ["--transaction", "batches"]),
+        ("plain-single", "plain", ["--transaction", "single"]),
+        ("directory", "directory", []),
+        ("directory-bulk", "directory", ["--bulk"]),
+        ("copy", "copy", []),
+        ("plain-split", "plain-split", []),
+        ("repository", "repository", []),
+    ]
+    return modes
+
+
+def copy_modes():
+    return [("serial", []), ("parallel", ["--parallel"])]
+
+
+def import_source(path):
+    # A repository is restored from its newest backup's manifest
+    if is_repository(path):
+        backups = list_backups(path)
+        return backups[-1]["path"] if backups else ""
+    return path
+
+
+def artifact_bytes(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def measure(cmd, cwd, env, log):
+    # Runs cmd to completion; wait4() reports usage for it and every child it waited for
+    started = time.monotonic()
+    with open(log, "ab") as f:
+        process = subprocess.Popen(cmd, cwd=cwd, env=env, stdin=subprocess.DEVNULL, stdout=f, stderr=f)
+        _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.monotonic() - started
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    rss_bytes = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return {
+        "ok": process.returncode == 0,
+        "wall_seconds": round(wall, 3),
+        "cpu_user_seconds": round(usage.ru_utime, 3),
+        "cpu_system_seconds": round(usage.ru_stime, 3),
+        "peak_rss_mb": round(rss_bytes / MB, 1),
+    }
+
+
+def run_benchmark(size_mb=100, pg_bin=None, jobs="auto", only=None, keep=False, on_status=print):
+    # only: optional set of "export:<mode>", "import:<mode>" and "copy:<mode>" names to run
+    pg_bin = find_pg_bin(pg_bin)
+    workdir = tempfile.mkdtemp(prefix="pg_import_export_bench_")
+    results = []
+    try:
+        with TempCluster(pg_bin, workdir) as cluster:
+            version = cluster.sql("SHOW server_version")
+            on_status(f"Cluster {version} on port {cluster.port}, generating {size_mb} MB of data...")
+            rows = generate_dataset(cluster, size_mb)
+            dataset_bytes = cluster.database_size(SOURCE_DB)
+
+            profiles_file = os.path.join(workdir, "db_profiles.json")
+            profile = {"host": cluster.socket_dir, "port": cluster.port, "username": USER, "database": SOURCE_DB}
+            with open(profiles_file, "w") as f:
+                json.dump({"bench": profile, "bench_target": dict(profile, database=TARGET_DB)}, f, indent=4)
+            base = [sys.executable, MAIN_SCRIPT, "--profiles-file", profiles_file]
+            log = os.path.join(workdir, "tool.log")
+
+            def record(operation, mode, cmd, artifact=None, target=None):
+                if only and f"{operation}:{mode}" not in only:
+                    return
+                if target:
+                    cluster.recreate(target)
+                on_status(f"{operation} {mode}...")
+                result = measure(cmd, workdir, cluster.env, log)
+                result.update(operation=operation, mode=mode)
+                result["mb_per_second"] = round(dataset_bytes / MB / result["wall_seconds"], 2)
+                if artifact:
+                    result["artifact_bytes"] = artifact_bytes(artifact)
+                results.append(result)
+                on_status(
+                    f"{operation} {mode}: {result['wall_seconds']:.1f}s, {result['mb_per_second']} MB/s"
+                    + ("" if result["ok"] else " (FAILED, see tool.log)")
+                )
+
+            outputs = {}
+            for mode, args, name in export_modes():
+                outputs[mode] = os.path.join(workdir, name)
+                record("export", mode, base + [
+                    "export", "--profile", "bench", "--jobs", str(jobs), "--quiet", "--no-plan", "-o", outputs[mode]
+                ] + args, artifact=outputs[mode])
+
+            for mode, source, args in import_modes():
+                if not os.path.exists(outputs.get(source, "")):
+                    continue
+                record("import", mode, base + [
+                    "import", "--profile", "bench_target", "--jobs", str(jobs), "--quiet",
+                    import_source(outputs[source])
+                ] + args, artifact=outputs[source], target=TARGET_DB)
+
+            for mode, args in copy_modes():
+                record("copy", mode, base + [
+                    "copy", "--profile", "bench", "--to-profile", "bench_target", "--jobs", str(jobs), "--quiet"
+                ] + args, target=TARGET_DB)
+    finally:
+        if keep:
+            on_status(f"Kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": current_commit(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "server_version": version,
+        "jobs": jobs,
+        "dataset": {"size_mb": size_mb, "database_bytes": dataset_bytes, "rows": rows},
+        "results": results,
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(MAIN_SCRIPT),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    # One line per mode present in both runs, slower modes flagged
+    before = {(r["operation"], r["mode"]): r for r in previous["results"] if r["ok"]}
+    lines = []
+    for result in current["results"]:
+        old = before.get((result["operation"], result["mode"]))
+        if not old or not result["ok"]:
+            continue
+        change = result["wall_seconds"] / old["wall_seconds"] - 1 if old["wall_seconds"] else 0
+        flag = "  REGRESSION" if change > REGRESSION_THRESHOLD else ""
+        lines.append(
+            f"{result['operation']:<7} {result['mode']:<16} {old['wall_seconds']:>8.1f}s -> "
+            f"{result['wall_seconds']:>8.1f}s ({change:+.0%}), RSS {old['peak_rss_mb']:.0f} -> "
+            f"{result['peak_rss_mb']:.0f} MB{flag}"
+        )
+    return lines
+
+
+def format_results(results):
+    lines = [f"Dataset: {format_bytes(results['dataset']['database_bytes'])} (PostgreSQL {results['server_version']})"]
+    for r in results["results"]:
+        lines.append(
+            f"{r['operation']:<7} {r['mode']:<16} {r['wall_seconds']:>8.1f}s {r['mb_per_second']:>8.1f} MB/s "
+            f"CPU {r['cpu_user_seconds'] + r['cpu_system_seconds']:>7.1f}s RSS {r['peak_rss_mb']:>7.1f} MB"
+            + ("" if r["ok"] else "  FAILED")
+        )
+    return lines
@@ -0,0 +1,180 @@
+import hashlib
+import os
+import re
+import subprocess
+import threading
+
+from copy_engine import run_parallel
+from core import connection_args, pg_env, psql_command, query
+from jobs import Job
+from profiles import sibling_path
+from toolchain import client
+
+
+# Total maintenance_work_mem for index builds, split across the parallel jobs
+INDEX_MEMORY_MB = 2048
+LOAD_SETTINGS = ["synchronous_commit=off", "maintenance_work_mem=1GB"]
+
+SYSTEM_SCHEMAS = "('pg_catalog', 'information_schema')"
+
+# Secondary indexes: not backing a constraint, not a partition's child index, not owned by an extension.
+# Names and definitions are hex-encoded, as they may contain "|" (the column separator).
+INDEXES_SQL = f"""
+SELECT encode(convert_to(i.indexrelid::regclass::text, 'UTF8'), 'hex'),
+       encode(convert_to(pg_get_indexdef(i.indexrelid), 'UTF8'), 'hex')
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind = 'i' AND NOT i.indisprimary
+  AND n.nspname NOT IN {SYSTEM_SCHEMAS} AND n.nspname NOT LIKE 'pg_toast%'
+  AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid)
+  AND NOT EXISTS (SELECT 1 FROM pg_inherits h WHERE h.inhrelid = i.indexrelid)
+  AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.objid = i.indexrelid AND d.deptype = 'e');
+"""
+
+# Foreign keys declared directly on a table (partition clones follow their parent),
+# and whether they were validated: one added NOT VALID stays unvalidated
+FOREIGN_KEYS_SQL = f"""
+SELECT encode(convert_to(k.conrelid::regclass::text, 'UTF8'), 'hex'),
+       encode(convert_to(quote_ident(k.conname), 'UTF8'), 'hex'),
+       encode(convert_to(pg_get_constraintdef(k.oid), 'UTF8'), 'hex'),
+       k.convalidated
+FROM pg_constraint k
+JOIN pg_namespace n ON n.oid = k.connamespace
+WHERE k.contype = 'f' AND k.conparentid = 0 AND n.nspname NOT IN {SYSTEM_SCHEMAS};
+"""
+# pg_get_constraintdef() ends unvalidated constraints with this
+NOT_VALID = " NOT VALID"
+
+
+def decode(value):
+    return bytes.fromhex(value.strip()).decode("utf-8")
+
+
+def recovery_path(conn):
+    # Socket directories and odd database names can't go into a file name as they
+    # are; the hash keeps names that clean up the same way apart
+    digest = hashlib.sha1(f"{conn['host']}:{conn['port']}/{conn['database']}".encode()).hexdigest()[:8]
+    safe = "_".join(re.sub(r"[^A-Za-z0-9.-]+", "_", value).strip("_.") for value in (conn["host"], conn["database"]))
+    return sibling_path(f"bulkload_recovery_{safe}_{digest}.sql")
+
+
+def is_superuser(job, conn):
+    rows = query(job, conn, "SELECT rolsuper FROM pg_roles WHERE rolname = current_user;")
+    return bool(rows) and rows[0][0].strip() == "t"
+
+
+def run_statements(job, conn, statements):
+    commands = []
+    for statement in statements:
+        commands += ["-c", statement]
+    job.run(
+        psql_command(conn, "-X", "-q", "-v", "ON_ERROR_STOP=1", *commands),
+        env=pg_env(conn), stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+
+
+def defer(job, conn):
+    # Drops secondary indexes and foreign keys, returning what to recreate.
+    # The recreate script is written first, so an interrupted load can be repaired by hand.
+    indexes = [(decode(name), decode(definition)) for name, definition in query(job, conn, INDEXES_SQL)]
+    foreign_keys = []
+    for table, name, definition, validated in query(job, conn, FOREIGN_KEYS_SQL):
+        definition = decode(definition)
+        if definition.endswith(NOT_VALID):
+            definition = definition[:-len(NOT_VALID)]
+        foreign_keys.append((decode(table), decode(name), definition, validated.strip() == "t"))
+    if not indexes and not foreign_keys:
+        return indexes, foreign_keys
+
+    path = recovery_path(conn)
+    with open(path, "w") as f:
+        f.write(f"-- Indexes and foreign keys dropped for a bulk load into {conn['database']}\n")
+        for name, definition in indexes:
+            f.write(definition + ";\n")
+        for table, name, definition, validated in foreign_keys:
+            f.write(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}{'' if validated else NOT_VALID};\n")
+
+    job.status(f"Dropping {len(indexes)} indexes and {len(foreign_keys)} foreign keys...")
+    # Foreign keys go first: one may depend on an index being dropped
+    run_statements(job, conn, ["BEGIN"] + [
+        f"ALTER TABLE {table} DROP CONSTRAINT {name}" for table, name, definition, validated in foreign_keys
+    ] + [f"DROP INDEX {name}" for name, definition in indexes] + ["COMMIT"])
+    return indexes, foreign_keys
+
+
+def rebuild(job, conn, indexes, foreign_keys, jobs):
+    total = len(indexes) + len(foreign_keys)
+    done = 0
+    lock = threading.Lock()
+    workers = job.child()
+
+    def step(label, statements):
+        nonlocal done
+        run_statements(workers, conn, statements)
+        with lock:
+            done += 1
+            job.progress(min(done / total, 0.99), f"{label} ({done}/{total}, {jobs} jobs)")
+
+    if indexes:
+        memory = f"{max(64, INDEX_MEMORY_MB // jobs)}MB"
+        run_parallel(jobs, [
+            (step, ("Rebuilding indexes", [f"SET maintenance_work_mem = '{memory}'", definition]))
+            for name, definition in indexes
+        ], workers)
+
+    if foreign_keys:
+        # Adding as NOT VALID only takes a brief lock; the validating scans then run
+        # in parallel, for the constraints that were valid before
+        job.status("Restoring foreign keys...")
+        run_statements(job, conn, [
+            f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}{NOT_VALID}"
+            for table, name, definition, validated in foreign_keys
+        ])
+        done += sum(1 for *_, validated in foreign_keys if not validated)
+        run_parallel(jobs, [
+            (step, ("Validating foreign keys", [f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}"]))
+            for table, name, definition, validated in foreign_keys if validated
+        ], workers)
+
+
+def analyze(job, conn, jobs):
+    job.status(f"Analyzing tables ({jobs} jobs)...")
+    job.run(
+        [client("vacuumdb", conn)] + connection_args(conn) + ["--analyze-only", "-j", str(jobs)],
+        env=pg_env(conn), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+
+
+def bulk_load(job, conn, jobs, load):
+    # Runs load(conn) with indexes and foreign keys deferred and load-friendly
+    # session settings, then rebuilds and analyzes in parallel
+    settings = list(LOAD_SETTINGS)
+    if is_superuser(job, conn):
+        # Skips triggers, including the per-row foreign key checks
+        settings.append("session_replication_role=replica")
+    else:
+        job.status("Not a superuser: triggers stay enabled during the load")
+
+    indexes, foreign_keys = defer(job, conn)
+    options = " ".join(f"-c {setting}" for setting in settings)
+    try:
+        meter = load(dict(conn, options=options))
+    except BaseException:
+        if indexes or foreign_keys:
+            # Put back what we dropped, whatever stopped the load. A cancelled job
+            # refuses to start processes, so this runs as a job of its own; if it
+            # fails too, the recovery script is still there.
+            cleanup = Job(job.runner, f"{job.name} cleanup")
+            try:
+                rebuild(cleanup, conn, indexes, foreign_keys, jobs)
+                os.remove(recovery_path(conn))
+            except Exception:
+                pass
+        raise
+
+    rebuild(job, conn, indexes, foreign_keys, jobs)
+    if indexes or foreign_keys:
+        os.remove(recovery_path(conn))
+    analyze(job, conn, jobs)
+    return meter
@@ -0,0 +1,572 @@
+import argparse
+import json
+import os
+import signal
+import sys
+
+from batch import DEFAULT_CONCURRENCY, BatchExport
+from compression import CODECS, available_codecs
+from core import (
+    TRANSACTION_MODES, default_output_name, error_text, export_database, import_database,
+    inspect_import_file, list_databases, restore_jobs, summarize
+)
+from history import load_history, recorded, trends
+from jobs import JobRunner
+from parts import parse_size
+from planner import format_plan, plan_export, try_plan
+from progress import format_bytes, format_duration
+from profiles import PROFILES_FILE, ProfileStore, connection_for, load_profiles, use_profiles_file
+from repository import is_repository, list_backups, prune, stored_bytes
+from selection import describe
+from throttle import is_throttled
+from toolchain import TOOLS, client, clients, format_version, server_key, server_version
+from transfer import copy_database
+from verify import format_report, verify_backup
+
+
+# Headless entry point: never import tkinter from here (or from anything it imports)
+
+FORMATS = {"plain": "plain", "dir": "directory", "copy": "copy", "incremental": "incremental", "repo": "repository"}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py", description="PostgreSQL import/export without the GUI"
+    )
+    parser.add_argument(
+        "--profiles-file", default=PROFILES_FILE, help="Profile store (default: %(default)s)"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_connection_args(sub):
+        sub.add_argument("--profile", required=True, help="Connection profile name")
+        sub.add_argument("--database", help="Override the profile's database")
+        sub.add_argument(
+            "--jobs", default="auto", help="Parallel jobs for directory/archive formats (default: auto)"
+        )
+        sub.add_argument("--quiet", action="store_true", help="Don't print progress")
+
+    def add_selection_args(sub):
+        # Same letters as pg_dump; tables are given as schema.table
+        sub.add_argument("-n", "--schema", action="append", default=[], help="Only this schema (repeatable)")
+        sub.add_argument("-t", "--table", action="append", default=[], help="Only this schema.table (repeatable)")
+        sub.add_argument("-N", "--exclude-schema", action="append", default=[], help="Skip this schema")
+        sub.add_argument("-T", "--exclude-table", action="append", default=[], help="Skip this schema.table")
+        sub.add_argument(
+            "--exclude-table-data", action="append", default=[], help="Definition only for this schema.table"
+        )
+
+    def add_throttle_args(sub):
+        sub.add_argument("--max-rate", type=float, help="Cap the dump stream at this many MB/s")
+        sub.add_argument(
+            "--busy-sessions", type=int, help="Back off while more client sessions than this are active"
+        )
+        sub.add_argument("--max-lag", type=float, help="Back off while a replica is more than this many MB behind")
+
+    export = subparsers.add_parser("export", help="Dump a database")
+    add_connection_args(export)
+    export.add_argument("--type", choices=["full", "schema", "data"], default="full")
+    export.add_argument("--format", choices=list(FORMATS), default="plain")
+    export.add_argument(
+        "--compress", choices=["none"] + list(CODECS), default="none",
+        help="With --format repo: how a new repository compresses its chunks"
+    )
+    export.add_argument("--level", help="Compression level (codec default if omitted)")
+    export.add_argument(
+        "-o", "--output", help="Output file or directory; with --format repo, the repository (default: <profile>.repo)"
+    )
+    export.add_argument(
+        "--split", help="Plain SQL only: write a directory of parts of this size (e.g. 1G) with SHA-256 checksums"
+    )
+    export.add_argument(
+        "--no-plan", action="store_true", help="Skip the size check against the free disk space before dumping"
+    )
+    add_selection_args(export)
+    add_throttle_args(export)
+
+    restore = subparsers.add_parser("import", help="Load a SQL file or archive into a database")
+    add_connection_args(restore)
+    restore.add_argument("file", help="SQL file (optionally compressed), archive, or directory archive")
+    restore.add_argument(
+        "--bulk", action="store_true",
+        help="Drop secondary indexes and foreign keys during the load, rebuild and analyze in parallel after"
+    )
+    restore.add_argument(
+        "--transaction", choices=TRANSACTION_MODES, default="none",
+        help="none: psql autocommit; batches: commit in batches with a resumable checkpoint "
+             "(plain SQL only); single: all or nothing (default: %(default)s)"
+    )
+    restore.add_argument(
+        "--resume", action="store_true", help="With --transaction batches, continue from the file's checkpoint"
+    )
+    restore.add_argument(
+        "--batch-size", type=int, help="Statements per commit with --transaction batches (default: 1000)"
+    )
+    add_selection_args(restore)
+
+    batch = subparsers.add_parser("export-batch", help="Dump several databases with bounded concurrency")
+    batch.add_argument("--profile", required=True, help="Connection profile name")
+    batch.add_argument("--databases", help="Comma-separated database names")
+    batch.add_argument("--all", action="store_true", help="Every non-template database on the server")
+    batch.add_argument("--exclude", default="", help="Comma-separated databases to skip with --all")
+    batch.add_argument(
+        "--concurrency", type=int, help="Concurrent pg_dump processes against the host (default: profile setting)"
+    )
+    batch.add_argument("--jobs", default="1", help="pg_dump -j per database for --format dir (default: 1)")
+    batch.add_argument("--type", choices=["full", "schema", "data"], default="full")
+    batch.add_argument("--format", choices=list(FORMATS), default="plain")
+    batch.add_argument("--compress", choices=["none"] + list(CODECS), default="none")
+    batch.add_argument("--level", help="Compression level (codec default if omitted)")
+    batch.add_argument("--output-dir", required=True, help="Directory for dumps and the batch report")
+    batch.add_argument("--quiet", action="store_true", help="Don't print per-database status")
+    add_throttle_args(batch)
+
+    copy = subparsers.add_parser("copy", help="Stream a database into another profile, without a dump file")
+    add_connection_args(copy)
+    copy.add_argument("--to-profile", required=True, help="Target connection profile")
+    copy.add_argument("--to-database", help="Target database (default: the target profile's)")
+    copy.add_argument("--type", choices=["full", "schema", "data"], default="full")
+    copy.add_argument(
+        "--parallel", action="store_true", help="One COPY stream per table (up to --jobs at once)"
+    )
+
+    plan = subparsers.add_parser(
+        "plan", help="Recommend export settings and estimate the dump's duration and size"
+    )
+    plan.add_argument("--profile", required=True, help="Connection profile name")
+    plan.add_argument("--database", help="Override the profile's database")
+    plan.add_argument("--type", choices=["full", "schema", "data"], default="full")
+    plan.add_argument("-o", "--output", help="Where the export would go, for the free space (default: here)")
+    plan.add_argument("--format", choices=list(FORMATS), help="Estimate this format instead of recommending one")
+    plan.add_argument("--compress", choices=["none"] + list(CODECS), help="Estimate this codec")
+    plan.add_argument("--level", help="Estimate this compression level")
+    plan.add_argument("--jobs", help="Estimate this many parallel jobs")
+    add_selection_args(plan)
+
+    bench = subparsers.add_parser(
+        "benchmark", help="Time every export/import mode against a throwaway local cluster"
+    )
+    bench.add_argument("--size-mb", type=int, default=100, help="Synthetic dataset size (default: %(default)s)")
+    bench.add_argument("--pg-bin", help="Directory with initdb/pg_ctl (default: PATH or the usual install paths)")
+    bench.add_argument("--jobs", default="auto", help="Parallel jobs passed to every mode (default: auto)")
+    bench.add_argument(
+        "--only", default="", help="Comma-separated operation:mode names to run, e.g. export:copy,import:copy"
+    )
+    bench.add_argument("-o", "--output", default="benchmark.json", help="Results file (default: %(default)s)")
+    bench.add_argument("--compare", help="Earlier results file to compare against")
+    bench.add_argument("--keep", action="store_true", help="Keep the cluster directory and dumps for inspection")
+
+    verify = subparsers.add_parser("verify", help="Check a backup without restoring it")
+    verify.add_argument("file", help="SQL file, split export, archive, directory archive or per-table export")
+    verify.add_argument("--profile", help="Compare row counts with this profile's database (the source)")
+    verify.add_argument("--database", help="Override the profile's database")
+    verify.add_argument("--jobs", default="auto", help="Parallel count(*) queries and file reads (default: auto)")
+    verify.add_argument(
+        "--sample", type=int, default=8, help="Tables given an exact count(*) besides suspicious ones (default: 8)"
+    )
+    verify.add_argument("--quiet", action="store_true", help="Don't print progress")
+
+    repo = subparsers.add_parser("repo", help="List or prune the backups in a deduplicating repository")
+    repo.add_argument("action", choices=["list", "prune"])
+    repo.add_argument("path", help="Repository directory (created by export --format repo)")
+    repo.add_argument("--keep-days", type=int, help="prune: drop backups older than this many days")
+    repo.add_argument(
+        "--keep-last", type=int, default=1, help="prune: always keep this many newest backups per database "
+                                                 "(default: %(default)s)"
+    )
+
+    history = subparsers.add_parser("history", help="Show past jobs and per-database timing trends")
+    history.add_argument("--profile", help="Only jobs run with this profile")
+    history.add_argument("--database", help="Only jobs against this database")
+    history.add_argument("--limit", type=int, default=20, help="Most recent jobs to list (default: %(default)s)")
+    history.add_argument("--trends", action="store_true", help="Per-database trends instead of single jobs")
+
+    profiles = subparsers.add_parser("profiles", help="List saved connection profiles by group")
+    profiles.add_argument("--search", default="", help="Only profiles matching these words (name, host, database, user)")
+    profiles.add_argument("--group", help="Only this group (the profile's \"group\" key, or its host)")
+
+    tools = subparsers.add_parser("tools", help="List the PostgreSQL client tools found and which ones a profile uses")
+    tools.add_argument("--profile", help="Show the server version and the clients picked for this profile")
+    tools.add_argument("--database", help="Override the profile's database")
+    tools.add_argument("--refresh", action="store_true", help="Probe every client and the server again")
+
+    return parser
+
+
+def resolve_connection(args, profiles, require_database=True):
+    if args.profile not in profiles:
+        raise SystemExit(f"error: unknown profile '{args.profile}'")
+    # Without a saved password, psql/pg_dump fall back to PGPASSWORD or ~/.pgpass
+    conn = connection_for(args.profile, profiles[args.profile], database=args.database)
+    if require_database and not conn["database"]:
+        raise SystemExit("error: no database given and the profile has none")
+    return conn
+
+
+def table_name(value):
+    schema, dot, table = value.partition(".")
+    if not dot or not schema or not table:
+        raise SystemExit(f"error: tables are given as schema.table: {value}")
+    return [schema, table]
+
+
+def selection_from(args):
+    return {
+        "schemas": args.schema,
+        "tables": [table_name(value) for value in args.table],
+        "exclude_schemas": args.exclude_schema,
+        "exclude_tables": [table_name(value) for value in args.exclude_table],
+        "exclude_data": [table_name(value) for value in args.exclude_table_data],
+    }
+
+
+def throttle_from(args, archive_format):
+    throttle = {"max_mb_per_second": args.max_rate, "busy_sessions": args.busy_sessions, "max_lag_mb": args.max_lag}
+    if is_throttled(throttle) and archive_format == "directory":
+        raise SystemExit("error: directory archives can't be throttled (use --format plain or copy)")
+    return throttle if is_throttled(throttle) else None
+
+
+def run_job(name, target, quiet):
+    runner = JobRunner()
+    outcome = {}
+
+    def on_progress(fraction, message):
+        if not quiet:
+            # Rewrite a single status line when attached to a terminal
+            end = "\r" if sys.stderr.isatty() else "\n"
+            print(message.ljust(79), end=end, file=sys.stderr, flush=True)
+
+    def on_status(message):
+        on_progress(None, message)
+
+    job = runner.submit(
+        name,
+        target,
+        on_status=on_status,
+        on_progress=on_progress,
+        on_done=lambda result: outcome.update(result=result),
+        on_error=lambda e: outcome.update(error=e),
+        on_cancel=lambda: outcome.update(cancelled=True),
+    )
+
+    # Ctrl+C / SIGTERM terminate the running pg_dump/psql cleanly
+    def cancel(signum, frame):
+        job.cancel()
+
+    signal.signal(signal.SIGINT, cancel)
+    signal.signal(signal.SIGTERM, cancel)
+    runner.wait()
+
+    if not quiet and sys.stderr.isatty():
+        print(file=sys.stderr)
+    return outcome
+
+
+def report(name, outcome, target):
+    if "error" in outcome:
+        print(f"{name} failed: {error_text(outcome['error'])}", file=sys.stderr)
+        return 1
+    if outcome.get("cancelled"):
+        print(f"{name} cancelled", file=sys.stderr)
+        return 130
+    meter = outcome.get("result")
+    summary = f" ({summarize(meter)})" if meter else ""
+    print(f"{name} completed: {target}{summary}")
+    return 0
+
+
+def cmd_export(args, profiles):
+    conn = resolve_connection(args, profiles)
+    archive_format = FORMATS[args.format]
+    if args.compress not in available_codecs():
+        raise SystemExit(f"error: {args.compress} compression is not available (missing Python package)")
+
+    try:
+        split_bytes = parse_size(args.split) if args.split else None
+    except ValueError:
+        raise SystemExit(f"error: invalid --split size: {args.split}")
+    if split_bytes and archive_format != "plain":
+        raise SystemExit("error: only plain SQL exports can be split into parts")
+
+    output = args.output or default_output_name(
+        args.profile, conn["database"], archive_format, args.compress, split=bool(split_bytes)
+    )
+    if (archive_format not in ("plain", "repository") or split_bytes) and os.path.exists(output) and (
+        not os.path.isdir(output) or os.listdir(output)
+    ):
+        raise SystemExit(f"error: output directory must not exist or be empty: {output}")
+
+    selection = selection_from(args)
+    throttle = throttle_from(args, archive_format)
+    plan = None
+    if not args.no_plan:
+        # Advice only: a plan that can't be made, or that doesn't fit, doesn't stop the export
+        outcome = run_job(
+            "Plan",
+            lambda job: try_plan(job, conn, output, args.type, selection, archive_format, args.compress,
+                                 args.level, args.jobs),
+            quiet=True,
+        )
+        if outcome.get("cancelled"):
+            return report("Export", outcome, output)
+        plan = outcome.get("result")
+        for warning in (plan or {}).get("warnings", []):
+            print(f"warning: {warning}", file=sys.stderr)
+
+    flags = {"type": args.type, "compress": args.compress, "level": args.level, "jobs": args.jobs,
+             "selection": describe(selection), "split": split_bytes, "throttle": throttle}
+    outcome = run_job(
+        "Export",
+        recorded(
+            lambda job: export_database(
+                job, conn, output, args.type, archive_format, args.compress, args.level, args.jobs, selection,
+                split_bytes, throttle
+            ),
+            args.profile, conn, "export", archive_format, flags, output,
+            source_bytes=plan["dump_bytes"] if plan else None,
+        ),
+        args.quiet,
+    )
+    return report("Export", outcome, output)
+
+
+def cmd_import(args, profiles):
+    conn = resolve_connection(args, profiles)
+    try:
+        filename, codec, archive_format = inspect_import_file(args.file)
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"error: could not read import file: {e}")
+
+    jobs = restore_jobs(archive_format, args.jobs)
+    selection = selection_from(args)
+    flags = {"codec": codec, "jobs": jobs, "bulk": args.bulk, "transaction": args.transaction,
+             "resume": args.resume, "selection": describe(selection)}
+    outcome = run_job(
+        "Import",
+        recorded(
+            lambda job: import_database(
+                job, conn, filename, codec, archive_format, jobs, args.bulk, args.transaction, args.resume,
+                args.batch_size, selection
+            ),
+            args.profile, conn, "import", archive_format, flags, filename,
+        ),
+        args.quiet,
+    )
+    return report("Import", outcome, filename)
+
+
+def cmd_export_batch(args, profiles):
+    args.database = None
+    conn = resolve_connection(args, profiles, require_database=False)
+    if args.compress not in available_codecs():
+        raise SystemExit(f"error: {args.compress} compression is not available (missing Python package)")
+    throttle = throttle_from(args, FORMATS[args.format])
+
+    runner = JobRunner()
+    if args.all:
+        outcome = run_job("List databases", lambda job: list_databases(job, conn), quiet=True)
+        if "result" not in outcome:
+            return report("List databases", outcome, "")
+        excluded = {name.strip() for name in args.exclude.split(",") if name.strip()}
+        databases = [name for name in outcome["result"] if name not in excluded]
+    elif args.databases:
+        databases = [name.strip() for name in args.databases.split(",") if name.strip()]
+    else:
+        raise SystemExit("error: give --databases or --all")
+
+    concurrency = args.concurrency or profiles[args.profile].get("batch_concurrency", DEFAULT_CONCURRENCY)
+
+    def on_update(database, entry):
+        if not args.quiet and entry["state"] != "running":
+            print(f"{database}: {entry['state']} {entry['message']}", file=sys.stderr, flush=True)
+
+    batch = BatchExport(
+        runner, args.profile, conn, databases, args.output_dir, concurrency,
+        args.type, FORMATS[args.format], args.compress, args.level, args.jobs,
+        on_update=on_update, throttle=throttle,
+    )
+
+    signal.signal(signal.SIGINT, lambda signum, frame: batch.cancel())
+    signal.signal(signal.SIGTERM, lambda signum, frame: batch.cancel())
+    batch.start()
+    runner.wait()
+
+    print(batch.summary())
+    print(f"Report written to {batch.write_report()}")
+    return 0 if batch.ok() else 1
+
+
+def cmd_copy(args, profiles):
+    source = resolve_connection(args, profiles)
+    if args.to_profile not in profiles:
+        raise SystemExit(f"error: unknown profile '{args.to_profile}'")
+    target = connection_for(args.to_profile, profiles[args.to_profile], database=args.to_database)
+    if not target["database"]:
+        raise SystemExit("error: no target database given and the target profile has none")
+
+    flags = {"type": args.type, "jobs": args.jobs, "target": f"{args.to_profile}/{target['database']}"}
+    outcome = run_job(
+        "Copy",
+        recorded(
+            lambda job: copy_database(job, source, target, args.type, args.jobs, args.parallel),
+            args.profile, source, "copy", "parallel" if args.parallel else "serial", flags,
+        ),
+        args.quiet,
+    )
+    return report("Copy", outcome, f"{args.to_profile}/{target['database']}")
+
+
+def cmd_plan(args, profiles):
+    conn = resolve_connection(args, profiles)
+    outcome = run_job(
+        "Plan",
+        lambda job: plan_export(
+            job, conn, args.output, args.type, selection_from(args), FORMATS.get(args.format), args.compress,
+            args.level, args.jobs
+        ),
+        quiet=True,
+    )
+    if "result" not in outcome:
+        return report("Plan", outcome, args.profile)
+    print(format_plan(outcome["result"]))
+    return 0 if outcome["result"]["fits"] else 1
+
+
+def cmd_benchmark(args, profiles):
+    from benchmark import compare, format_results, run_benchmark
+    only = {name.strip() for name in args.only.split(",") if name.strip()}
+    try:
+        results = run_benchmark(args.size_mb, args.pg_bin, args.jobs, only, args.keep,
+                                on_status=lambda message: print(message, file=sys.stderr, flush=True))
+    except (OSError, RuntimeError) as e:
+        raise SystemExit(f"error: {e}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    print("\n".join(format_results(results)))
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            print("\n".join(compare(json.load(f), results)))
+    return 0 if all(result["ok"] for result in results["results"]) else 1
+
+
+def cmd_verify(args, profiles):
+    conn = resolve_connection(args, profiles) if args.profile else None
+    if not os.path.exists(args.file):
+        raise SystemExit(f"error: no such file: {args.file}")
+
+    outcome = run_job(
+        "Verify", lambda job: verify_backup(job, args.file, conn, args.jobs, args.sample), args.quiet
+    )
+    if "result" not in outcome:
+        return report("Verify", outcome, args.file)
+    print(format_report(outcome["result"]))
+    return 0 if outcome["result"]["ok"] else 1
+
+
+def cmd_history(args, profiles):
+    records = [
+        record for record in load_history()
+        if (not args.profile or record["profile"] == args.profile)
+        and (not args.database or record["database"] == args.database)
+    ]
+    if args.trends:
+        for trend in trends(records):
+            change = f"{trend['seconds_change']:+.0%}" if trend["seconds_change"] is not None else "-"
+            growth = f"{format_bytes(trend['bytes_per_day'])}/day" if trend["bytes_per_day"] else "-"
+            rate = f"{trend['mb_per_second']:.1f} MB/s" if trend["mb_per_second"] else "-"
+            print(
+                f"{trend['database']:<24} {trend['operation']:<7} {trend['mode']:<12} {trend['runs']:>4} runs  "
+                f"last {format_duration(trend['last_seconds']):>9}  {rate:>11}  {change:>6}  {growth}"
+                + ("  SLOWER" if trend["slower"] else "")
+            )
+        return 0
+    for record in records[-args.limit:]:
+        size = format_bytes(record["bytes"]) if record.get("bytes") else "-"
+        print(
+            f"{record['started']}  {record['status']:<9} {record['operation']:<7} {record['mode']:<12} "
+            f"{record['profile'] or '-'}/{record['database']:<20} {format_duration(record['seconds']):>9} {size:>10}"
+        )
+        if record["status"] == "failed" and record["stderr_tail"]:
+            print("    " + record["stderr_tail"].splitlines()[-1])
+    return 0
+
+
+def cmd_repo(args, profiles):
+    if not is_repository(args.path):
+        raise SystemExit(f"error: not a backup repository: {args.path}")
+    if args.action == "prune":
+        removed, deleted, freed = prune(args.path, args.keep_days, args.keep_last)
+        for name in removed:
+            print(f"removed {name}")
+        print(f"{len(removed)} backups removed, {deleted} unused chunks deleted ({format_bytes(freed)} freed)")
+        return 0
+
+    backups = list_backups(args.path)
+    for backup in backups:
+        print(
+            f"{backup['created']}  {backup['database']:<20} {format_bytes(backup['bytes']):>10}  "
+            f"{format_bytes(backup['stored_bytes']):>10} new  {backup['new_chunks']}/{backup['chunk_count']} chunks  "
+            f"{backup['path']}"
+        )
+    logical = sum(backup["bytes"] for backup in backups)
+    stored = stored_bytes(args.path)
+    ratio = f", {logical / stored:.1f}x smaller" if stored else ""
+    print(f"{len(backups)} backups, {format_bytes(logical)} of dumps in {format_bytes(stored)} of chunks{ratio}")
+    return 0
+
+
+def cmd_profiles(args, profiles):
+    store = ProfileStore(args.profiles_file, profiles)
+    matches = set(store.search(args.search, args.group))
+    for group, names in store.groups().items():
+        names = [name for name in names if name in matches]
+        if not names:
+            continue
+        print(f"[{group}]")
+        for name in names:
+            profile = profiles[name]
+            print(f"  {name}\t{profile['username']}@{profile['host']}:{profile['port']}/{profile.get('database', '')}")
+    return 0
+
+
+def cmd_tools(args, profiles):
+    for found in clients(args.refresh):
+        print(f"{found['tool']:<11} {format_version(found['version']):<8} {found['path']}")
+    if not args.profile:
+        return 0
+    conn = resolve_connection(args, profiles, require_database=False)
+    server = server_version(conn, args.refresh)
+    if server is None:
+        raise SystemExit(f"error: could not get the server version of {server_key(conn)}")
+    print(f"{args.profile}: PostgreSQL {format_version(server)} at {server_key(conn)}")
+    for tool in TOOLS:
+        try:
+            print(f"  {tool:<11} {client(tool, conn)}")
+        except RuntimeError as e:
+            print(f"  {tool:<11} error: {e}")
+    return 0
+
+
+COMMANDS = {
+    "benchmark": cmd_benchmark,
+    "copy": cmd_copy,
+    "export": cmd_export,
+    "export-batch": cmd_export_batch,
+    "history": cmd_history,
+    "import": cmd_import,
+    "plan": cmd_plan,
+    "profiles": cmd_profiles,
+    "repo": cmd_repo,
+    "tools": cmd_tools,
+    "verify": cmd_verify,
+}
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    use_profiles_file(args.profiles_file)
+    profiles = load_profiles(args.profiles_file)
+    return COMMANDS[args.command](args, profiles)
@@ -0,0 +1,143 @@
+import gzip
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+# Input is compressed in independent chunks; each becomes its own gzip member /
+# zstd frame / lz4 frame, and concatenated members are still a valid stream.
+CHUNK_SIZE = 4 * 1024 * 1024
+
+CODECS = {
+    "gzip": {"extension": ".gz", "magic": b"\x1f\x8b", "levels": (1, 9), "default": 6},
+    "zstd": {"extension": ".zst", "magic": b"\x28\xb5\x2f\xfd", "levels": (1, 19), "default": 3},
+    "lz4": {"extension": ".lz4", "magic": b"\x04\x22\x4d\x18", "levels": (0, 16), "default": 0},
+}
+
+
+def available_codecs():
+    codecs = ["none", "gzip"]
+    if zstandard is not None:
+        codecs.append("zstd")
+    if lz4 is not None:
+        codecs.append("lz4")
+    return codecs
+
+
+def require_codec(codec):
+    if codec == "zstd" and zstandard is None:
+        raise RuntimeError("zstd support requires the 'zstandard' package (pip install zstandard)")
+    if codec == "lz4" and lz4 is None:
+        raise RuntimeError("lz4 support requires the 'lz4' package (pip install lz4)")
+    if codec not in CODECS:
+        raise ValueError(f"Unknown compression codec: {codec}")
+
+
+def clamp_level(codec, level):
+    low, high = CODECS[codec]["levels"]
+    try:
+        level = int(level)
+    except (TypeError, ValueError):
+        return CODECS[codec]["default"]
+    return min(max(level, low), high)
+
+
+def default_threads():
+    return max(1, os.cpu_count() or 1)
+
+
+def detect_codec(path):
+    with open(path, "rb") as f:
+        header = f.read(4)
+    for codec, info in CODECS.items():
+        if header.startswith(info["magic"]):
+            return codec
+    return None
+
+
+def compress_chunk(codec, level, data):
+    # zlib, zstandard and lz4 all release the GIL, so chunks compress in parallel
+    if codec == "gzip":
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return lz4.frame.compress(data, compression_level=level)
+
+
+def decompress_chunk(codec, data):
+    # Inverse of compress_chunk, for chunks stored one per file
+    if codec == "gzip":
+        return gzip.decompress(data)
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return lz4.frame.decompress(data)
+
+
+def compress_stream(source, target, codec, level=None, threads=None, on_chunk=None):
+    require_codec(codec)
+    level = clamp_level(codec, level)
+    threads = threads or default_threads()
+
+    # Keep a bounded number of chunks in flight so memory stays at
+    # roughly 2 * threads * CHUNK_SIZE regardless of the dump size
+    pending = deque()
+    total_in = 0
+    total_out = 0
+
+    def write_oldest():
+        nonlocal total_out
+        data = pending.popleft().result()
+        target.write(data)
+        total_out += len(data)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            total_in += len(chunk)
+            pending.append(pool.submit(compress_chunk, codec, level, chunk))
+            if len(pending) >= 2 * threads:
+                write_oldest()
+            if on_chunk:
+                on_chunk(total_in, total_out)
+
+        while pending:
+            write_oldest()
+
+    return total_in, total_out
+
+
+def open_decompressed(source, codec):
+    # Wraps a binary file object, yielding the uncompressed stream
+    require_codec(codec)
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=source, mode="rb")
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().stream_reader(source, read_across_frames=True)
+    return lz4.frame.open(source, "rb")
+
+
+def copy_stream(source, target, on_chunk=None):
+    total = 0
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        target.write(chunk)
+        total += len(chunk)
+        if on_chunk:
+            on_chunk(total)
+    return total
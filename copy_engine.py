@@ -0,0 +1,414 @@
+import json
+import math
+import os
+import subprocess
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+
+from compression import CODECS, compress_stream, copy_stream, open_decompressed
+from core import connection_args, pg_env, psql_command, query, resolve_jobs
+from progress import Meter, MeteredReader
+from selection import includes, includes_data, selection_args
+from throttle import ThrottledReader
+from toolchain import client
+
+
+MANIFEST_FILE = "manifest.json"
+PRE_DATA_FILE = "pre-data.sql"
+POST_DATA_FILE = "post-data.sql"
+SEQUENCES_FILE = "sequences.sql"
+LARGE_OBJECTS_FILE = "large-objects.sql"
+DATA_DIR = "data"
+
+# Tables larger than this are split into primary-key ranges of about this size
+SPLIT_BYTES = 1024 * 1024 * 1024
+
+# Plain tables only: partitioned parents hold no rows, their partitions are listed individually
+TABLES_SQL = """
+SELECT n.nspname, c.relname, pg_table_size(c.oid), greatest(c.reltuples, 0)::bigint,
+       coalesce((
+           SELECT a.attname FROM pg_index i
+           JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+           WHERE i.indrelid = c.oid AND i.indisprimary AND i.indnatts = 1
+             AND a.atttypid IN ('int2'::regtype, 'int4'::regtype, 'int8'::regtype)
+       ), '')
+FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind = 'r' AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+  AND n.nspname NOT LIKE 'pg_toast%' AND n.nspname NOT LIKE 'pg_temp%'
+ORDER BY pg_table_size(c.oid) DESC;
+"""
+
+
+# Sequences with the table that owns them (serial and identity columns), if any
+SEQUENCES_SQL = """
+SELECT n.nspname, c.relname, coalesce(tn.nspname, ''), coalesce(t.relname, '')
+FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_depend d ON d.classid = 'pg_class'::regclass AND d.objid = c.oid
+  AND d.refclassid = 'pg_class'::regclass AND d.deptype IN ('a', 'i')
+LEFT JOIN pg_class t ON t.oid = d.refobjid
+LEFT JOIN pg_namespace tn ON tn.oid = t.relnamespace
+WHERE c.relkind = 'S' AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+  AND n.nspname NOT LIKE 'pg_toast%' AND n.nspname NOT LIKE 'pg_temp%'
+  AND NOT EXISTS (
+      SELECT 1 FROM pg_depend e WHERE e.classid = 'pg_class'::regclass AND e.objid = c.oid AND e.deptype = 'e'
+  )
+ORDER BY 1, 2;
+"""
+
+
+def quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def qualified_name(schema, table):
+    return f"{quote_ident(schema)}.{quote_ident(table)}"
+
+
+def list_tables(job, conn):
+    tables = []
+    for schema, name, size, rows, pk in query(job, conn, TABLES_SQL):
+        tables.append({
+            "schema": schema,
+            "name": name,
+            "bytes": int(size),
+            "rows": int(rows),
+            "pk": pk or None,
+        })
+    return tables
+
+
+def plan_units(job, conn, tables, split_bytes=SPLIT_BYTES):
+    # One COPY per table, or per primary-key range for big tables with an integer key
+    units = []
+    for number, table in enumerate(tables):
+        parts = math.ceil(table["bytes"] / split_bytes) if split_bytes else 1
+        ranges = None
+        if parts > 1 and table["pk"]:
+            pk = quote_ident(table["pk"])
+            row = query(
+                job, conn,
+                f"SELECT min({pk}), max({pk}) FROM {qualified_name(table['schema'], table['name'])};"
+            )[0]
+            if row[0] and row[1]:
+                low, high = int(row[0]), int(row[1])
+                step = max(1, math.ceil((high - low + 1) / parts))
+                ranges = [(start, min(start + step, high + 1)) for start in range(low, high + 1, step)]
+
+        # Numbered, since "a.b"."c" and "a"."b.c" would otherwise share a file name
+        base = f"{number:04d}.{table['schema']}.{table['name']}".replace(os.sep, "_")
+        if not ranges:
+            units.append({"table": table, "file": base, "where": None, "bytes": table["bytes"]})
+            continue
+        # Bounds come from live data, not the export snapshot, so the first and
+        # last ranges are left open to catch rows outside them
+        pk = quote_ident(table["pk"])
+        for index, (start, end) in enumerate(ranges):
+            conditions = []
+            if index > 0:
+                conditions.append(f"{pk} >= {start}")
+            if index < len(ranges) - 1:
+                conditions.append(f"{pk} < {end}")
+            units.append({
+                "table": table,
+                "file": f"{base}.part{index:04d}",
+                "where": " AND ".join(conditions) or None,
+                "bytes": table["bytes"] // len(ranges),
+            })
+    return units
+
+
+@contextmanager
+def exported_snapshot(job, conn):
+    # Workers are separate sessions; like pg_dump -j, they all attach to one
+    # exported snapshot so the per-table files form a consistent dump
+    process = job.popen(
+        psql_command(conn, "-X", "-q", "-t", "-A", "-v", "ON_ERROR_STOP=1"),
+        env=pg_env(conn), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    process.stdin.write("BEGIN ISOLATION LEVEL REPEATABLE READ, READ ONLY;\nSELECT pg_export_snapshot();\n")
+    process.stdin.flush()
+    snapshot = process.stdout.readline().strip()
+    if not snapshot:
+        process.stdin.close()
+        process.wait()
+        job.check_cancelled()
+        raise subprocess.CalledProcessError(process.returncode, process.args, stderr=process.stderr.read())
+    try:
+        yield snapshot
+    finally:
+        try:
+            process.stdin.write("COMMIT;\n")
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        process.wait()
+
+
+def copy_out_commands(unit, snapshot):
+    # Separate -c options run in one session, each as its own statement
+    return [
+        "-c", "BEGIN ISOLATION LEVEL REPEATABLE READ, READ ONLY",
+        "-c", f"SET TRANSACTION SNAPSHOT '{snapshot}'",
+        "-c", copy_out_sql(unit),
+        "-c", "COMMIT",
+    ]
+
+
+def snapshot_query(job, conn, snapshot, sql):
+    # query() on a session of its own that sees the exported snapshot; the SQL
+    # goes in on stdin, so it can be long
+    result = job.run(
+        psql_command(conn, "-X", "-q", "-t", "-A", "-v", "ON_ERROR_STOP=1"),
+        input=f"BEGIN ISOLATION LEVEL REPEATABLE READ, READ ONLY;\nSET TRANSACTION SNAPSHOT '{snapshot}';\n"
+              f"{sql}\nCOMMIT;\n",
+        env=pg_env(conn), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    return [line.split("|") for line in result.stdout.splitlines() if line.strip()]
+
+
+def sequence_statements(job, conn, snapshot, selection=None):
+    # pg_dump's SEQUENCE SET entries, which per-table COPY leaves out: one setval
+    # per sequence in the selection or owned by a table in it. Looked up through
+    # to_regclass, so a sequence the target doesn't have is skipped.
+    sequences = [
+        (schema, name) for schema, name, owner_schema, owner in snapshot_query(job, conn, snapshot, SEQUENCES_SQL)
+        if includes(selection, schema, name) or (owner and includes(selection, owner_schema, owner))
+    ]
+    if not sequences:
+        return []
+    rows = snapshot_query(job, conn, snapshot, " UNION ALL ".join(
+        f"SELECT {index}, last_value, is_called FROM {qualified_name(schema, name)}"
+        for index, (schema, name) in enumerate(sequences)
+    ) + " ORDER BY 1;")
+    statements = []
+    for (schema, name), (_, value, called) in zip(sequences, rows):
+        literal = "'" + qualified_name(schema, name).replace("'", "''") + "'"
+        called = "true" if called == "t" else "false"
+        statements.append(f"SELECT pg_catalog.setval(pg_catalog.to_regclass({literal}), {value}, {called});")
+    return statements
+
+
+def large_objects_command(job, conn, snapshot, selection=None):
+    # pg_dump's data section without any table or sequence data, i.e. just the
+    # large objects' contents (pre-data creates them). pg_dump leaves large
+    # objects out of -n/-t selections, and so does this; None when there are none.
+    if selection and (selection.get("schemas") or selection.get("tables")):
+        return None
+    if snapshot_query(job, conn, snapshot, "SELECT EXISTS (SELECT 1 FROM pg_largeobject_metadata);")[0][0] != "t":
+        return None
+    return [client("pg_dump", conn)] + connection_args(conn) + selection_args(selection) + [
+        "--section", "data", "--exclude-table-data", "*.*", "--snapshot", snapshot
+    ]
+
+
+def copy_out_sql(unit):
+    table = unit["table"]
+    name = qualified_name(table["schema"], table["name"])
+    if unit["where"]:
+        return f"COPY (SELECT * FROM {name} WHERE {unit['where']}) TO STDOUT"
+    return f"COPY {name} TO STDOUT"
+
+
+def dump_section(job, conn, section, path, snapshot, selection=None):
+    with open(path, "wb") as f:
+        job.run(
+            [client("pg_dump", conn)] + connection_args(conn) + selection_args(selection)
+            + ["--section", section, "--snapshot", snapshot],
+            env=pg_env(conn), stdout=f, stderr=subprocess.PIPE
+        )
+
+
+def dump_sequences_and_large_objects(job, conn, output_dir, snapshot, selection=None):
+    # Manifest entries for the files written, None where there was nothing to write
+    job.status("Dumping sequence values and large objects...")
+    entries = {"sequences": None, "large_objects": None}
+    statements = sequence_statements(job, conn, snapshot, selection)
+    if statements:
+        with open(os.path.join(output_dir, SEQUENCES_FILE), "w") as f:
+            f.write("\n".join(statements) + "\n")
+        entries["sequences"] = SEQUENCES_FILE
+    command = large_objects_command(job, conn, snapshot, selection)
+    if command:
+        with open(os.path.join(output_dir, LARGE_OBJECTS_FILE), "wb") as f:
+            job.run(command, env=pg_env(conn), stdout=f, stderr=subprocess.PIPE)
+        entries["large_objects"] = LARGE_OBJECTS_FILE
+    return entries
+
+
+def run_parallel(jobs, calls, workers=None):
+    # Runs (function, args) pairs on a thread pool. The first failure cancels
+    # everything not yet started, cancels workers (the child job the calls run
+    # under) so running processes are terminated, and is re-raised.
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(function, *args) for function, args in calls]
+        try:
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            failed = [future for future in futures if future in done and future.exception() is not None]
+            if failed:
+                raise failed[0].exception()
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            if workers is not None:
+                workers.cancel()
+            raise
+
+
+def export_unit(job, conn, unit, path, codec, meter, snapshot, throttle=None):
+    process = job.start(
+        psql_command(conn, "-X", "-q", "-v", "ON_ERROR_STOP=1", *copy_out_commands(unit, snapshot)),
+        env=pg_env(conn), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE
+    )
+    source = MeteredReader(process.stdout, meter)
+    if throttle is not None:
+        # One throttle for all workers: the cap covers the whole export
+        source = ThrottledReader(source, throttle)
+    with open(path, "wb") as f:
+        if codec == "none":
+            size = copy_stream(source, f)
+        else:
+            # Each worker compresses its own stream, so one thread per file is enough
+            size = compress_stream(source, f, codec, threads=1)[0]
+    job.finish(process)
+    meter.add_statements(1)
+    return size
+
+
+def export_tables(job, conn, output_dir, export_type="full", codec="none", jobs=None,
+                  split_bytes=SPLIT_BYTES, include=None, extra=None, selection=None, throttle=None):
+    # include: optional set of "schema.table" names whose data is dumped;
+    # extra: additional manifest fields; selection: schemas/tables as in selection.py;
+    # throttle: a running throttle.Throttle
+    jobs = resolve_jobs(jobs)
+    os.makedirs(os.path.join(output_dir, DATA_DIR), exist_ok=True)
+
+    manifest = {
+        "version": 1,
+        "database": conn["database"],
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "codec": codec,
+        "pre_data": None,
+        "post_data": None,
+        "sequences": None,
+        "large_objects": None,
+        "tables": [],
+    }
+    manifest.update(extra or {})
+
+    meter = Meter(f"Exporting tables ({jobs} jobs)", 0, job.progress)
+    if throttle is not None:
+        throttle.meter = meter
+    with exported_snapshot(job, conn) as snapshot:
+        # Schema is split around the data so imports can build indexes after loading
+        if export_type != "data":
+            job.status("Dumping schema...")
+            dump_section(job, conn, "pre-data", os.path.join(output_dir, PRE_DATA_FILE), snapshot, selection)
+            dump_section(job, conn, "post-data", os.path.join(output_dir, POST_DATA_FILE), snapshot, selection)
+            manifest["pre_data"] = PRE_DATA_FILE
+            manifest["post_data"] = POST_DATA_FILE
+
+        if export_type != "schema":
+            job.status("Planning table export...")
+            tables = list_tables(job, conn)
+            if include is not None:
+                tables = [table for table in tables if f"{table['schema']}.{table['name']}" in include]
+            tables = [table for table in tables if includes_data(selection, table["schema"], table["name"])]
+            units = plan_units(job, conn, tables, split_bytes)
+            meter.total = sum(unit["bytes"] for unit in units)
+            extension = ".copy" + (CODECS[codec]["extension"] if codec != "none" else "")
+
+            entries = {}
+            for table in tables:
+                entry = {"schema": table["schema"], "name": table["name"], "rows": table["rows"], "files": []}
+                entries[(table["schema"], table["name"])] = entry
+                manifest["tables"].append(entry)
+
+            # Tables come largest first, so the long tail is as short as possible
+            paths = [os.path.join(DATA_DIR, unit["file"] + extension) for unit in units]
+            workers = job.child()
+            sizes = run_parallel(jobs, [
+                (export_unit, (workers, conn, unit, os.path.join(output_dir, relative), codec, meter, snapshot,
+                               throttle))
+                for unit, relative in zip(units, paths)
+            ], workers)
+            for unit, relative, size in zip(units, paths, sizes):
+                table = unit["table"]
+                entries[(table["schema"], table["name"])]["files"].append(
+                    {"path": relative, "bytes": size, "where": unit["where"]}
+                )
+            # Every export has all of them, also an incremental one: they're small
+            # and this way the newest export always holds the current values
+            manifest.update(dump_sequences_and_large_objects(job, conn, output_dir, snapshot, selection))
+
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=4)
+    return meter
+
+
+def load_manifest(path):
+    with open(os.path.join(path, MANIFEST_FILE), "r") as f:
+        return json.load(f)
+
+
+def run_sql_file(job, conn, path):
+    with open(path, "rb") as f:
+        job.run(
+            psql_command(conn, "-X", "-q", "-v", "ON_ERROR_STOP=1"),
+            env=pg_env(conn), stdin=f, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+
+
+def import_unit(job, conn, schema, name, path, codec, meter):
+    process = job.start(
+        psql_command(conn, "-X", "-q", "-c", f"COPY {qualified_name(schema, name)} FROM STDIN"),
+        env=pg_env(conn), stdin=subprocess.PIPE, stdout=subprocess.DEVNULL
+    )
+    try:
+        with open(path, "rb") as raw:
+            source = MeteredReader(raw, meter)
+            if codec != "none":
+                source = open_decompressed(source, codec)
+            copy_stream(source, process.stdin)
+        process.stdin.close()
+    except BrokenPipeError:
+        pass
+    job.finish(process)
+    meter.add_statements(1)
+
+
+def import_tables(job, conn, input_dir, jobs=None, manifest=None):
+    # manifest may be passed pre-resolved (e.g. an incremental chain with absolute paths)
+    jobs = resolve_jobs(jobs)
+    if manifest is None:
+        manifest = load_manifest(input_dir)
+    codec = manifest.get("codec", "none")
+
+    if manifest.get("pre_data"):
+        job.status("Creating tables...")
+        run_sql_file(job, conn, os.path.join(input_dir, manifest["pre_data"]))
+
+    files = [
+        (table["schema"], table["name"], os.path.join(input_dir, entry["path"]), entry.get("codec", codec))
+        for table in manifest["tables"]
+        for entry in table["files"]
+    ]
+    meter = Meter(f"Loading tables ({jobs} jobs)", sum(os.path.getsize(f[2]) for f in files), job.progress)
+    workers = job.child()
+    run_parallel(jobs, [
+        (import_unit, (workers, conn, schema, name, path, file_codec, meter))
+        for schema, name, path, file_codec in files
+    ], workers)
+
+    # Sequence values and large objects from the data section, then indexes,
+    # constraints and triggers once the data is in
+    if manifest.get("sequences") or manifest.get("large_objects"):
+        job.status("Restoring sequence values and large objects...")
+    for key in ("sequences", "large_objects"):
+        if manifest.get(key):
+            run_sql_file(job, conn, os.path.join(input_dir, manifest[key]))
+    if manifest.get("post_data"):
+        job.status("Creating indexes and constraints...")
+        run_sql_file(job, conn, os.path.join(input_dir, manifest["post_data"]))
+    return meter
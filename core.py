@@ -0,0 +1,513 @@
+import os
+import re
+import shutil
+import subprocess
+from datetime import datetime
+
+from compression import (
+    CODECS, clamp_level, compress_stream, copy_stream, detect_codec, open_decompressed
+)
+import sessions
+from progress import MB, Meter, MeteredReader, format_bytes, format_duration
+
+
+# pg_dump -v reports each table it dumps on stderr
+DUMP_TABLE_RE = re.compile(r'dumping contents of table "?([^"]+?)"?$')
+
+# pg_restore -v reports each TOC entry (table data, index, constraint) it starts
+RESTORE_ITEM_RE = re.compile(r'(?:processing|launching) item \d+ (.+)$')
+
+# Error lines of pg_dump/pg_restore: "pg_restore: error: ..." (12+) or
+# "pg_restore: [archiver (db)] ..." (older clients). Lines without the tool
+# prefix right after one (DETAIL, "Command was: ...") belong to that error.
+TOOL_ERROR_RE = re.compile(r"^pg_(?:dump|dumpall|restore): (?:error:|\[archiver)")
+TOOL_LINE_RE = re.compile(r"^pg_(?:dump|dumpall|restore): ")
+
+EXPORT_TYPES = ["full", "schema", "data"]
+ARCHIVE_FORMATS = ["plain", "directory", "copy", "incremental", "repository"]
+TRANSACTION_MODES = ["none", "batches", "single"]
+
+# application_name of every connection we open, so load sampling can leave them out
+APPLICATION_NAME = "pg_import_export"
+
+USER_TABLES_SQL = (
+    "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+    "WHERE c.relkind IN ('r', 'm') AND n.nspname NOT IN ('pg_catalog', 'information_schema') "
+    "AND n.nspname NOT LIKE 'pg_toast%'"
+)
+
+
+def default_jobs():
+    return max(1, os.cpu_count() or 1)
+
+
+def resolve_jobs(value):
+    # "auto" (or anything unparsable) means one worker per CPU core
+    try:
+        jobs = int(value)
+    except (TypeError, ValueError):
+        return default_jobs()
+    return max(1, jobs)
+
+
+def detect_archive_format(path):
+    # Directory archives are identified by their table of contents file,
+    # per-table COPY exports by their manifest
+    if os.path.isdir(path):
+        if os.path.exists(os.path.join(path, "toc.dat")):
+            return "directory"
+        if os.path.exists(os.path.join(path, "manifest.json")):
+            return "copy"
+        return None
+
+    with open(path, "rb") as f:
+        header = f.read(512)
+
+    if header.startswith(b"PGDMP"):
+        return "custom"
+    if header[257:262] == b"ustar":
+        return "tar"
+    return "plain"
+
+
+def inspect_import_file(filename):
+    # Returns (path, codec, archive_format); directory exports may be given by their
+    # toc.dat / manifest.json / parts.json
+    from parts import PARTS_MANIFEST, is_split, read_manifest
+    from repository import is_backup
+    if is_backup(filename):
+        # A plain SQL dump in a backup repository, chunks are decompressed as they're read
+        return filename, None, "plain"
+    if os.path.basename(filename) in ("toc.dat", "manifest.json", PARTS_MANIFEST):
+        filename = os.path.dirname(filename)
+    if is_split(filename):
+        # A plain SQL dump split into parts
+        codec = read_manifest(filename)["codec"]
+        return filename, codec if codec != "none" else None, "plain"
+    codec = detect_codec(filename) if os.path.isfile(filename) else None
+    archive_format = "plain" if codec else detect_archive_format(filename)
+    if archive_format is None:
+        raise ValueError(f"Not a dump file or directory archive: {filename}")
+    return filename, codec, archive_format
+
+
+def open_dump(filename, check_first=True):
+    # (binary reader, size) for a plain dump file, a split export or a repository backup.
+    # check_first: verify each part of a split export before streaming it (see PartReader).
+    from parts import PartReader, is_split, total_bytes
+    from repository import BackupReader, backup_bytes, is_backup
+    if is_split(filename):
+        return PartReader(filename, check_first), total_bytes(filename)
+    if is_backup(filename):
+        return BackupReader(filename), backup_bytes(filename)
+    return open(filename, "rb"), os.path.getsize(filename)
+
+
+def pg_env(conn):
+    # Without a password the client tools fall back to ~/.pgpass / PGPASSWORD
+    env = os.environ.copy()
+    env.setdefault("PGAPPNAME", APPLICATION_NAME)
+    if conn.get("password"):
+        env["PGPASSWORD"] = conn["password"]
+    if conn.get("options"):
+        # Session settings (-c name=value ...) for every connection the tools open
+        env["PGOPTIONS"] = (env.get("PGOPTIONS", "") + " " + conn["options"]).strip()
+    return env
+
+
+def connection_args(conn, database=None):
+    return [
+        "-h", conn["host"],
+        "-p", str(conn["port"]),
+        "-U", conn["username"],
+        "-d", database or conn["database"],
+    ]
+
+
+def psql_command(conn, *args, database=None):
+    from toolchain import client
+    return [client("psql", conn)] + connection_args(conn, database) + list(args)
+
+
+def dump_command(conn, export_type="full", archive_format="plain", jobs=1, output=None,
+                 codec="none", level=None, selection=None):
+    from selection import selection_args
+    from toolchain import client
+    cmd = [client("pg_dump", conn)] + connection_args(conn) + selection_args(selection)
+
+    if export_type == "schema":
+        cmd.append("--schema-only")
+    elif export_type == "data":
+        cmd.append("--data-only")
+
+    if archive_format == "directory":
+        # pg_dump -Fd writes one file per table, which lets -j dump tables in parallel
+        cmd += ["-Fd", "-j", str(jobs), "-v", "-f", output]
+
+        # Directory archives compress each table file inside pg_dump itself
+        if codec == "gzip":
+            cmd += ["-Z", str(clamp_level(codec, level))]
+        elif codec != "none":
+            # pg_dump 16+ accepts zstd/lz4 with a level
+            cmd += ["-Z", f"{codec}:{clamp_level(codec, level)}"]
+
+    return cmd
+
+
+def restore_command(conn, filename, jobs=1, single_transaction=False, list_file=None):
+    from toolchain import client
+    if single_transaction:
+        # All or nothing; pg_restore can't combine this with -j
+        options = ["--single-transaction", "--exit-on-error"]
+    else:
+        options = ["-j", str(jobs)]
+    if list_file:
+        # Only the TOC entries listed in the file are restored
+        options += ["-L", list_file]
+    return [client("pg_restore", conn)] + connection_args(conn) + options + ["-v", filename]
+
+
+def error_text(e):
+    stderr = getattr(e, "stderr", None)
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode(errors="replace")
+    return (stderr or str(e)).strip()
+
+
+def remove_partial(path):
+    # Don't leave a truncated dump behind after a failed or cancelled export
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def query(job, conn, sql, database=None, timeout=sessions.QUERY_TIMEOUT):
+    # Runs a catalog query on a pooled psql session, so repeated lookups skip
+    # the connect/auth handshake; returns rows as lists of strings
+    lines = sessions.query(job, psql_command(conn, database=database), pg_env(conn), sql, timeout)
+    return [line.split("|") for line in lines if line.strip()]
+
+
+def server_version(job, conn):
+    return query(job, conn, "SELECT version();")[0][0]
+
+
+def list_databases(job, conn):
+    rows = query(
+        job, conn,
+        "SELECT datname FROM pg_database WHERE datistemplate = false ORDER BY datname;",
+        database="postgres"
+    )
+    return [row[0].strip() for row in rows]
+
+
+def list_database_sizes(job, conn):
+    # (name, bytes) pairs; the size is None where we lack CONNECT, as pg_database_size would fail
+    rows = query(
+        job, conn,
+        "SELECT datname, CASE WHEN has_database_privilege(datname, 'CONNECT') "
+        "THEN pg_database_size(datname) END "
+        "FROM pg_database WHERE datistemplate = false ORDER BY datname;",
+        database="postgres"
+    )
+    return [(name.strip(), int(size) if size else None) for name, size in rows]
+
+
+def run_verbose(job, cmd, env, on_line):
+    # Stream stderr of a -v run line by line, keeping errors for the report
+    process = job.popen(cmd, env=env, stderr=subprocess.PIPE, text=True, bufsize=1)
+
+    errors = []
+    in_error = False
+    for line in process.stderr:
+        line = line.rstrip()
+        if TOOL_ERROR_RE.match(line) or (in_error and not TOOL_LINE_RE.match(line)):
+            errors.append(line)
+            in_error = True
+        else:
+            in_error = False
+            on_line(line)
+
+    if process.wait() != 0:
+        job.check_cancelled()
+        raise subprocess.CalledProcessError(process.returncode, cmd, stderr="\n".join(errors))
+
+
+def count_tables(job, conn):
+    # Only used for the progress display, so failures are not fatal
+    try:
+        return int(query(job, conn, f"SELECT count(*) {USER_TABLES_SQL};")[0][0])
+    except (subprocess.CalledProcessError, ValueError, IndexError):
+        return 0
+
+
+def estimate_dump_size(job, conn, export_type):
+    # Heap + TOAST size of user tables approximates the dump size (indexes are
+    # dumped as DDL only); falls back to pg_database_size. 0 means unknown.
+    if export_type == "schema":
+        return 0
+    try:
+        rows = query(
+            job, conn,
+            "SELECT coalesce(sum(pg_total_relation_size(c.oid) - pg_indexes_size(c.oid)), 0), "
+            f"pg_database_size(current_database()) {USER_TABLES_SQL};"
+        )
+        tables, database = (int(value) for value in rows[0])
+        return tables or database
+    except (subprocess.CalledProcessError, ValueError, IndexError):
+        return 0
+
+
+def count_archive_items(job, conn, filename):
+    # Number of TOC entries pg_restore will process, for a determinate progress bar
+    from toolchain import client
+    try:
+        result = job.run(
+            [client("pg_restore"), "-l", filename],
+            env=pg_env(conn), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        )
+    except subprocess.CalledProcessError:
+        return 0
+    return sum(1 for line in result.stdout.splitlines() if line.strip() and not line.startswith(";"))
+
+
+def summarize(meter):
+    return (
+        f"{format_bytes(meter.bytes)} in {format_duration(meter.elapsed())} "
+        f"({meter.rate() / MB:.1f} MB/s, {meter.statements} statements)"
+    )
+
+
+def export_sql(job, conn, cmd, filename, codec, level, threads, total, split_bytes=None, throttle=None,
+               output=None):
+    # Meter pg_dump's raw output; with a codec it then goes through the
+    # chunked compressor, never materialising the uncompressed dump on disk.
+    # With split_bytes the output is a directory of checksummed parts, with
+    # a throttle pg_dump is read no faster than it allows. output may be a
+    # prepared file-like target instead (a repository backup).
+    meter = Meter("Exporting database", total, job.progress)
+    process = job.start(cmd, env=pg_env(conn), stdout=subprocess.PIPE)
+    source = MeteredReader(process.stdout, meter, count_statements=True)
+    if throttle is not None:
+        from throttle import ThrottledReader
+        source = ThrottledReader(source, throttle)
+        throttle.meter = meter
+    if output is None and split_bytes:
+        from parts import PartWriter
+        output = PartWriter(filename, codec, split_bytes)
+    elif output is None:
+        output = open(filename, "wb")
+    with output as f:
+        if codec == "none":
+            copy_stream(source, f)
+        else:
+            compress_stream(source, f, codec, level, threads)
+    job.finish(process)
+    return meter
+
+
+def export_directory(job, conn, cmd, jobs):
+    total_tables = count_tables(job, conn)
+
+    # Report each table as a worker picks it up
+    done = 0
+
+    def on_line(line):
+        nonlocal done
+        match = DUMP_TABLE_RE.search(line)
+        if match:
+            done += 1
+            if total_tables:
+                progress = f"{min(done, total_tables)}/{total_tables}"
+                fraction = min(done / total_tables, 0.99)
+            else:
+                progress = str(done)
+                fraction = None
+            job.progress(fraction, f"Dumping table {progress} ({jobs} jobs): {match.group(1)}")
+
+    run_verbose(job, cmd, pg_env(conn), on_line)
+
+
+def export_database(job, conn, filename, export_type="full", archive_format="plain",
+                    codec="none", level=None, jobs=None, selection=None, split_bytes=None, throttle=None):
+    # Returns the Meter for plain and per-table exports, None for directory archives.
+    # throttle: settings as in throttle.py, for dumps against busy primaries.
+    from selection import describe, is_empty
+    from throttle import Throttle, is_throttled
+    if archive_format == "incremental" and not is_empty(selection):
+        raise ValueError("Incremental exports always cover the whole database")
+    if split_bytes and archive_format != "plain":
+        raise ValueError("Only plain SQL exports can be split into parts")
+    if archive_format == "directory" and is_throttled(throttle):
+        raise ValueError("Directory archives are written by pg_dump itself and can't be throttled")
+    jobs = resolve_jobs(jobs)
+    cmd = dump_command(conn, export_type, archive_format, jobs, filename, codec, level, selection)
+    limiter = Throttle(job, conn, throttle) if is_throttled(throttle) else None
+    try:
+        if limiter is not None:
+            limiter.start()
+        if archive_format == "copy" and not is_empty(selection):
+            # A partial export can't be the base of an incremental chain, so no fingerprints
+            from copy_engine import export_tables
+            return export_tables(job, conn, filename, export_type, codec, jobs, selection=selection,
+                                 throttle=limiter)
+        if archive_format == "copy":
+            from incremental import export_tracked
+            return export_tracked(job, conn, filename, export_type, codec, jobs, throttle=limiter)
+        if archive_format == "incremental":
+            from incremental import export_incremental
+            return export_incremental(job, conn, filename, codec, jobs, throttle=limiter)
+        if archive_format == "directory":
+            export_directory(job, conn, cmd, jobs)
+            return None
+        total = estimate_dump_size(job, conn, export_type)
+        if archive_format == "repository":
+            # Stored uncompressed-then-chunked: compressing the stream first would defeat deduplication
+            from repository import BackupWriter, backup_name, open_repository
+            open_repository(filename, codec, level)
+            info = {"database": conn["database"], "host": f"{conn['host']}:{conn['port']}",
+                    "export_type": export_type, "selection": describe(selection)}
+            writer = BackupWriter(filename, backup_name(filename, conn["database"]), info, jobs)
+            return export_sql(job, conn, cmd, filename, "none", None, jobs, total, throttle=limiter, output=writer)
+        return export_sql(job, conn, cmd, filename, codec, level, jobs, total, split_bytes, limiter)
+    except BaseException:
+        # A repository holds other backups; an unfinished one leaves only reusable chunks
+        if archive_format != "repository":
+            remove_partial(filename)
+        raise
+    finally:
+        if limiter is not None:
+            limiter.stop()
+
+
+def import_sql(job, conn, filename, codec=None, single_transaction=False):
+    # Stream the file (decompressing on the fly if needed) into psql's stdin;
+    # progress is measured on the bytes read from disk against the file size.
+    # Split export parts and repository chunks are checked against their SHA-256s before
+    # they reach psql; an import that stops at a damaged one has loaded what came before
+    # (all or nothing only with single_transaction).
+    raw, size = open_dump(filename)
+    meter = Meter("Importing database", size, job.progress)
+    options = ["--single-transaction", "-v", "ON_ERROR_STOP=1"] if single_transaction else []
+    try:
+        process = job.start(
+            psql_command(conn, *options),
+            env=pg_env(conn),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+        )
+    except BaseException:
+        raw.close()
+        raise
+    try:
+        with raw:
+            source = MeteredReader(raw, meter, count_statements=codec is None)
+            if codec:
+                source = MeteredReader(
+                    open_decompressed(source, codec), meter, count_bytes=False, count_statements=True
+                )
+            copy_stream(source, process.stdin)
+        process.stdin.close()
+    except BrokenPipeError:
+        # psql exited early; its stderr explains why
+        pass
+    except BaseException:
+        # A damaged part or chunk: stop psql before it runs the statement cut off mid-way
+        process.kill()
+        process.wait()
+        raise
+    job.finish(process)
+    return meter
+
+
+def restore_archive(job, conn, filename, jobs, single_transaction=False, selection=None):
+    from selection import is_empty, write_restore_list
+    list_file = None
+    if is_empty(selection):
+        total_items = count_archive_items(job, conn, filename)
+    else:
+        job.status("Selecting archive entries...")
+        list_file, total_items = write_restore_list(job, conn, filename, selection)
+    done = 0
+
+    # Table data, index builds and FK validation are scheduled across the workers
+    def on_line(line):
+        nonlocal done
+        match = RESTORE_ITEM_RE.search(line)
+        if match:
+            done += 1
+            fraction = min(done / total_items, 0.99) if total_items else None
+            job.progress(fraction, f"Restoring ({jobs} jobs): {match.group(1)}")
+
+    try:
+        run_verbose(
+            job, restore_command(conn, filename, jobs, single_transaction, list_file), pg_env(conn), on_line
+        )
+    finally:
+        if list_file:
+            os.remove(list_file)
+
+
+def restore_jobs(archive_format, jobs):
+    # pg_restore can only parallelise custom and directory archives; per-table loads always can
+    return resolve_jobs(jobs) if archive_format != "tar" else 1
+
+
+def import_database(job, conn, filename, codec, archive_format, jobs=None, bulk=False,
+                    transaction="none", resume=False, batch_size=None, selection=None):
+    # Returns the Meter for SQL and per-table imports, None for archive restores.
+    # transaction: "none" (psql's autocommit), "batches" (resumable, plain SQL only)
+    # or "single" (all or nothing)
+    if transaction not in TRANSACTION_MODES:
+        raise ValueError(f"Unknown transaction mode: {transaction}")
+    from repository import is_backup
+    if transaction == "batches" and (archive_format != "plain" or os.path.isdir(filename) or is_backup(filename)):
+        raise ValueError("Resumable imports need a plain SQL file (not split into parts or in a repository)")
+    if transaction == "single" and archive_format == "copy":
+        raise ValueError("Per-table exports load tables in parallel and can't run in a single transaction")
+    from selection import is_empty
+    if not is_empty(selection) and archive_format in ("plain", "copy"):
+        raise ValueError("Restoring selected objects needs a custom, directory or tar archive")
+    if bulk:
+        from bulkload import bulk_load
+        return bulk_load(
+            job, conn, resolve_jobs(jobs),
+            lambda load_conn: import_database(
+                job, load_conn, filename, codec, archive_format, jobs,
+                transaction=transaction, resume=resume, batch_size=batch_size, selection=selection
+            )
+        )
+    if archive_format == "plain":
+        if transaction == "batches":
+            from resumable import BATCH_STATEMENTS, import_batches
+            return import_batches(job, conn, filename, codec, batch_size or BATCH_STATEMENTS, resume=resume)
+        return import_sql(job, conn, filename, codec, transaction == "single")
+    if archive_format == "copy":
+        # Full per-table exports and incremental chains both resolve to one manifest
+        from incremental import import_chain
+        return import_chain(job, conn, filename, resolve_jobs(jobs))
+    restore_archive(
+        job, conn, filename, restore_jobs(archive_format, jobs), transaction == "single", selection
+    )
+    return None
+
+
+def plain_extension(codec="none"):
+    # ".sql" plus the codec's suffix, e.g. ".sql.gz"
+    return ".sql" + (CODECS[codec]["extension"] if codec != "none" else "")
+
+
+def default_output_name(profile_name, database, archive_format="plain", codec="none", split=False):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    name = f"{profile_name}_{database}_{timestamp}"
+    if archive_format == "directory":
+        return name + ".dir"
+    if archive_format == "copy":
+        return name + ".tables"
+    if archive_format == "incremental":
+        return name + ".incr.tables"
+    if archive_format == "repository":
+        # One repository per profile, so successive backups share their chunks
+        return f"{profile_name}.repo"
+    return name + plain_extension(codec) + (".parts" if split else "")
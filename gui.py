@@ -0,0 +1,1643 @@
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+import subprocess
+import os
+import re
+import time
+from tkinter import ttk, StringVar, simpledialog
+
+from batch import DEFAULT_CONCURRENCY, BatchExport
+from compression import CODECS, available_codecs
+from core import (
+    TRANSACTION_MODES, default_jobs, default_output_name, error_text, export_database,
+    import_database, inspect_import_file, list_database_sizes, plain_extension, resolve_jobs, restore_jobs,
+    server_version, summarize
+)
+from history import history_path, load_history, recorded, trend_key, trends
+from jobs import JobRunner
+from parts import parse_size
+from planner import format_plan, plan_export, try_plan
+from progress import format_bytes, format_duration
+from resumable import load_checkpoint
+from selection import describe, empty_selection, is_empty, list_objects, toc_objects
+from throttle import DEFAULT_BUSY_SESSIONS, DEFAULT_MAX_LAG_MB, is_throttled
+from profiles import (
+    KEYRING_SERVICE, PROFILES_FILE, ProfileStore, connection_for, delete_saved_password,
+    get_saved_password, set_saved_password
+)
+from transfer import copy_database
+from verify import format_report, verify_backup
+
+
+# How often the Tk loop drains job events
+JOB_POLL_MS = 100
+
+# Group filter entry that shows every profile
+ALL_GROUPS = "All groups"
+
+# Database lists per server login are reused for this long (seconds) unless refreshed
+DATABASE_CACHE_TTL = 300
+_database_cache = {}
+
+
+class DatabaseSelectDialog:
+    # Only VISIBLE_ROWS tree items exist; scrolling and filtering rewrite their
+    # values, so clusters with thousands of databases open as fast as small ones
+    VISIBLE_ROWS = 15
+
+    def __init__(self, parent, connection_info, jobs, multiple=False):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Select Databases" if multiple else "Select Database")
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+        self.dialog.protocol("WM_DELETE_WINDOW", self.on_cancel)
+        
+        self.connection_info = connection_info
+        self.jobs = jobs
+        self.job = None
+        self.multiple = multiple
+        self.selected_db = None
+        self.selected_dbs = []
+        self.databases = []
+        self.filtered = []
+        self.chosen = set()
+        self.anchor = None
+        self.offset = 0
+        self.loaded = None
+        
+        # Create UI elements
+        self.title_var = tk.StringVar(value="Loading databases...")
+        ttk.Label(self.dialog, textvariable=self.title_var).pack(pady=5)
+
+        filter_frame = ttk.Frame(self.dialog)
+        filter_frame.pack(fill=tk.X, padx=5)
+        ttk.Label(filter_frame, text="Filter:").pack(side=tk.LEFT)
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add("write", lambda *args: self.apply_filter())
+        filter_entry = ttk.Entry(filter_frame, textvariable=self.filter_var)
+        filter_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        filter_entry.focus_set()
+        
+        # Create tree with scrollbar
+        frame = ttk.Frame(self.dialog)
+        frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        self.tree = ttk.Treeview(
+            frame, columns=("name", "size"), show="headings", height=self.VISIBLE_ROWS, selectmode="none"
+        )
+        self.tree.heading("name", text="Database")
+        self.tree.heading("size", text="Size")
+        self.tree.column("name", width=220)
+        self.tree.column("size", width=90, anchor=tk.E)
+        self.tree.tag_configure("chosen", background="#cce4ff")
+        self.rows = [self.tree.insert("", tk.END, values=("", "")) for _ in range(self.VISIBLE_ROWS)]
+        self.scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.on_scroll)
+        
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree.bind("<Button-1>", self.on_click)
+        self.tree.bind("<Double-Button-1>", lambda event: self.on_select())
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll_to(self.offset - event.delta // 120 * 3))
+        self.tree.bind("<Button-4>", lambda event: self.scroll_to(self.offset - 3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_to(self.offset + 3))
+        self.dialog.bind("<Return>", lambda event: self.on_select())
+        self.dialog.bind("<Escape>", lambda event: self.on_cancel())
+        
+        # Buttons
+        btn_frame = ttk.Frame(self.dialog)
+        btn_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        ttk.Button(btn_frame, text="Select", command=self.on_select).pack(side=tk.LEFT, padx=5)
+        if multiple:
+            ttk.Button(btn_frame, text="Select All", command=self.select_all).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Cancel", command=self.on_cancel).pack(side=tk.RIGHT, padx=5)
+        self.refresh_button = ttk.Button(
+            btn_frame, text="Refresh", command=lambda: self.load_databases(refresh=True)
+        )
+        self.refresh_button.pack(side=tk.RIGHT, padx=5)
+        
+        # Load databases
+        self.load_databases()
+        
+        # Center dialog
+        self.dialog.update_idletasks()
+        width = self.dialog.winfo_width()
+        height = self.dialog.winfo_height()
+        x = (self.dialog.winfo_screenwidth() // 2) - (width // 2)
+        y = (self.dialog.winfo_screenheight() // 2) - (height // 2)
+        self.dialog.geometry(f'{width}x{height}+{x}+{y}')
+
+    def cache_key(self):
+        conn = self.connection_info
+        return (conn["host"], str(conn["port"]), conn["username"])
+        
+    def load_databases(self, refresh=False):
+        cached = _database_cache.get(self.cache_key())
+        if cached and not refresh and time.monotonic() - cached[0] < DATABASE_CACHE_TTL:
+            self.on_loaded(cached[1], cached[0])
+            return
+
+        conn = self.connection_info
+        self.title_var.set("Loading databases...")
+        self.refresh_button.state(["disabled"])
+        self.job = self.jobs.submit(
+            "Load databases",
+            lambda job: list_database_sizes(job, conn),
+            on_done=self.on_loaded,
+            on_error=self.on_load_error,
+        )
+
+    def on_loaded(self, databases, loaded=None):
+        if not self.dialog.winfo_exists():
+            return
+        if loaded is None:
+            loaded = time.monotonic()
+            _database_cache[self.cache_key()] = (loaded, databases)
+        self.job = None
+        self.refresh_button.state(["!disabled"])
+        self.databases = databases
+        self.loaded = loaded
+        self.apply_filter()
+
+    def on_load_error(self, e):
+        if not self.dialog.winfo_exists():
+            return
+        messagebox.showerror("Error", f"Failed to fetch databases:\n{error_text(e)}")
+        self.dialog.destroy()
+
+    def apply_filter(self):
+        text = self.filter_var.get().strip().lower()
+        self.filtered = [row for row in self.databases if text in row[0].lower()]
+        self.anchor = None
+        age = format_duration(time.monotonic() - self.loaded) if self.databases else None
+        shown = f"{len(self.filtered)} of {len(self.databases)}" if text else f"{len(self.databases)}"
+        self.title_var.set(f"Available Databases: {shown}" + (f" (loaded {age} ago)" if age else ""))
+        self.scroll_to(0)
+
+    def scroll_to(self, offset):
+        self.offset = max(0, min(offset, len(self.filtered) - self.VISIBLE_ROWS))
+        self.render()
+
+    def on_scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * len(self.filtered)))
+        elif unit == "pages":
+            self.scroll_to(self.offset + int(amount) * (self.VISIBLE_ROWS - 1))
+        else:
+            self.scroll_to(self.offset + int(amount))
+
+    def render(self):
+        for index, item in enumerate(self.rows):
+            position = self.offset + index
+            if position < len(self.filtered):
+                name, size = self.filtered[position]
+                self.tree.item(
+                    item,
+                    values=(name, format_bytes(size) if size is not None else "-"),
+                    tags=("chosen",) if name in self.chosen else (),
+                )
+            else:
+                self.tree.item(item, values=("", ""), tags=())
+        total = max(len(self.filtered), 1)
+        self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.VISIBLE_ROWS) / total))
+
+    def on_click(self, event):
+        item = self.tree.identify_row(event.y)
+        if not item:
+            return
+        position = self.offset + self.rows.index(item)
+        if position >= len(self.filtered):
+            return
+        name = self.filtered[position][0]
+        # Ctrl toggles and Shift extends, like an extended-selection listbox
+        if self.multiple and event.state & 0x0004:
+            self.chosen.symmetric_difference_update({name})
+        elif self.multiple and event.state & 0x0001 and self.anchor is not None:
+            low, high = sorted((self.anchor, position))
+            self.chosen.update(row[0] for row in self.filtered[low:high + 1])
+        else:
+            self.chosen = {name}
+        if not event.state & 0x0001:
+            self.anchor = position
+        self.render()
+
+    def select_all(self):
+        self.chosen.update(row[0] for row in self.filtered)
+        self.render()
+            
+    def on_select(self):
+        if self.chosen:
+            self.selected_dbs = [name for name, size in self.databases if name in self.chosen]
+            self.selected_db = self.selected_dbs[0]
+            self.dialog.destroy()
+            
+    def on_cancel(self):
+        if self.job is not None:
+            self.job.cancel()
+        self.dialog.destroy()
+
+
+class CopyToProfileDialog:
+    def __init__(self, parent, profiles, source_name):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Copy to Profile")
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+        self.dialog.resizable(False, False)
+
+        self.profiles = profiles
+        self.target = None
+        self.database = None
+        self.parallel = False
+
+        names = [name for name in profiles if name != source_name]
+        frame = ttk.Frame(self.dialog, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        ttk.Label(frame, text="Target profile:").grid(row=0, column=0, sticky="w")
+        self.target_var = tk.StringVar(value=names[0] if names else "")
+        target_combo = ttk.Combobox(frame, textvariable=self.target_var, values=names, state="readonly")
+        target_combo.grid(row=0, column=1, padx=5, pady=2, sticky="ew")
+        target_combo.bind("<<ComboboxSelected>>", lambda e: self.on_target_selected())
+
+        ttk.Label(frame, text="Target database:").grid(row=1, column=0, sticky="w")
+        self.database_var = tk.StringVar()
+        ttk.Entry(frame, textvariable=self.database_var).grid(row=1, column=1, padx=5, pady=2, sticky="ew")
+
+        self.parallel_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            frame, text="Parallel per-table streams", variable=self.parallel_var
+        ).grid(row=2, column=0, columnspan=2, sticky="w", pady=5)
+
+        btn_frame = ttk.Frame(frame)
+        btn_frame.grid(row=3, column=0, columnspan=2, pady=5)
+        ttk.Button(btn_frame, text="Copy", command=self.on_ok).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Cancel", command=self.dialog.destroy).pack(side=tk.LEFT, padx=5)
+
+        self.on_target_selected()
+
+    def on_target_selected(self):
+        profile = self.profiles.get(self.target_var.get(), {})
+        self.database_var.set(profile.get("database", ""))
+
+    def on_ok(self):
+        if not self.target_var.get() or not self.database_var.get().strip():
+            messagebox.showerror("Error", "Choose a target profile and database", parent=self.dialog)
+            return
+        self.target = self.target_var.get()
+        self.database = self.database_var.get().strip()
+        self.parallel = self.parallel_var.get()
+        self.dialog.destroy()
+
+
+class ObjectPickerDialog:
+    # Schemas and their tables with estimated rows and sizes; each can be
+    # included, excluded or exported without data (see selection.py)
+    MODES = {
+        "schemas": "include", "tables": "include", "exclude_schemas": "exclude",
+        "exclude_tables": "exclude", "exclude_data": "no data",
+    }
+
+    def __init__(self, parent, connection_info, jobs, selection=None):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Select Objects")
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+        self.dialog.protocol("WM_DELETE_WINDOW", self.on_cancel)
+
+        self.connection_info = connection_info
+        self.jobs = jobs
+        self.job = None
+        # Edited on a copy, so Cancel leaves the caller's selection alone
+        self.selection = empty_selection()
+        for key, values in (selection or {}).items():
+            self.selection[key] = [list(entry) if isinstance(entry, (list, tuple)) else entry for entry in values]
+        self.result = None
+        self.items = {}
+
+        self.title_var = tk.StringVar(value="Loading objects...")
+        ttk.Label(self.dialog, textvariable=self.title_var).pack(pady=5)
+        self.summary_var = tk.StringVar(value=describe(self.selection))
+        ttk.Label(self.dialog, textvariable=self.summary_var).pack()
+
+        frame = ttk.Frame(self.dialog)
+        frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.tree = ttk.Treeview(frame, columns=("rows", "size", "mode"), height=15, selectmode="extended")
+        self.tree.heading("#0", text="Schema / Table")
+        self.tree.heading("rows", text="Rows (est.)")
+        self.tree.heading("size", text="Size")
+        self.tree.heading("mode", text="Export")
+        self.tree.column("#0", width=260)
+        self.tree.column("rows", width=90, anchor=tk.E)
+        self.tree.column("size", width=80, anchor=tk.E)
+        self.tree.column("mode", width=70)
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        mode_frame = ttk.Frame(self.dialog)
+        mode_frame.pack(fill=tk.X, padx=5)
+        ttk.Button(mode_frame, text="Include", command=lambda: self.set_mode("include")).pack(side=tk.LEFT, padx=2)
+        ttk.Button(mode_frame, text="Exclude", command=lambda: self.set_mode("exclude")).pack(side=tk.LEFT, padx=2)
+        ttk.Button(
+            mode_frame, text="Definition Only", command=lambda: self.set_mode("no data")
+        ).pack(side=tk.LEFT, padx=2)
+        ttk.Button(mode_frame, text="Clear", command=lambda: self.set_mode(None)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(mode_frame, text="From Archive...", command=self.load_archive).pack(side=tk.RIGHT, padx=2)
+
+        btn_frame = ttk.Frame(self.dialog)
+        btn_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Button(btn_frame, text="OK", command=self.on_ok).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="All Objects", command=self.on_reset).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Cancel", command=self.on_cancel).pack(side=tk.RIGHT, padx=5)
+        self.dialog.bind("<Escape>", lambda event: self.on_cancel())
+
+        self.load(lambda job: list_objects(job, dict(connection_info)), "Load objects")
+
+    def load(self, target, name):
+        self.title_var.set("Loading objects...")
+        self.job = self.jobs.submit(name, target, on_done=self.on_loaded, on_error=self.on_load_error)
+
+    def load_archive(self):
+        filename = filedialog.askopenfilename(
+            parent=self.dialog,
+            filetypes=[("Archives", "*.dump *.backup *.tar"), ("Directory archive", "toc.dat"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        if os.path.basename(filename) == "toc.dat":
+            filename = os.path.dirname(filename)
+        conn = dict(self.connection_info)
+        self.load(lambda job: toc_objects(job, conn, filename), "Read archive")
+
+    def on_loaded(self, objects):
+        if not self.dialog.winfo_exists():
+            return
+        self.job = None
+        self.tree.delete(*self.tree.get_children())
+        self.items = {}
+        schemas = {}
+        for schema, table, rows, size in objects:
+            if schema not in schemas:
+                schemas[schema] = self.tree.insert("", tk.END, text=schema, values=("", "", ""), open=False)
+                self.items[schemas[schema]] = (schema, None)
+            item = self.tree.insert(schemas[schema], tk.END, text=table, values=(
+                f"{rows:,}" if rows is not None else "-", format_bytes(size) if size is not None else "-", ""
+            ))
+            self.items[item] = (schema, table)
+        total = sum(size or 0 for _, _, _, size in objects)
+        self.title_var.set(f"{len(objects)} tables in {len(schemas)} schemas" + (
+            f", {format_bytes(total)}" if total else ""
+        ))
+        self.render()
+
+    def on_load_error(self, e):
+        if not self.dialog.winfo_exists():
+            return
+        self.job = None
+        self.title_var.set("Could not load objects")
+        messagebox.showerror("Error", f"Failed to list objects:\n{error_text(e)}", parent=self.dialog)
+
+    def mode(self, schema, table):
+        entry = schema if table is None else [schema, table]
+        for key in ["exclude_schemas", "exclude_tables", "exclude_data", "schemas", "tables"]:
+            if entry in self.selection[key]:
+                return self.MODES[key]
+        return ""
+
+    def render(self):
+        for item, (schema, table) in self.items.items():
+            values = list(self.tree.item(item, "values"))
+            values[2] = self.mode(schema, table)
+            self.tree.item(item, values=values)
+        self.summary_var.set(describe(self.selection))
+
+    def set_mode(self, mode):
+        for item in self.tree.selection():
+            schema, table = self.items[item]
+            if table is None and mode == "no data":
+                # A whole schema without data: every table in it as definition only
+                targets = [self.items[child] for child in self.tree.get_children(item)]
+            else:
+                targets = [(schema, table)]
+            for schema, table in targets:
+                entry = schema if table is None else [schema, table]
+                for values in self.selection.values():
+                    if entry in values:
+                        values.remove(entry)
+                if mode == "include":
+                    self.selection["schemas" if table is None else "tables"].append(entry)
+                elif mode == "exclude":
+                    self.selection["exclude_schemas" if table is None else "exclude_tables"].append(entry)
+                elif mode == "no data":
+                    self.selection["exclude_data"].append(entry)
+        self.render()
+
+    def on_reset(self):
+        self.selection = empty_selection()
+        self.render()
+
+    def on_ok(self):
+        self.result = self.selection
+        self.on_cancel()
+
+    def on_cancel(self):
+        if self.job is not None:
+            self.job.cancel()
+        self.dialog.destroy()
+
+
+class PostgresGUI:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("PostgreSQL Import/Export Tool")
+        self.root.minsize(600, 700)
+
+        # Create style
+        self.style = ttk.Style()
+        self.style.configure('TButton', padding=5)
+        self.style.configure('TLabelframe', padding=10)
+        
+        # Status bar
+        self.status_var = StringVar()
+        self.progress_var = StringVar()
+        
+        # Main container
+        main_container = ttk.Frame(self.root, padding="10")
+        main_container.grid(row=0, column=0, sticky="nsew")
+        
+        # Configure grid
+        self.root.columnconfigure(0, weight=1)
+        self.root.rowconfigure(0, weight=1)
+        main_container.columnconfigure(0, weight=1)
+
+        # Load profiles
+        self.profiles_file = PROFILES_FILE
+        self.store = ProfileStore(self.profiles_file)
+        self.profiles = self.store.profiles
+        self.current_profile = None
+        self.keyring_service = KEYRING_SERVICE
+        # Profile whose saved password hasn't been fetched from the keyring yet
+        self.pending_password = None
+
+        # Background jobs (dumps, restores, catalog queries)
+        self.jobs = JobRunner()
+        self.progress_active = False
+
+        # Create frames
+        self.create_profile_frame(main_container)
+        self.create_connection_frame(main_container)
+        self.create_action_frame(main_container)
+        self.create_status_bar(main_container)
+
+        # The window is shown first; the first profile and the tooltips follow
+        self.root.after_idle(self.finish_startup)
+
+        self.root.after(JOB_POLL_MS, self.poll_jobs)
+
+    def finish_startup(self):
+        # If profiles exist, load the first one
+        if self.profiles:
+            first_profile = next(iter(self.profiles))
+            self.profile_var.set(first_profile)
+            self.load_profile(first_profile)
+
+        # Add tooltips
+        self.create_tooltips()
+
+    def save_profiles(self):
+        self.store.save()
+        self.refresh_profile_list()
+
+    def create_profile_frame(self, parent):
+        profile_frame = ttk.LabelFrame(
+            parent, text="Connection Profiles", padding="10"
+        )
+        profile_frame.grid(row=0, column=0, padx=10, pady=5, sticky="nsew")
+
+        # Group filter: an explicit "group" in the profile, or else its host
+        ttk.Label(profile_frame, text="Group:").grid(row=0, column=0, sticky="w")
+        self.group_var = tk.StringVar(value=ALL_GROUPS)
+        self.group_combo = ttk.Combobox(profile_frame, textvariable=self.group_var, state="readonly")
+        self.group_combo.grid(row=0, column=1, padx=5, pady=2, sticky="ew")
+        self.group_combo.bind("<<ComboboxSelected>>", lambda e: self.refresh_profile_list())
+
+        # Profile selection; typing narrows the list to matching profiles
+        ttk.Label(profile_frame, text="Profile:").grid(row=1, column=0, sticky="w")
+        self.profile_var = tk.StringVar()
+        self.profile_combo = ttk.Combobox(profile_frame, textvariable=self.profile_var)
+        self.profile_combo.grid(row=1, column=1, padx=5, pady=2, sticky="ew")
+        self.profile_combo.bind(
+            "<<ComboboxSelected>>", lambda e: self.load_profile(self.profile_var.get())
+        )
+        self.profile_combo.bind("<KeyRelease>", self.on_profile_typed)
+        self.profile_combo.bind("<Return>", lambda e: self.load_profile(self.profile_var.get()))
+        self.refresh_profile_list()
+
+        # Profile management buttons
+        btn_frame = ttk.Frame(profile_frame)
+        btn_frame.grid(row=2, column=0, columnspan=2, pady=5)
+
+        ttk.Button(btn_frame, text="New Profile", command=self.new_profile).pack(
+            side=tk.LEFT, padx=2
+        )
+        ttk.Button(btn_frame, text="Save Profile", command=self.save_profile).pack(
+            side=tk.LEFT, padx=2
+        )
+        ttk.Button(btn_frame, text="Delete Profile", command=self.delete_profile).pack(
+            side=tk.LEFT, padx=2
+        )
+        ttk.Button(btn_frame, text="History...", command=lambda: HistoryWindow(self.root)).pack(
+            side=tk.LEFT, padx=2
+        )
+
+        profile_frame.columnconfigure(1, weight=1)
+
+    def refresh_profile_list(self, text=""):
+        groups = self.store.groups()
+        self.group_combo["values"] = [ALL_GROUPS] + list(groups)
+        if self.group_var.get() not in groups:
+            self.group_var.set(ALL_GROUPS)
+        group = self.group_var.get()
+        self.profile_combo["values"] = self.store.search(text, None if group == ALL_GROUPS else group)
+
+    def on_profile_typed(self, event):
+        if event.keysym in ("Return", "Up", "Down", "Escape", "Tab"):
+            return
+        self.refresh_profile_list(self.profile_var.get())
+
+    def create_connection_frame(self, parent):
+        connection_frame = ttk.LabelFrame(
+            parent, text="Database Connection", padding="10"
+        )
+        connection_frame.grid(row=1, column=0, padx=10, pady=5, sticky="nsew")
+
+        # Connection details
+        labels = ["Host:", "Port:", "Username:", "Password:", "Database:"]
+        self.connection_entries = {}
+
+        for i, label in enumerate(labels):
+            ttk.Label(connection_frame, text=label).grid(row=i, column=0, sticky="w")
+            entry = ttk.Entry(connection_frame)
+            if label == "Password:":
+                entry.configure(show="*")
+            entry.grid(row=i, column=1, padx=5, pady=2, sticky="ew")
+            self.connection_entries[label.lower().rstrip(":")] = entry
+            
+            # Add database selection button
+            if label == "Database:":
+                ttk.Button(
+                    connection_frame,
+                    text="Select...",
+                    command=self.select_database
+                ).grid(row=i, column=2, padx=5, pady=2)
+
+        # A profile's saved password is fetched when the field is first used
+        self.connection_entries["password"].bind("<FocusIn>", lambda e: self.fill_saved_password())
+
+        # Add "Save Password" checkbox
+        self.save_password_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            connection_frame,
+            text="Save Password",
+            variable=self.save_password_var
+        ).grid(row=len(labels), column=0, columnspan=2, sticky="w")
+
+        # Test connection button
+        ttk.Button(
+            connection_frame, text="Test Connection", command=self.test_connection
+        ).grid(row=len(labels)+1, column=0, columnspan=3, pady=10)
+
+        connection_frame.columnconfigure(1, weight=1)
+
+    def create_action_frame(self, parent):
+        action_frame = ttk.LabelFrame(parent, text="Actions", padding="10")
+        action_frame.grid(row=2, column=0, padx=10, pady=5, sticky="nsew")
+
+        # Export section
+        ttk.Label(action_frame, text="Export Options:").grid(
+            row=0, column=0, columnspan=2, sticky="w", pady=5
+        )
+
+        self.export_type = tk.StringVar(value="full")
+        ttk.Radiobutton(
+            action_frame, text="Full Backup", variable=self.export_type, value="full"
+        ).grid(row=1, column=0, sticky="w")
+        ttk.Radiobutton(
+            action_frame, text="Schema Only", variable=self.export_type, value="schema"
+        ).grid(row=1, column=1, sticky="w")
+        ttk.Radiobutton(
+            action_frame, text="Data Only", variable=self.export_type, value="data"
+        ).grid(row=1, column=2, sticky="w")
+        ttk.Radiobutton(
+            action_frame, text="Parallel (Directory)", variable=self.export_type, value="directory"
+        ).grid(row=2, column=0, sticky="w")
+        ttk.Radiobutton(
+            action_frame, text="Parallel COPY (Tables)", variable=self.export_type, value="copy"
+        ).grid(row=2, column=1, sticky="w")
+        ttk.Radiobutton(
+            action_frame, text="Incremental (Changed Tables)", variable=self.export_type, value="incremental"
+        ).grid(row=2, column=2, sticky="w")
+
+        ttk.Radiobutton(
+            action_frame, text="Deduplicated (Repository)", variable=self.export_type, value="repository"
+        ).grid(row=3, column=0, sticky="w")
+
+        # Parallel jobs ("auto" = one per CPU core)
+        ttk.Label(action_frame, text="Parallel Jobs:").grid(row=4, column=0, sticky="w")
+        self.jobs_var = tk.StringVar(value="auto")
+        ttk.Spinbox(
+            action_frame,
+            textvariable=self.jobs_var,
+            values=("auto",) + tuple(str(n) for n in range(1, 4 * default_jobs() + 1)),
+            width=6
+        ).grid(row=4, column=1, sticky="w")
+
+        # Compression codec and level
+        ttk.Label(action_frame, text="Compression:").grid(row=5, column=0, sticky="w")
+        self.compression_var = tk.StringVar(value="none")
+        compression_combo = ttk.Combobox(
+            action_frame,
+            textvariable=self.compression_var,
+            values=available_codecs(),
+            state="readonly",
+            width=8
+        )
+        compression_combo.grid(row=5, column=1, sticky="w")
+        compression_combo.bind("<<ComboboxSelected>>", lambda e: self.on_codec_selected())
+
+        self.compression_level_var = tk.StringVar(value="")
+        self.compression_level_spin = ttk.Spinbox(
+            action_frame, textvariable=self.compression_level_var, from_=0, to=0, width=6
+        )
+        self.compression_level_spin.grid(row=5, column=2, sticky="w", padx=5)
+        self.compression_level_spin.state(["disabled"])
+
+        # Plain SQL exports can be written as a directory of fixed-size, checksummed parts
+        ttk.Label(action_frame, text="Split into parts:").grid(row=6, column=0, sticky="w")
+        self.split_var = tk.StringVar(value="off")
+        ttk.Combobox(
+            action_frame, textvariable=self.split_var, values=("off", "256M", "1G", "4G"), width=8
+        ).grid(row=6, column=1, sticky="w")
+
+        # Throttling for dumps against busy primaries: a MB/s cap and/or backing off under load
+        ttk.Label(action_frame, text="Max MB/s:").grid(row=7, column=0, sticky="w")
+        self.max_rate_var = tk.StringVar(value="off")
+        ttk.Combobox(
+            action_frame, textvariable=self.max_rate_var, values=("off", "10", "25", "50", "100"), width=8
+        ).grid(row=7, column=1, sticky="w")
+        self.back_off_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            action_frame, text="Back off when the server is busy", variable=self.back_off_var
+        ).grid(row=7, column=2, sticky="w")
+
+        # Schemas/tables to export, or to restore from an archive
+        ttk.Label(action_frame, text="Objects:").grid(row=8, column=0, sticky="w")
+        self.selection = empty_selection()
+        self.selection_var = tk.StringVar(value=describe(self.selection))
+        ttk.Label(action_frame, textvariable=self.selection_var).grid(row=8, column=1, sticky="w")
+        ttk.Button(
+            action_frame, text="Select Objects...", command=self.select_objects
+        ).grid(row=8, column=2, sticky="w")
+
+        export_btn_frame = ttk.Frame(action_frame)
+        export_btn_frame.grid(row=9, column=0, columnspan=3, pady=10)
+        ttk.Button(
+            export_btn_frame, text="Plan Export...", command=self.plan_export
+        ).pack(side=tk.LEFT, padx=2)
+        ttk.Button(
+            export_btn_frame, text="Export Database", command=self.export_database
+        ).pack(side=tk.LEFT, padx=2)
+        ttk.Button(
+            export_btn_frame, text="Batch Export...", command=self.batch_export
+        ).pack(side=tk.LEFT, padx=2)
+        ttk.Button(
+            export_btn_frame, text="Copy to Profile...", command=self.copy_to_profile
+        ).pack(side=tk.LEFT, padx=2)
+
+        # Import section
+        ttk.Label(action_frame, text="Import Options:").grid(
+            row=10, column=0, columnspan=2, sticky="w", pady=5
+        )
+        self.bulk_load_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            action_frame, text="Bulk load (defer indexes and foreign keys)", variable=self.bulk_load_var
+        ).grid(row=11, column=0, columnspan=3, sticky="w")
+
+        # none = psql autocommit, batches = resumable commits (plain SQL), single = all or nothing
+        ttk.Label(action_frame, text="Transaction:").grid(row=12, column=0, sticky="w")
+        self.transaction_var = tk.StringVar(value="none")
+        ttk.Combobox(
+            action_frame,
+            textvariable=self.transaction_var,
+            values=TRANSACTION_MODES,
+            state="readonly",
+            width=8
+        ).grid(row=12, column=1, sticky="w")
+
+        import_btn_frame = ttk.Frame(action_frame)
+        import_btn_frame.grid(row=13, column=0, columnspan=3, pady=10)
+        ttk.Button(
+            import_btn_frame, text="Import Database", command=self.import_database
+        ).pack(side=tk.LEFT, padx=2)
+        ttk.Button(
+            import_btn_frame, text="Verify Backup...", command=self.verify_backup
+        ).pack(side=tk.LEFT, padx=2)
+
+    def on_codec_selected(self):
+        codec = self.compression_var.get()
+        if codec == "none":
+            self.compression_level_var.set("")
+            self.compression_level_spin.state(["disabled"])
+            return
+        low, high = CODECS[codec]["levels"]
+        self.compression_level_spin.configure(from_=low, to=high)
+        self.compression_level_var.set(str(CODECS[codec]["default"]))
+        self.compression_level_spin.state(["!disabled"])
+
+    def create_status_bar(self, parent):
+        status_frame = ttk.Frame(parent)
+        status_frame.grid(row=100, column=0, sticky="ew", pady=(10,0))
+        
+        self.progress_bar = ttk.Progressbar(status_frame, mode='indeterminate')
+        self.progress_bar.grid(row=0, column=0, sticky="ew", padx=(0,10))
+        
+        status_label = ttk.Label(status_frame, textvariable=self.status_var)
+        status_label.grid(row=0, column=1, sticky="w")
+
+        self.jobs_label_var = StringVar()
+        ttk.Label(status_frame, textvariable=self.jobs_label_var).grid(row=0, column=2, sticky="e", padx=5)
+
+        self.cancel_button = ttk.Button(status_frame, text="Cancel", command=self.cancel_jobs)
+        self.cancel_button.grid(row=0, column=3, sticky="e")
+        self.cancel_button.state(["disabled"])
+        
+        status_frame.columnconfigure(0, weight=1)
+        self.status_var.set("Ready")
+
+    def create_tooltips(self):
+        self.add_tooltip(self.connection_entries['host'], "Database server hostname or IP address")
+        self.add_tooltip(self.connection_entries['port'], "PostgreSQL server port (default: 5432)")
+        self.add_tooltip(self.connection_entries['username'], "Database user name")
+        self.add_tooltip(self.connection_entries['database'], "Name of the database to connect to")
+
+    def add_tooltip(self, widget, text):
+        def show_tooltip(event):
+            tooltip = tk.Toplevel()
+            tooltip.wm_overrideredirect(True)
+            tooltip.wm_geometry(f"+{event.x_root+10}+{event.y_root+10}")
+            
+            label = ttk.Label(tooltip, text=text, background="#ffffe0", relief="solid", borderwidth=1)
+            label.pack()
+            
+            def hide_tooltip():
+                tooltip.destroy()
+            
+            widget.tooltip = tooltip
+            widget.bind('<Leave>', lambda e: hide_tooltip())
+            
+        widget.bind('<Enter>', show_tooltip)
+
+    def new_profile(self):
+        name = tk.simpledialog.askstring("New Profile", "Enter profile name:")
+        if name:
+            if name in self.profiles:
+                messagebox.showerror("Error", "Profile name already exists!")
+                return
+
+            self.profiles[name] = {
+                "host": "localhost",
+                "port": "5432",
+                "username": "postgres",
+                "database": "",
+            }
+            self.save_profiles()
+            self.profile_var.set(name)
+            self.load_profile(name)
+
+    def save_profile(self):
+        name = self.profile_var.get()
+        if not name:
+            messagebox.showerror("Error", "Please select or create a profile first!")
+            return
+
+        # Keys the form doesn't show (group, batch concurrency) are kept
+        profile_data = dict(self.profiles.get(name, {}))
+        profile_data.update({
+            "host": self.connection_entries["host"].get(),
+            "port": self.connection_entries["port"].get(),
+            "username": self.connection_entries["username"].get(),
+            "database": self.connection_entries["database"].get(),
+            "has_saved_password": False
+        })
+
+        # Save password if checkbox is checked
+        if self.save_password_var.get():
+            self.fill_saved_password()
+            password = self.connection_entries["password"].get()
+            if password:
+                set_saved_password(name, profile_data["username"], password)
+                profile_data["has_saved_password"] = True
+
+        self.profiles[name] = profile_data
+        self.save_profiles()
+        messagebox.showinfo("Success", f"Profile '{name}' saved successfully!")
+
+    def load_profile(self, name):
+        if name not in self.profiles:
+            return
+
+        profile = self.profiles[name]
+        self.connection_entries["host"].delete(0, tk.END)
+        self.connection_entries["host"].insert(0, profile["host"])
+
+        self.connection_entries["port"].delete(0, tk.END)
+        self.connection_entries["port"].insert(0, profile["port"])
+
+        self.connection_entries["username"].delete(0, tk.END)
+        self.connection_entries["username"].insert(0, profile["username"])
+
+        self.connection_entries["database"].delete(0, tk.END)
+        self.connection_entries["database"].insert(0, profile["database"])
+
+        # Clear password entry
+        self.connection_entries["password"].delete(0, tk.END)
+
+        # A saved password is only fetched from the keyring when it's needed
+        self.pending_password = name if profile.get("has_saved_password", False) else None
+        self.save_password_var.set(self.pending_password is not None)
+
+    def fill_saved_password(self):
+        name, self.pending_password = self.pending_password, None
+        if name is None or name not in self.profiles or self.connection_entries["password"].get():
+            return
+        saved_password = get_saved_password(name, self.profiles[name])
+        if saved_password:
+            self.connection_entries["password"].insert(0, saved_password)
+
+    def delete_profile(self):
+        name = self.profile_var.get()
+        if not name:
+            messagebox.showerror("Error", "Please select a profile to delete!")
+            return
+
+        if messagebox.askyesno(
+            "Confirm Delete", f"Are you sure you want to delete profile '{name}'?"
+        ):
+            # Delete saved password if it exists
+            delete_saved_password(name, self.profiles[name])
+
+            # Delete profile and update UI
+            del self.profiles[name]
+            self.save_profiles()
+            self.pending_password = None
+            if self.profiles:
+                first_profile = next(iter(self.profiles))
+                self.profile_var.set(first_profile)
+                self.load_profile(first_profile)
+            else:
+                self.profile_var.set("")
+                for entry in self.connection_entries.values():
+                    entry.delete(0, tk.END)
+                self.save_password_var.set(False)
+
+    def validate_port(self, value):
+        if not value:
+            return True
+        return value.isdigit() and 1 <= int(value) <= 65535
+
+    def validate_connection(self):
+        try:
+            # Validate host
+            host = self.connection_entries["host"].get().strip()
+            if not host:
+                raise ValueError("Host cannot be empty")
+
+            # Validate port
+            port = self.connection_entries["port"].get().strip()
+            if not port or not self.validate_port(port):
+                raise ValueError("Port must be a number between 1 and 65535")
+
+            # Validate username
+            username = self.connection_entries["username"].get().strip()
+            if not username:
+                raise ValueError("Username cannot be empty")
+
+            # Validate password
+            password = self.connection_entries["password"].get()
+            if not password:
+                raise ValueError("Password cannot be empty")
+
+            # Validate database name
+            database = self.connection_entries["database"].get().strip()
+            if not database:
+                raise ValueError("Database name cannot be empty")
+            if not re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', database):
+                raise ValueError("Invalid database name format")
+
+            return True
+        except ValueError as e:
+            messagebox.showerror("Validation Error", str(e))
+            return False
+
+    def test_connection(self):
+        if not self.validate_connection():
+            return
+
+        conn = self.connection_info()
+
+        def on_done(version):
+            self.status_var.set("Connection successful")
+            messagebox.showinfo("Success", "Connection successful!\n" + version)
+
+        def on_error(e):
+            self.status_var.set("Connection failed")
+            if not isinstance(e, subprocess.CalledProcessError):
+                messagebox.showerror("Error", f"Unexpected error:\n{str(e)}")
+                return
+            error_msg = error_text(e)
+            if "password authentication failed" in error_msg.lower():
+                messagebox.showerror("Authentication Error", "Invalid username or password")
+            elif "could not connect to server" in error_msg.lower():
+                messagebox.showerror("Connection Error", "Could not connect to the database server.\nPlease check the host and port.")
+            else:
+                messagebox.showerror("Error", f"Connection failed:\n{error_msg}")
+
+        self.status_var.set("Testing connection...")
+        self.start_job("Connection test", lambda job: server_version(job, conn), on_done, on_error=on_error)
+
+    def export_database(self):
+        if not self.validate_connection():
+            return
+
+        export_type, archive_format = self.export_mode()
+        codec = self.compression_var.get()
+        try:
+            split_bytes = parse_size(self.split_var.get()) if self.split_var.get() not in ("", "off") else None
+        except ValueError:
+            messagebox.showerror("Error", f"Invalid part size: {self.split_var.get()}")
+            return
+        if split_bytes and archive_format != "plain":
+            messagebox.showerror("Error", "Only plain SQL exports can be split into parts")
+            return
+        throttle = self.throttle_settings(archive_format)
+        if throttle is False:
+            return
+        default_filename = default_output_name(
+            self.profile_var.get(), self.connection_entries["database"].get(), archive_format, codec,
+            split=bool(split_bytes)
+        )
+        if split_bytes:
+            filename = filedialog.asksaveasfilename(
+                initialfile=default_filename,
+                filetypes=[("Split export", "*.parts"), ("All files", "*.*")]
+            )
+        elif archive_format == "directory":
+            filename = filedialog.asksaveasfilename(
+                initialfile=default_filename,
+                filetypes=[("Directory archive", "*.dir"), ("All files", "*.*")]
+            )
+        elif archive_format == "repository":
+            # New or existing: every backup of a database should go to the same repository
+            filename = filedialog.askdirectory(title="Backup repository", mustexist=False)
+        elif archive_format in ("copy", "incremental"):
+            filename = filedialog.asksaveasfilename(
+                initialfile=default_filename,
+                filetypes=[("Per-table export", "*.tables"), ("All files", "*.*")]
+            )
+        else:
+            # From the format and codec: a profile or database name may contain dots too
+            extension = plain_extension(codec)
+            filename = filedialog.asksaveasfilename(
+                defaultextension=extension,
+                initialfile=default_filename,
+                filetypes=[("SQL files", "*" + extension), ("All files", "*.*")]
+            )
+
+        if not filename:
+            return
+
+        if (archive_format not in ("plain", "repository") or split_bytes) and os.path.exists(filename) and (
+            not os.path.isdir(filename) or os.listdir(filename)
+        ):
+            messagebox.showerror("Error", f"Output directory must not exist or be empty:\n{filename}")
+            return
+
+        level = self.compression_level_var.get()
+        jobs = resolve_jobs(self.jobs_var.get())
+        conn = self.connection_info()
+
+        selection = self.selection
+        if archive_format == "incremental" and not is_empty(selection):
+            messagebox.showerror("Error", "Incremental exports always cover the whole database")
+            return
+
+        flags = {"type": export_type, "compress": codec, "level": level, "jobs": jobs,
+                 "selection": describe(selection), "split": split_bytes, "throttle": throttle}
+
+        def on_done(meter):
+            summary = f"\n\n{summarize(meter)}" if meter else ""
+            self.status_var.set(f"Export completed: {summarize(meter)}" if meter else "Export completed successfully")
+            messagebox.showinfo("Success", f"Database exported successfully to:\n{filename}{summary}")
+
+        def start_export(plan=None):
+            if plan and not plan["fits"] and not messagebox.askyesno(
+                "Not Enough Disk Space", "\n".join(plan["warnings"]) + "\n\nExport anyway?"
+            ):
+                self.status_var.set("Export cancelled")
+                return
+            work = recorded(
+                lambda job: export_database(
+                    job, conn, filename, export_type, archive_format, codec, level, jobs, selection, split_bytes,
+                    throttle
+                ),
+                self.profile_var.get(), conn, "export", archive_format, flags, filename,
+                source_bytes=plan["dump_bytes"] if plan else None,
+            )
+            if archive_format != "plain":
+                self.status_var.set(f"Exporting database with {jobs} parallel jobs...")
+            else:
+                self.status_var.set("Exporting database...")
+            self.start_job("Export", work, on_done)
+
+        # The plan step first, to warn before a dump that won't fit on the disk
+        self.start_job(
+            "Plan",
+            lambda job: try_plan(
+                job, conn, filename, export_type, selection, archive_format, codec, level, jobs
+            ),
+            start_export,
+            on_error=lambda e: start_export(),
+        )
+
+    def plan_export(self):
+        # Recommends settings for the selected export type and objects, written to the working directory
+        if not self.validate_connection():
+            return
+        export_type, archive_format = self.export_mode()
+        conn = self.connection_info()
+        selection = self.selection
+
+        def on_done(plan):
+            self.status_var.set("Export plan ready")
+            if messagebox.askyesno("Export Plan", format_plan(plan) + "\n\nUse these settings?"):
+                self.apply_plan(plan)
+
+        self.start_job("Plan", lambda job: plan_export(job, conn, os.getcwd(), export_type, selection), on_done)
+
+    def apply_plan(self, plan):
+        if plan["archive_format"] != "plain":
+            self.export_type.set(plan["archive_format"])
+        elif self.export_type.get() not in ("full", "schema", "data"):
+            self.export_type.set("full")
+        if plan["codec"] in available_codecs():
+            self.compression_var.set(plan["codec"])
+            self.on_codec_selected()
+            if plan["level"] is not None:
+                self.compression_level_var.set(str(plan["level"]))
+        self.jobs_var.set(str(plan["jobs"]))
+
+    def throttle_settings(self, archive_format):
+        # None when unthrottled, False (after telling the user) when the settings can't be used
+        try:
+            rate = float(self.max_rate_var.get()) if self.max_rate_var.get() not in ("", "off") else None
+        except ValueError:
+            messagebox.showerror("Error", f"Invalid rate: {self.max_rate_var.get()}")
+            return False
+        throttle = {"max_mb_per_second": rate}
+        if self.back_off_var.get():
+            throttle.update(busy_sessions=DEFAULT_BUSY_SESSIONS, max_lag_mb=DEFAULT_MAX_LAG_MB)
+        if not is_throttled(throttle):
+            return None
+        if archive_format == "directory":
+            messagebox.showerror("Error", "Directory archives are written by pg_dump itself and can't be throttled")
+            return False
+        return throttle
+
+    def export_mode(self):
+        # The parallel, incremental and repository radio buttons are full dumps in a non-plain format
+        export_type = self.export_type.get()
+        if export_type in ("directory", "copy", "incremental", "repository"):
+            return "full", export_type
+        return export_type, "plain"
+
+    def import_database(self):
+        if not self.validate_connection():
+            return
+
+        filename = filedialog.askopenfilename(
+            filetypes=[
+                ("SQL files", "*.sql"),
+                ("Archives", "*.dump *.backup *.tar"),
+                ("Directory archive", "toc.dat"),
+                ("Per-table export", "manifest.json"),
+                ("Split export", "parts.json"),
+                ("Repository backup", "*.json"),
+                ("All files", "*.*"),
+            ]
+        )
+
+        if not filename:
+            return
+
+        # Directory archives are opened by picking their toc.dat
+        try:
+            filename, codec, archive_format = inspect_import_file(filename)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Could not read import file:\n{str(e)}")
+            return
+
+        transaction = self.transaction_var.get()
+        if transaction == "batches" and archive_format != "plain":
+            messagebox.showerror("Error", "Resumable (batches) imports need a plain SQL file")
+            return
+
+        selection = self.selection
+        if not is_empty(selection) and archive_format in ("plain", "copy"):
+            messagebox.showerror(
+                "Error", "Restoring selected objects needs a custom, directory or tar archive"
+            )
+            return
+
+        # A checkpoint left by a failed batched import of this file can be resumed
+        resume = False
+        checkpoint = load_checkpoint(filename) if transaction == "batches" else None
+        if checkpoint:
+            answer = messagebox.askyesnocancel(
+                "Resume Import",
+                f"A previous import of this file committed {checkpoint['statement']} statements "
+                f"(last checkpoint {checkpoint['updated']}).\n\n"
+                "Yes: resume from there\nNo: start over from the beginning",
+            )
+            if answer is None:
+                return
+            resume = answer
+
+        if not resume and not messagebox.askyesno(
+            "Confirm Import",
+            "Importing may overwrite existing data. Are you sure you want to continue?",
+        ):
+            return
+
+        jobs = restore_jobs(archive_format, self.jobs_var.get())
+        conn = self.connection_info()
+        bulk = self.bulk_load_var.get()
+
+        flags = {"codec": codec, "jobs": jobs, "bulk": bulk, "transaction": transaction, "resume": resume,
+                 "selection": describe(selection)}
+        work = recorded(
+            lambda job: import_database(
+                job, conn, filename, codec, archive_format, jobs, bulk, transaction, resume,
+                selection=selection
+            ),
+            self.profile_var.get(), conn, "import", archive_format, flags, filename,
+        )
+
+        def on_done(meter):
+            if meter:
+                self.status_var.set(f"Import completed: {summarize(meter)}")
+                messagebox.showinfo("Success", f"Database imported successfully!\n\n{summarize(meter)}")
+            else:
+                self.status_var.set("Import completed successfully")
+                messagebox.showinfo("Success", "Database imported successfully!")
+
+        if archive_format == "plain":
+            self.status_var.set("Importing database...")
+        elif archive_format == "copy":
+            self.status_var.set(f"Loading tables with {jobs} parallel jobs...")
+        else:
+            self.status_var.set(f"Restoring {archive_format} archive with {jobs} parallel jobs...")
+        self.start_job("Import", work, on_done)
+
+    def verify_backup(self):
+        filename = filedialog.askopenfilename(
+            title="Backup to verify",
+            filetypes=[
+                ("SQL files", "*.sql *.sql.*"),
+                ("Archives", "*.dump *.backup *.tar"),
+                ("Directory archive", "toc.dat"),
+                ("Per-table export", "manifest.json"),
+                ("Split export", "parts.json"),
+                ("Repository backup", "*.json"),
+                ("All files", "*.*"),
+            ]
+        )
+        if not filename:
+            return
+
+        # Row counts are compared with the connected database when there is one
+        conn = None
+        if all(self.connection_entries[field].get() for field in ["host", "port", "username", "database"]):
+            if messagebox.askyesno(
+                "Verify Backup",
+                f"Compare row counts with {self.connection_entries['database'].get()} "
+                "(the database the backup was taken from)?",
+            ):
+                conn = self.connection_info()
+        jobs = resolve_jobs(self.jobs_var.get())
+
+        def on_done(report):
+            self.status_var.set("Backup verified" if report["ok"] else "Backup verification found problems")
+            lines = format_report(report).splitlines()
+            if len(lines) > 25:
+                lines = lines[:25] + [f"... and {len(lines) - 25} more"]
+            show = messagebox.showinfo if report["ok"] else messagebox.showwarning
+            show("Verify Backup", "\n".join(lines))
+
+        self.status_var.set("Verifying backup...")
+        self.start_job("Verify", lambda job: verify_backup(job, filename, conn, jobs), on_done)
+
+    def start_job(self, name, target, on_done, on_error=None):
+        # Runs target(job) on a worker thread; callbacks are delivered by poll_jobs
+        def default_on_error(e):
+            self.status_var.set(f"{name} failed")
+            if isinstance(e, subprocess.CalledProcessError):
+                messagebox.showerror(f"{name} Error", f"{name} failed:\n{error_text(e)}")
+            else:
+                messagebox.showerror("Error", f"Unexpected error during {name.lower()}:\n{str(e)}")
+
+        def on_cancel():
+            self.status_var.set(f"{name} cancelled")
+
+        job = self.jobs.submit(
+            name,
+            target,
+            on_status=self.status_var.set,
+            on_done=on_done,
+            on_error=on_error or default_on_error,
+            on_cancel=on_cancel,
+            on_progress=self.show_progress,
+        )
+        self.update_job_indicator()
+        return job
+
+    def poll_jobs(self):
+        self.jobs.poll()
+        self.update_job_indicator()
+        self.root.after(JOB_POLL_MS, self.poll_jobs)
+
+    def show_progress(self, fraction, message):
+        self.status_var.set(message)
+        if fraction is None:
+            return
+        # Switch to a determinate bar as soon as a job knows its total
+        if str(self.progress_bar.cget("mode")) != "determinate":
+            self.progress_bar.stop()
+            self.progress_bar.configure(mode="determinate", maximum=100)
+        self.progress_bar["value"] = fraction * 100
+
+    def update_job_indicator(self):
+        running = len(self.jobs.running())
+        if running and not self.progress_active:
+            self.progress_bar.start()
+            self.cancel_button.state(["!disabled"])
+        elif not running and self.progress_active:
+            self.progress_bar.stop()
+            self.progress_bar.configure(mode="indeterminate")
+            self.progress_bar["value"] = 0
+            self.cancel_button.state(["disabled"])
+        self.progress_active = bool(running)
+        self.jobs_label_var.set(f"{running} running" if running > 1 else "")
+
+    def cancel_jobs(self):
+        running = self.jobs.running()
+        if running and messagebox.askyesno(
+            "Cancel", f"Cancel {len(running)} running job(s)?"
+        ):
+            self.jobs.cancel_all()
+
+    def connection_info(self):
+        # Snapshot of the entries; worker threads must not touch Tk widgets
+        return {
+            field: self.connection_entries[field].get()
+            for field in ["host", "port", "username", "password", "database"]
+        }
+
+    def validate_connection(self):
+        self.fill_saved_password()
+        required_fields = ["host", "port", "username", "password", "database"]
+        for field in required_fields:
+            if not self.connection_entries[field].get():
+                messagebox.showerror("Error", f"{field.capitalize()} is required!")
+                return False
+        return True
+
+    def server_connection_info(self):
+        self.fill_saved_password()
+        # First validate connection details
+        host = self.connection_entries["host"].get().strip()
+        port = self.connection_entries["port"].get().strip()
+        username = self.connection_entries["username"].get().strip()
+        password = self.connection_entries["password"].get()
+        
+        if not all([host, port, username, password]):
+            messagebox.showerror(
+                "Error",
+                "Please fill in the host, port, username, and password fields first."
+            )
+            return None
+            
+        return {
+            "host": host,
+            "port": port,
+            "username": username,
+            "password": password
+        }
+
+    def select_database(self):
+        connection_info = self.server_connection_info()
+        if connection_info is None:
+            return
+        
+        # Show database selection dialog
+        dialog = DatabaseSelectDialog(self.root, connection_info, self.jobs)
+        self.root.wait_window(dialog.dialog)
+        
+        if dialog.selected_db:
+            self.connection_entries["database"].delete(0, tk.END)
+            self.connection_entries["database"].insert(0, dialog.selected_db)
+
+    def select_objects(self):
+        if not self.validate_connection():
+            return
+        dialog = ObjectPickerDialog(self.root, self.connection_info(), self.jobs, self.selection)
+        self.root.wait_window(dialog.dialog)
+        if dialog.result is not None:
+            self.selection = dialog.result
+            self.selection_var.set(describe(self.selection))
+
+    def batch_export(self):
+        connection_info = self.server_connection_info()
+        if connection_info is None:
+            return
+
+        dialog = DatabaseSelectDialog(self.root, connection_info, self.jobs, multiple=True)
+        self.root.wait_window(dialog.dialog)
+        if not dialog.selected_dbs:
+            return
+
+        output_dir = filedialog.askdirectory(title="Batch export output directory", mustexist=False)
+        if not output_dir:
+            return
+
+        # The concurrency limit is remembered per profile and enforced per host
+        name = self.profile_var.get()
+        profile = self.profiles.get(name, {})
+        concurrency = simpledialog.askinteger(
+            "Batch Export",
+            f"Concurrent dumps against {connection_info['host']}:",
+            initialvalue=profile.get("batch_concurrency", DEFAULT_CONCURRENCY),
+            minvalue=1,
+            maxvalue=64,
+        )
+        if not concurrency:
+            return
+        if profile and profile.get("batch_concurrency") != concurrency:
+            profile["batch_concurrency"] = concurrency
+            self.save_profiles()
+
+        export_type, archive_format = self.export_mode()
+        throttle = self.throttle_settings(archive_format)
+        if throttle is False:
+            return
+        batch = BatchExport(
+            self.jobs,
+            name or connection_info["host"],
+            dict(connection_info, database=""),
+            dialog.selected_dbs,
+            output_dir,
+            concurrency,
+            export_type,
+            archive_format,
+            self.compression_var.get(),
+            self.compression_level_var.get(),
+            resolve_jobs(self.jobs_var.get()),
+            throttle=throttle,
+        )
+        BatchExportWindow(self.root, batch)
+        self.update_job_indicator()
+
+    def copy_to_profile(self):
+        if not self.validate_connection():
+            return
+        if len(self.profiles) < 2:
+            messagebox.showerror("Error", "Save a second profile to copy into first")
+            return
+
+        dialog = CopyToProfileDialog(self.root, self.profiles, self.profile_var.get())
+        self.root.wait_window(dialog.dialog)
+        if not dialog.target:
+            return
+
+        target = connection_for(dialog.target, self.profiles[dialog.target], database=dialog.database)
+        if target["password"] is None:
+            # Without a saved password psql falls back to ~/.pgpass / PGPASSWORD
+            target["password"] = simpledialog.askstring(
+                "Password", f"Password for {dialog.target} (leave empty for ~/.pgpass):", show="*"
+            ) or None
+
+        if not messagebox.askyesno(
+            "Confirm Copy",
+            f"Copy into {dialog.database} on {target['host']}? Existing data there may be overwritten.",
+        ):
+            return
+
+        export_type = self.export_mode()[0]
+        jobs = resolve_jobs(self.jobs_var.get())
+        source = self.connection_info()
+
+        flags = {"type": export_type, "jobs": jobs, "target": f"{dialog.target}/{dialog.database}"}
+        work = recorded(
+            lambda job: copy_database(job, source, target, export_type, jobs, dialog.parallel),
+            self.profile_var.get(), source, "copy", "parallel" if dialog.parallel else "serial", flags,
+        )
+
+        def on_done(meter):
+            self.status_var.set(f"Copy completed: {summarize(meter)}")
+            messagebox.showinfo("Success", f"Database copied to {dialog.target}/{dialog.database}\n\n{summarize(meter)}")
+
+        if dialog.parallel:
+            self.status_var.set(f"Copying tables to {dialog.target} with {jobs} parallel streams...")
+        else:
+            self.status_var.set(f"Copying database to {dialog.target}...")
+        self.start_job("Copy", work, on_done)
+
+
+class BatchExportWindow:
+    def __init__(self, parent, batch):
+        self.batch = batch
+        self.window = tk.Toplevel(parent)
+        self.window.title(f"Batch Export ({len(batch.status)} databases)")
+        self.window.geometry("700x400")
+        self.window.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        self.summary_var = tk.StringVar(value="Starting...")
+        ttk.Label(self.window, textvariable=self.summary_var).pack(anchor="w", padx=5, pady=5)
+
+        frame = ttk.Frame(self.window)
+        frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        self.tree = ttk.Treeview(frame, columns=("state", "message"), show="tree headings")
+        self.tree.heading("#0", text="Database")
+        self.tree.heading("state", text="Status")
+        self.tree.heading("message", text="Progress")
+        self.tree.column("#0", width=160)
+        self.tree.column("state", width=80)
+        self.tree.column("message", width=420)
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        for database, entry in batch.status.items():
+            self.tree.insert("", tk.END, iid=database, text=database, values=(entry["state"], ""))
+
+        btn_frame = ttk.Frame(self.window)
+        btn_frame.pack(fill=tk.X, padx=5, pady=5)
+        self.cancel_button = ttk.Button(btn_frame, text="Cancel Batch", command=self.on_cancel)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Close", command=self.on_close).pack(side=tk.RIGHT, padx=5)
+
+        batch.on_update = self.on_update
+        batch.on_finished = self.on_finished
+        batch.start()
+
+    def on_update(self, database, entry):
+        if self.window.winfo_exists():
+            self.tree.item(database, values=(entry["state"], entry["message"]))
+            counts = self.batch.counts()
+            self.summary_var.set(", ".join(f"{state}: {count}" for state, count in sorted(counts.items())))
+
+    def on_finished(self, batch):
+        report_path = batch.write_report()
+        if not self.window.winfo_exists():
+            return
+        self.cancel_button.state(["disabled"])
+        self.summary_var.set(f"Finished. Report written to {report_path}")
+        show = messagebox.showinfo if batch.ok() else messagebox.showwarning
+        show("Batch Export", batch.summary(), parent=self.window)
+
+    def on_cancel(self):
+        if not self.batch.finished and messagebox.askyesno(
+            "Cancel", "Cancel the remaining exports in this batch?", parent=self.window
+        ):
+            self.batch.cancel()
+
+    def on_close(self):
+        # Closing the window does not stop the batch unless it was cancelled
+        if not self.batch.finished and not messagebox.askyesno(
+            "Close", "The batch keeps running in the background. Close this window?", parent=self.window
+        ):
+            return
+        self.window.destroy()
+
+
+class HistoryWindow:
+    # Per-database trends on top; the runs behind the selected trend below
+    def __init__(self, parent):
+        self.window = tk.Toplevel(parent)
+        self.window.title("Job History")
+        self.window.geometry("860x560")
+        self.records = load_history()
+
+        self.summary_var = tk.StringVar()
+        ttk.Label(self.window, textvariable=self.summary_var).pack(anchor="w", padx=5, pady=5)
+
+        panes = ttk.PanedWindow(self.window, orient=tk.VERTICAL)
+        panes.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        columns = ("operation", "mode", "runs", "last", "rate", "change", "growth")
+        self.trend_tree = self.make_tree(panes, columns, {
+            "#0": ("Database", 170), "operation": ("Operation", 70), "mode": ("Mode", 90), "runs": ("Runs", 50),
+            "last": ("Last Duration", 95), "rate": ("MB/s", 70), "change": ("Duration Trend", 95),
+            "growth": ("Size Growth", 100),
+        })
+        self.trend_tree.tag_configure("slower", foreground="#b00000")
+        self.trend_tree.bind("<<TreeviewSelect>>", lambda event: self.show_runs())
+
+        columns = ("status", "duration", "size", "rate", "exit", "flags")
+        self.run_tree = self.make_tree(panes, columns, {
+            "#0": ("Started", 150), "status": ("Status", 70), "duration": ("Duration", 80), "size": ("Size", 80),
+            "rate": ("MB/s", 60), "exit": ("Exit", 40), "flags": ("Flags", 300),
+        })
+        self.run_tree.bind("<<TreeviewSelect>>", lambda event: self.show_error())
+
+        self.error_text = tk.Text(self.window, height=6, wrap="none")
+        self.error_text.pack(fill=tk.X, padx=5)
+
+        btn_frame = ttk.Frame(self.window)
+        btn_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Button(btn_frame, text="Reload", command=self.reload).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Close", command=self.window.destroy).pack(side=tk.RIGHT, padx=5)
+
+        self.trends = {}
+        self.runs = {}
+        self.render_trends()
+
+    def make_tree(self, panes, columns, headings):
+        frame = ttk.Frame(panes)
+        panes.add(frame, weight=1)
+        tree = ttk.Treeview(frame, columns=columns, show="tree headings", selectmode="browse")
+        for column, (text, width) in headings.items():
+            tree.heading(column, text=text)
+            tree.column(column, width=width, anchor=tk.E if column in ("runs", "rate", "exit") else tk.W)
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        return tree
+
+    def reload(self):
+        self.records = load_history()
+        self.render_trends()
+
+    def render_trends(self):
+        self.trend_tree.delete(*self.trend_tree.get_children())
+        self.run_tree.delete(*self.run_tree.get_children())
+        self.trends = {}
+        found = trends(self.records)
+        for trend in found:
+            item = self.trend_tree.insert("", tk.END, text=trend["database"], values=(
+                trend["operation"],
+                trend["mode"],
+                trend["runs"],
+                format_duration(trend["last_seconds"]),
+                f"{trend['mb_per_second']:.1f}" if trend["mb_per_second"] else "-",
+                f"{trend['seconds_change']:+.0%}" if trend["seconds_change"] is not None else "-",
+                f"{format_bytes(trend['bytes_per_day'])}/day" if trend["bytes_per_day"] else "-",
+            ), tags=("slower",) if trend["slower"] else ())
+            self.trends[item] = trend
+        slower = sum(1 for trend in found if trend["slower"])
+        self.summary_var.set(
+            f"{len(self.records)} jobs recorded in {history_path()}"
+            + (f"; {slower} getting slower" if slower else "")
+        )
+
+    def show_runs(self):
+        self.run_tree.delete(*self.run_tree.get_children())
+        self.runs = {}
+        selected = self.trend_tree.selection()
+        if not selected:
+            return
+        trend = self.trends[selected[0]]
+        key = (trend["host"], trend["database"], trend["operation"], trend["mode"])
+        for record in reversed(self.records):
+            if trend_key(record) != key:
+                continue
+            item = self.run_tree.insert("", tk.END, text=record["started"].replace("T", " "), values=(
+                record["status"],
+                format_duration(record["seconds"]),
+                format_bytes(record["bytes"]) if record.get("bytes") else "-",
+                f"{record['mb_per_second']:.1f}" if record.get("mb_per_second") else "-",
+                record["exit_code"] if record["exit_code"] is not None else "-",
+                ", ".join(f"{name}={value}" for name, value in record["flags"].items()),
+            ))
+            self.runs[item] = record
+
+    def show_error(self):
+        selected = self.run_tree.selection()
+        self.error_text.delete("1.0", tk.END)
+        if selected:
+            self.error_text.insert("1.0", self.runs[selected[0]]["stderr_tail"])
@@ -0,0 +1,163 @@
+import json
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+from core import error_text
+from jobs import JobCancelled
+from profiles import sibling_path
+from progress import MB
+
+
+# One JSON object per line, appended when a job ends, whatever the outcome
+HISTORY_FILE = "job_history.jsonl"
+STDERR_TAIL_LINES = 20
+# Runs compared on each side when looking for a trend
+TREND_WINDOW = 5
+# Recent runs this much slower than the ones before them are flagged
+SLOWER_THRESHOLD = 0.20
+
+_lock = threading.Lock()
+
+
+def history_path():
+    return sibling_path(HISTORY_FILE)
+
+
+def path_bytes(path):
+    if not path or not os.path.exists(path):
+        return None
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+
+def stderr_tail(e):
+    lines = error_text(e).splitlines()
+    return "\n".join(lines[-STDERR_TAIL_LINES:])
+
+
+def append(record, path=None):
+    # A single O_APPEND write per record, so concurrent CLI runs don't interleave lines
+    line = (json.dumps(record) + "\n").encode()
+    with _lock:
+        fd = os.open(path or history_path(), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def recorded(target, profile, conn, operation, mode, flags=None, path=None, source_bytes=None):
+    # Wraps a job target so its outcome is appended to the history.
+    # path is the dump file or directory, sized when the job returns no Meter.
+    # source_bytes is the table data behind an export, when the caller knows it
+    # (the plan's estimate): it gives a rate whatever the format writes.
+    def run(job):
+        started = datetime.now()
+        clock = time.monotonic()
+        record = {
+            "started": started.isoformat(timespec="seconds"),
+            "profile": profile,
+            "host": f"{conn['host']}:{conn['port']}",
+            "database": conn["database"],
+            "operation": operation,
+            "mode": mode,
+            "flags": flags or {},
+            "path": path,
+        }
+        try:
+            meter = target(job)
+        except BaseException as e:
+            cancelled = isinstance(e, JobCancelled) or job.cancelled
+            record.update(
+                status="cancelled" if cancelled else "failed",
+                exit_code=e.returncode if isinstance(e, subprocess.CalledProcessError) else None,
+                stderr_tail="" if cancelled else stderr_tail(e),
+            )
+            finish(record, time.monotonic() - clock, None)
+            raise
+        seconds = time.monotonic() - clock
+        record.update(status="ok", exit_code=0, stderr_tail="")
+        if source_bytes and seconds:
+            record.update(source_bytes=source_bytes, source_mb_per_second=round(source_bytes / MB / seconds, 2))
+        finish(record, seconds, meter)
+        return meter
+
+    return run
+
+
+def finish(record, seconds, meter):
+    count = meter.bytes if meter else path_bytes(record["path"])
+    record.update(
+        seconds=round(seconds, 3),
+        bytes=count,
+        mb_per_second=round(count / MB / seconds, 2) if count and seconds and record["status"] == "ok" else None,
+    )
+    try:
+        append(record)
+    except OSError:
+        pass  # History is best effort; never fail the job over it
+
+
+def load_history(path=None):
+    path = path or history_path()
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue  # A line cut short by a crash
+    return records
+
+
+def trend_key(record):
+    return (record["host"], record["database"], record["operation"], record["mode"])
+
+
+def mean(values):
+    values = [value for value in values if value is not None]
+    return sum(values) / len(values) if values else None
+
+
+def trends(records):
+    # Per (host, database, operation, mode): how the latest successful runs compare with earlier ones
+    groups = {}
+    for record in records:
+        if record.get("status") == "ok":
+            groups.setdefault(trend_key(record), []).append(record)
+
+    result = []
+    for key, runs in groups.items():
+        runs.sort(key=lambda run: run["started"])
+        recent = runs[-TREND_WINDOW:]
+        earlier = runs[-2 * TREND_WINDOW:-TREND_WINDOW]
+        recent_seconds, earlier_seconds = mean(run["seconds"] for run in recent), mean(
+            run["seconds"] for run in earlier
+        )
+        change = recent_seconds / earlier_seconds - 1 if earlier_seconds else None
+
+        # Size growth per day between the first and last run, for capacity planning
+        first, last = runs[0], runs[-1]
+        days = (datetime.fromisoformat(last["started"]) - datetime.fromisoformat(first["started"])).total_seconds()
+        days /= 86400
+        growth = (last["bytes"] - first["bytes"]) / days if days >= 1 and last["bytes"] and first["bytes"] else None
+
+        result.append({
+            "host": key[0], "database": key[1], "operation": key[2], "mode": key[3],
+            "runs": len(runs),
+            "last_started": last["started"],
+            "last_seconds": last["seconds"],
+            "last_bytes": last["bytes"],
+            "mb_per_second": mean(run["mb_per_second"] for run in recent),
+            "seconds_change": change,
+            "bytes_per_day": growth,
+            "slower": change is not None and change > SLOWER_THRESHOLD,
+        })
+    result.sort(key=lambda trend: (not trend["slower"], trend["database"], trend["operation"], trend["mode"]))
+    return result
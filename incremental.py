@@ -0,0 +1,136 @@
+import json
+import os
+from datetime import datetime
+
+from copy_engine import MANIFEST_FILE, export_tables, import_tables, load_manifest
+from core import query
+from profiles import sibling_path
+
+
+FINGERPRINTS_FILE = "export_fingerprints.json"
+# Manifest files an incremental export always has in full
+CHAIN_FILES = ["pre_data", "post_data", "sequences", "large_objects"]
+
+# Cumulative write counters plus on-disk size: any insert, update, delete or
+# rewrite (VACUUM FULL, TRUNCATE + reload) changes at least one of them.
+# A stats reset changes all of them, which only makes the next export bigger.
+FINGERPRINT_SQL = """
+SELECT schemaname, relname, n_tup_ins, n_tup_upd, n_tup_del, pg_relation_size(relid)
+FROM pg_stat_user_tables;
+"""
+
+
+def cache_key(conn):
+    return f"{conn['host']}:{conn['port']}/{conn['database']}"
+
+
+def load_cache(path):
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def save_cache(path, cache):
+    # Write-then-rename so an interrupted export can't corrupt the cache
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(cache, f, indent=4)
+    os.replace(temp, path)
+
+
+def table_fingerprints(job, conn):
+    return {
+        f"{schema}.{name}": ":".join(values)
+        for schema, name, *values in query(job, conn, FINGERPRINT_SQL)
+    }
+
+
+def record_export(cache_file, conn, output_dir, fingerprints, full):
+    cache = load_cache(cache_file)
+    entry = cache.get(cache_key(conn), {})
+    entry["last_export"] = os.path.abspath(output_dir)
+    if full:
+        entry["last_full"] = os.path.abspath(output_dir)
+    entry["tables"] = fingerprints
+    entry["updated"] = datetime.now().isoformat(timespec="seconds")
+    cache[cache_key(conn)] = entry
+    save_cache(cache_file, cache)
+
+
+def export_tracked(job, conn, output_dir, export_type="full", codec="none", jobs=None, cache_file=None,
+                   throttle=None):
+    # Per-table export that also records fingerprints, so it can seed an incremental chain.
+    # Fingerprints are taken before the dump: changes made during it show up next time.
+    cache_file = cache_file or sibling_path(FINGERPRINTS_FILE)
+    fingerprints = table_fingerprints(job, conn) if export_type == "full" else None
+    meter = export_tables(job, conn, output_dir, export_type, codec, jobs, extra={"type": "full"}, throttle=throttle)
+    if fingerprints is not None:
+        record_export(cache_file, conn, output_dir, fingerprints, full=True)
+    return meter
+
+
+def export_incremental(job, conn, output_dir, codec="none", jobs=None, cache_file=None, throttle=None):
+    cache_file = cache_file or sibling_path(FINGERPRINTS_FILE)
+    entry = load_cache(cache_file).get(cache_key(conn))
+    parent = entry and entry.get("last_export")
+    if not parent or not os.path.exists(os.path.join(parent, MANIFEST_FILE)):
+        job.status("No previous per-table export found, running a full export...")
+        return export_tracked(job, conn, output_dir, "full", codec, jobs, cache_file, throttle)
+
+    fingerprints = table_fingerprints(job, conn)
+    previous = entry.get("tables", {})
+    changed = {name for name, fingerprint in fingerprints.items() if previous.get(name) != fingerprint}
+    unchanged = sorted(set(fingerprints) - changed)
+
+    job.status(f"{len(changed)} of {len(fingerprints)} tables changed since {parent}")
+    meter = export_tables(
+        job, conn, output_dir, "full", codec, jobs,
+        include=changed,
+        extra={
+            "type": "incremental",
+            "parent": parent,
+            "base_full": entry.get("last_full"),
+            "unchanged": unchanged,
+        },
+        throttle=throttle,
+    )
+    record_export(cache_file, conn, output_dir, fingerprints, full=False)
+    return meter
+
+
+def resolve_chain(input_dir):
+    # Flattens an incremental export and its parents into one manifest whose
+    # file paths are absolute; each table comes from the newest export that dumped it
+    manifest = load_manifest(input_dir)
+    tables = {}
+    for table in manifest["tables"]:
+        files = [
+            dict(entry, path=os.path.join(os.path.abspath(input_dir), entry["path"]),
+                 codec=entry.get("codec", manifest.get("codec", "none")))
+            for entry in table["files"]
+        ]
+        tables[f"{table['schema']}.{table['name']}"] = dict(table, files=files)
+
+    if manifest.get("type") == "incremental":
+        parent = manifest["parent"]
+        if not os.path.exists(os.path.join(parent, MANIFEST_FILE)):
+            raise FileNotFoundError(f"Incremental chain is broken, parent export missing: {parent}")
+        parent_tables = {
+            f"{table['schema']}.{table['name']}": table for table in resolve_chain(parent)["tables"]
+        }
+        for name in manifest.get("unchanged", []):
+            if name in parent_tables:
+                tables[name] = parent_tables[name]
+
+    resolved = dict(manifest, tables=list(tables.values()))
+    # Schema files, sequence values and large objects always come from the newest
+    # export: every increment dumps all of them, not just the changed tables' part
+    for key in CHAIN_FILES:
+        if manifest.get(key):
+            resolved[key] = os.path.join(os.path.abspath(input_dir), manifest[key])
+    return resolved
+
+
+def import_chain(job, conn, input_dir, jobs=None):
+    return import_tables(job, conn, input_dir, jobs, manifest=resolve_chain(input_dir))
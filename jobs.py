@@ -0,0 +1,194 @@
+import queue
+import subprocess
+import threading
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, runner, name, on_status=None, on_done=None, on_error=None, on_cancel=None,
+                 on_progress=None):
+        self.runner = runner
+        self.name = name
+        self.state = "pending"
+        self.cancelled = False
+        self.on_status = on_status
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self.parent = None
+        self._children = []
+        self._processes = []
+        self._stderr = {}
+        self._lock = threading.Lock()
+
+    def status(self, message):
+        # Safe to call from the worker thread, delivered on the next poll
+        if self.parent is not None:
+            self.parent.status(message)
+        else:
+            self.runner.events.put((self, "status", message))
+
+    def progress(self, fraction, message):
+        # fraction is 0..1, or None when the total is unknown
+        if self.parent is not None:
+            self.parent.progress(fraction, message)
+        else:
+            self.runner.events.put((self, "progress", (fraction, message)))
+
+    def child(self):
+        # A job for one group of parallel workers: cancelling it stops only their
+        # processes, cancelling this job cancels it too. Status and progress go
+        # to this job.
+        worker = Job(self.runner, self.name)
+        worker.parent = self
+        with self._lock:
+            self._children.append(worker)
+            cancelled = self.cancelled
+        if cancelled:
+            worker.cancel()
+        return worker
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(self.name)
+
+    def popen(self, cmd, **kwargs):
+        # Every child process is tracked so cancel() can terminate it
+        with self._lock:
+            self.check_cancelled()
+            process = subprocess.Popen(cmd, **kwargs)
+            self._processes.append(process)
+        return process
+
+    def attach(self, process):
+        # Tracks a process the job borrows but doesn't own (e.g. a pooled session)
+        with self._lock:
+            self.check_cancelled()
+            self._processes.append(process)
+
+    def detach(self, process):
+        with self._lock:
+            if process in self._processes:
+                self._processes.remove(process)
+
+    def start(self, cmd, **kwargs):
+        # popen() for streaming pipelines: stderr is drained on a side thread so
+        # the child can't stall on a full pipe while we pump stdin/stdout
+        process = self.popen(cmd, stderr=subprocess.PIPE, **kwargs)
+        chunks = []
+        thread = threading.Thread(target=lambda: chunks.append(process.stderr.read()), daemon=True)
+        thread.start()
+        self._stderr[process] = (thread, chunks)
+        return process
+
+    def finish(self, process):
+        # Wait for a process from start() and raise like check=True would
+        process.wait()
+        thread, chunks = self._stderr.pop(process)
+        thread.join()
+        stderr = chunks[0] if chunks else None
+        if process.returncode != 0:
+            self.check_cancelled()
+            raise subprocess.CalledProcessError(process.returncode, process.args, stderr=stderr)
+        return stderr
+
+    def run(self, cmd, input=None, **kwargs):
+        # Cancellable equivalent of subprocess.run(..., check=True)
+        process = self.popen(cmd, **kwargs)
+        stdout, stderr = process.communicate(input)
+        if process.returncode != 0:
+            self.check_cancelled()
+            raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+        return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            for process in self._processes:
+                if process.poll() is None:
+                    process.terminate()
+            children = list(self._children)
+        for worker in children:
+            worker.cancel()
+
+
+class JobRunner:
+    def __init__(self):
+        self.events = queue.Queue()
+        self.jobs = []
+
+    def submit(self, name, target, on_status=None, on_done=None, on_error=None, on_cancel=None,
+               on_progress=None):
+        job = Job(self, name, on_status, on_done, on_error, on_cancel, on_progress)
+        job.state = "running"
+        self.jobs.append(job)
+        thread = threading.Thread(target=self._run, args=(job, target), daemon=True)
+        thread.start()
+        return job
+
+    def _run(self, job, target):
+        try:
+            result = target(job)
+        except JobCancelled:
+            self.events.put((job, "cancelled", None))
+        except Exception as e:
+            # A killed child usually surfaces as a CalledProcessError
+            if job.cancelled:
+                self.events.put((job, "cancelled", None))
+            else:
+                self.events.put((job, "failed", e))
+        else:
+            self.events.put((job, "done", result))
+
+    def poll(self):
+        # Must be called from the thread that owns the UI; runs all pending callbacks
+        while True:
+            try:
+                job, kind, payload = self.events.get_nowait()
+            except queue.Empty:
+                break
+            self._dispatch(job, kind, payload)
+
+    def _dispatch(self, job, kind, payload):
+        if kind == "status":
+            callback = job.on_status
+        elif kind == "progress":
+            callback = job.on_progress
+            if callback is not None:
+                callback(*payload)
+            return
+        else:
+            job.state = kind
+            if job in self.jobs:
+                self.jobs.remove(job)
+            callback = {
+                "done": job.on_done,
+                "failed": job.on_error,
+                "cancelled": job.on_cancel,
+            }[kind]
+
+        if callback is not None:
+            if kind == "cancelled":
+                callback()
+            else:
+                callback(payload)
+
+    def wait(self, interval=0.1):
+        # Blocking alternative to UI polling, for callers without an event loop
+        while self.jobs:
+            try:
+                job, kind, payload = self.events.get(timeout=interval)
+            except queue.Empty:
+                continue
+            self._dispatch(job, kind, payload)
+
+    def running(self):
+        return list(self.jobs)
+
+    def cancel_all(self):
+        for job in self.running():
+            job.cancel()
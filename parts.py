@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from compression import CHUNK_SIZE, CODECS
+
+
+# A split export is a directory of fixed-size parts of one dump stream plus a
+# manifest. Parts are plain byte ranges, so `cat dump.sql.gz.* | gunzip` works
+# too; the manifest is rewritten as each part completes, so finished parts can
+# be uploaded while the dump is still running.
+PARTS_MANIFEST = "parts.json"
+PART_BYTES = 1024 * 1024 * 1024
+# Chunks waiting for the hashing thread
+HASH_QUEUE = 64
+
+_end_of_part = object()
+_stop = object()
+
+
+class ChecksumError(ValueError):
+    pass
+
+
+def parse_size(value):
+    # "1G", "500M", "64k" or a plain number of bytes
+    value = str(value).strip().upper().rstrip("B")
+    for suffix, factor in (("K", 1024), ("M", 1024 ** 2), ("G", 1024 ** 3), ("T", 1024 ** 4)):
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * factor)
+    return int(value)
+
+
+def stream_name(codec):
+    return "dump.sql" + (CODECS[codec]["extension"] if codec and codec != "none" else "")
+
+
+def is_split(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, PARTS_MANIFEST))
+
+
+def read_manifest(path):
+    with open(os.path.join(path, PARTS_MANIFEST), "r") as f:
+        return json.load(f)
+
+
+def total_bytes(path):
+    return sum(part["bytes"] for part in read_manifest(path)["parts"])
+
+
+class PartWriter:
+    # File-like target that rolls over to a new part every part_bytes. SHA-256
+    # runs on a background thread fed through a bounded queue, so hashing never
+    # holds up pg_dump or the compressor.
+    def __init__(self, directory, codec="none", part_bytes=PART_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.codec = codec
+        self.part_bytes = max(1, int(part_bytes))
+        self.stem = stream_name(codec)
+        self.parts = []
+        self.file = None
+        self.written = 0
+        self.chunks = queue.Queue(maxsize=HASH_QUEUE)
+        self.failure = []
+        self.lock = threading.Lock()
+        self.hasher = threading.Thread(target=self._hash, daemon=True)
+        self.hasher.start()
+        self.write_manifest(complete=False)
+
+    def part_name(self, index):
+        return f"{self.stem}.{index:05d}"
+
+    def write(self, data):
+        data = memoryview(data)
+        while len(data):
+            if self.file is None:
+                self.file = open(os.path.join(self.directory, self.part_name(len(self.parts))), "wb")
+                self.parts.append({"name": self.part_name(len(self.parts)), "bytes": 0, "sha256": None})
+                self.written = 0
+            piece = bytes(data[:self.part_bytes - self.written])
+            self.file.write(piece)
+            self.chunks.put(piece)
+            self.written += len(piece)
+            data = data[len(piece):]
+            if self.written == self.part_bytes:
+                self._end_part()
+
+    def _end_part(self):
+        self.file.close()
+        self.file = None
+        self.chunks.put(_end_of_part)
+
+    def _hash(self):
+        digest = hashlib.sha256()
+        size = 0
+        index = 0
+        while True:
+            item = self.chunks.get()
+            if item is _stop:
+                return
+            if item is _end_of_part:
+                try:
+                    with self.lock:
+                        self.parts[index].update(bytes=size, sha256=digest.hexdigest())
+                    self.write_manifest(complete=False)
+                except Exception as e:
+                    self.failure.append(e)
+                digest, size, index = hashlib.sha256(), 0, index + 1
+            else:
+                digest.update(item)
+                size += len(item)
+
+    def write_manifest(self, complete):
+        with self.lock:
+            manifest = {
+                "format": "split",
+                "codec": self.codec,
+                "part_bytes": self.part_bytes,
+                "complete": complete,
+                "updated": datetime.now().isoformat(timespec="seconds"),
+                # Only parts whose checksum is known are listed
+                "parts": [dict(part) for part in self.parts if part["sha256"]],
+            }
+        path = os.path.join(self.directory, PARTS_MANIFEST)
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        if self.file is not None:
+            self._end_part()
+        self.chunks.put(_stop)
+        self.hasher.join()
+        if self.failure:
+            raise self.failure[0]
+        self.write_manifest(complete=True)
+
+    def abort(self):
+        # Stops the hashing thread after a failed export; the caller removes the directory
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.chunks.put(_stop)
+        self.hasher.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def check_part(directory, part, stopped):
+    # Reads a whole part and compares its size and SHA-256 with the manifest
+    digest = hashlib.sha256()
+    size = 0
+    with open(os.path.join(directory, part["name"]), "rb") as f:
+        while not stopped.is_set():
+            data = f.read(CHUNK_SIZE)
+            if not data:
+                break
+            digest.update(data)
+            size += len(data)
+    if not stopped.is_set() and (size != part["bytes"] or digest.hexdigest() != part["sha256"]):
+        raise ChecksumError(f"Checksum mismatch in part {part['name']}: the file is damaged or incomplete")
+
+
+class PartReader:
+    # Reads the parts of a split export back as one stream, checking each
+    # part's size and SHA-256 as its last byte is read. With check_first, each
+    # part is also checked in full before any of it is returned (the next one on
+    # a side thread while the current one streams), so a damaged part never
+    # reaches psql; the parts before it have been read by then.
+    def __init__(self, directory, check_first=True):
+        manifest = read_manifest(directory)
+        if not manifest.get("complete"):
+            raise ValueError(f"Split export is incomplete (the dump did not finish): {directory}")
+        self.directory = directory
+        self.parts = list(manifest["parts"])
+        self.index = -1
+        self.file = None
+        self.digest = None
+        self.size = 0
+        self.stopped = threading.Event()
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.check_first = check_first
+        self.checks = [self._check(0)]
+
+    def _check(self, index):
+        if not self.check_first or index >= len(self.parts):
+            return None
+        return self.pool.submit(check_part, self.directory, self.parts[index], self.stopped)
+
+    def _open_next(self):
+        self._close_part()
+        self.index += 1
+        if self.index >= len(self.parts):
+            return False
+        check = self.checks.pop(0)
+        if check is not None:
+            check.result()
+        self.checks.append(self._check(self.index + 1))
+        self.file = open(os.path.join(self.directory, self.parts[self.index]["name"]), "rb")
+        self.digest = hashlib.sha256()
+        self.size = 0
+        return True
+
+    def _close_part(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        part = self.parts[self.index]
+        if self.size != part["bytes"] or self.digest.hexdigest() != part["sha256"]:
+            raise ChecksumError(f"Checksum mismatch in part {part['name']}: the file is damaged or incomplete")
+
+    def read(self, size=CHUNK_SIZE):
+        if size is None or size < 0:
+            size = CHUNK_SIZE
+        while True:
+            if self.file is None and not self._open_next():
+                return b""
+            data = self.file.read(size)
+            if data:
+                self.digest.update(data)
+                self.size += len(data)
+                return data
+            self._close_part()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.stopped.set()
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
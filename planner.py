@@ -0,0 +1,309 @@
+import math
+import os
+import shutil
+import subprocess
+
+from compression import CODECS, available_codecs, clamp_level
+from copy_engine import SPLIT_BYTES, qualified_name
+from core import default_jobs, query, resolve_jobs
+from history import TREND_WINDOW, load_history, mean, path_bytes
+from progress import MB, format_bytes, format_duration
+from selection import includes_data, is_empty
+from toolchain import chosen
+
+
+# The Plan step: one catalog query for table, TOAST and row sizes, plus the
+# local CPU count, the free space where the export goes and the history of
+# previous runs, turned into recommended export settings with an estimate of
+# how long the dump takes and how big it gets.
+
+# Below this much table data a single plain SQL file is the simplest choice
+SMALL_DATABASE = 1024 * 1024 * 1024
+# Parallel dumps run one sequential scan per job on the server
+MAX_JOBS = 8
+# Used when there's no history for this database: MB/s of one dump stream,
+# and output size per byte of dump for each codec
+ASSUMED_MB_PER_SECOND = 40
+ASSUMED_RATIOS = {"none": 1.0, "gzip": 0.30, "zstd": 0.25, "lz4": 0.45}
+# With few cores compression is the bottleneck, with little disk the output size is
+FAST_LEVELS = {"gzip": 1, "zstd": 1, "lz4": 0}
+SMALL_LEVELS = {"gzip": 9, "zstd": 9, "lz4": 9}
+# Room left on the target disk beyond the estimated output
+DISK_MARGIN = 0.10
+# A schema-only dump is about this much DDL per table
+SCHEMA_BYTES_PER_TABLE = 2048
+# One table holding more than this share of the data bounds a parallel dump
+DOMINANT_SHARE = 0.5
+LARGEST_TABLES = 5
+
+# Names are hex-encoded: they may contain "|", the column separator
+PLAN_SQL = """
+SELECT encode(convert_to(n.nspname, 'UTF8'), 'hex'), encode(convert_to(c.relname, 'UTF8'), 'hex'),
+       pg_relation_size(c.oid),
+       CASE WHEN c.reltoastrelid <> 0 THEN pg_total_relation_size(c.reltoastrelid) ELSE 0 END,
+       greatest(c.reltuples, 0)::bigint,
+       EXISTS (
+           SELECT 1 FROM pg_index i
+           JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+           WHERE i.indrelid = c.oid AND i.indisprimary AND i.indnatts = 1
+             AND a.atttypid IN ('int2'::regtype, 'int4'::regtype, 'int8'::regtype)
+       )
+FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind = 'r' AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+  AND n.nspname NOT LIKE 'pg_toast%' AND n.nspname NOT LIKE 'pg_temp%';
+"""
+
+
+def decode(value):
+    return bytes.fromhex(value.strip()).decode("utf-8")
+
+
+def catalog_tables(job, conn, selection=None):
+    # Tables whose data the export includes, largest first
+    tables = []
+    for schema, name, heap, toast, rows, pk in query(job, conn, PLAN_SQL):
+        schema, name = decode(schema), decode(name)
+        if not includes_data(selection, schema, name):
+            continue
+        tables.append({
+            "schema": schema, "name": name, "heap": int(heap), "toast": int(toast),
+            "bytes": int(heap) + int(toast), "rows": int(rows), "splittable": pk.strip() == "t",
+        })
+    tables.sort(key=lambda table: table["bytes"], reverse=True)
+    return tables
+
+
+def free_space(path):
+    # Free bytes on the disk path is (or will be) created on
+    directory = os.path.abspath(path or ".")
+    while not os.path.exists(directory):
+        directory = os.path.dirname(directory)
+    return directory, shutil.disk_usage(directory).free
+
+
+def past_exports(conn):
+    host = f"{conn['host']}:{conn['port']}"
+    return [
+        record for record in load_history()
+        if record.get("status") == "ok" and record.get("operation") == "export"
+        and record.get("host") == host and record.get("database") == conn["database"]
+    ]
+
+
+def history_rate(records, archive_format):
+    # MB/s of table data dumped over the latest runs in this format. mb_per_second
+    # is output bytes for directory archives, so the source rate (the plan's
+    # dump_bytes over the run's time, recorded for exports that were planned) is used.
+    runs = [
+        record for record in records
+        if record.get("mode") == archive_format and record.get("source_mb_per_second")
+    ]
+    return mean(record["source_mb_per_second"] for record in runs[-TREND_WINDOW:])
+
+
+def history_ratio(records, codec):
+    # Output size per byte of dump for this codec, from exports still on disk. Only
+    # plain and per-table exports count: they record the uncompressed stream size.
+    ratios = []
+    for record in records:
+        if record.get("mode") in ("plain", "copy") and record.get("flags", {}).get("compress", "none") == codec:
+            size = path_bytes(record.get("path"))
+            if size and record.get("bytes"):
+                ratios.append(size / record["bytes"])
+    return mean(ratios[-TREND_WINDOW:])
+
+
+def work_units(tables, archive_format):
+    # Streams a parallel export can run at once: one per table, big tables in
+    # per-table exports one per key range
+    if archive_format == "copy":
+        return sum(
+            math.ceil(table["bytes"] / SPLIT_BYTES) if table["splittable"] else 1
+            for table in tables if table["bytes"]
+        )
+    return sum(1 for table in tables if table["bytes"])
+
+
+def recommend_format(tables, data_bytes, cpus, export_type):
+    if export_type == "schema":
+        return "plain", "schema only: a single SQL file"
+    if data_bytes < SMALL_DATABASE:
+        return "plain", f"{format_bytes(data_bytes)} of data: a single SQL file is simplest"
+    if cpus == 1:
+        return "plain", "one CPU core: a parallel dump wouldn't be faster"
+    if any(table["bytes"] > SPLIT_BYTES and table["splittable"] for table in tables):
+        return "copy", "large tables with an integer key can be dumped in parallel key ranges"
+    return "directory", "pg_dump -j dumps tables in parallel and pg_restore -j restores them"
+
+
+def pg_dump_major(conn, warnings):
+    # Major version of the pg_dump the export will run, None if there's none that can
+    try:
+        pg_dump = chosen("pg_dump", conn)
+    except RuntimeError as e:
+        warnings.append(str(e))
+        return None
+    return pg_dump["version"][0] if pg_dump else None
+
+
+def recommend_codec(conn, archive_format, warnings):
+    if archive_format != "directory":
+        if "zstd" in available_codecs():
+            return "zstd", "zstd, the best ratio for its speed"
+        return "gzip", "gzip (install zstandard for zstd)"
+    # Directory archives are compressed by pg_dump itself, which needs version 16 for zstd
+    major = pg_dump_major(conn, warnings)
+    if major and major >= 16:
+        return "zstd", f"zstd, written by pg_dump {major}"
+    return "gzip", "gzip, pg_dump before 16 can't write zstd"
+
+
+def recommend_jobs(archive_format, units, cpus):
+    if archive_format in ("directory", "copy"):
+        return max(1, min(cpus, units, MAX_JOBS))
+    # Plain dumps are one stream; jobs are the compression (or repository hashing) threads
+    return cpus
+
+
+def plan_export(job, conn, target=None, export_type="full", selection=None,
+                archive_format=None, codec=None, level=None, jobs=None):
+    # Settings left as None are recommended; given ones are kept and estimated as
+    # they are. target is where the export will be written (for the free space).
+    job.status("Planning export...")
+    tables = catalog_tables(job, conn, selection)
+    cpus = default_jobs()
+    directory, free = free_space(target)
+    records = past_exports(conn)
+    reasons = []
+    warnings = []
+
+    heap = sum(table["heap"] for table in tables)
+    toast = sum(table["toast"] for table in tables)
+    data_bytes = 0 if export_type == "schema" else heap + toast
+
+    if archive_format is None:
+        archive_format, reason = recommend_format(tables, data_bytes, cpus, export_type)
+        reasons.append(f"format: {reason}")
+    units = work_units(tables, archive_format)
+    if codec is None:
+        codec, reason = recommend_codec(conn, archive_format, warnings)
+        reasons.append(f"compression: {reason}")
+    elif archive_format == "directory" and codec in ("zstd", "lz4"):
+        major = pg_dump_major(conn, warnings)
+        if major and major < 16:
+            warnings.append(f"pg_dump {major} can't write {codec} directory archives (16+ can)")
+    if jobs is not None:
+        jobs = resolve_jobs(jobs)
+    else:
+        jobs = recommend_jobs(archive_format, units, cpus)
+        reasons.append(f"jobs: {jobs} ({cpus} CPU cores, {units} tables or key ranges with data)")
+
+    # Output size: the dump is about as big as the table data, times the codec's ratio.
+    # pg_dump -Fd compresses with gzip unless told otherwise, so "none" still gets gzip's ratio there.
+    ratio_codec = "gzip" if archive_format == "directory" and codec == "none" else codec
+    ratio = history_ratio(records, ratio_codec)
+    ratio_source = "previous runs" if ratio else "assumed"
+    ratio = ratio or ASSUMED_RATIOS.get(ratio_codec, 1.0)
+    dump_bytes = data_bytes + SCHEMA_BYTES_PER_TABLE * len(tables)
+    output_bytes = int(dump_bytes * ratio)
+    fits = free >= output_bytes * (1 + DISK_MARGIN)
+
+    if codec != "none" and level is None:
+        if not fits:
+            level = SMALL_LEVELS[codec]
+            reasons.append(f"level: {level}, to save disk space")
+        elif cpus <= 2 and data_bytes >= SMALL_DATABASE:
+            level = FAST_LEVELS[codec]
+            reasons.append(f"level: {level}, compression would be the bottleneck on {cpus} cores")
+        else:
+            level = CODECS[codec]["default"]
+    level = clamp_level(codec, level) if codec != "none" else None
+
+    # Duration: the rate of previous runs in this format, else an assumed rate per stream
+    rate = history_rate(records, archive_format)
+    rate_source = "previous runs" if rate else "assumed"
+    if not rate:
+        streams = min(jobs, units) if archive_format in ("directory", "copy") else 1
+        rate = ASSUMED_MB_PER_SECOND * max(1, streams)
+    seconds = dump_bytes / MB / rate
+
+    split = []
+    if archive_format == "copy":
+        split = [
+            (table, math.ceil(table["bytes"] / SPLIT_BYTES))
+            for table in tables if table["bytes"] > SPLIT_BYTES and table["splittable"]
+        ]
+    if archive_format in ("directory", "copy") and tables and data_bytes:
+        largest = tables[0]
+        split_up = archive_format == "copy" and largest["splittable"]
+        if largest["bytes"] > data_bytes * DOMINANT_SHARE and not split_up:
+            warnings.append(
+                f"{qualified_name(largest['schema'], largest['name'])} holds "
+                f"{largest['bytes'] / data_bytes:.0%} of the data and is dumped by one job"
+            )
+    if not fits:
+        warnings.append(
+            f"Only {format_bytes(free)} free in {directory}; the export needs about {format_bytes(output_bytes)}"
+        )
+    if archive_format == "repository":
+        reasons.append("size: an upper bound, a repository only stores chunks it doesn't have yet")
+
+    return {
+        "database": conn["database"],
+        "export_type": export_type,
+        "selection": not is_empty(selection),
+        "tables": tables,
+        "rows": sum(table["rows"] for table in tables),
+        "heap_bytes": heap,
+        "toast_bytes": toast,
+        "dump_bytes": dump_bytes,
+        "cpus": cpus,
+        "directory": directory,
+        "free_bytes": free,
+        "history_runs": len(records),
+        "archive_format": archive_format,
+        "codec": codec,
+        "level": level,
+        "jobs": jobs,
+        "split": split,
+        "output_bytes": output_bytes,
+        "ratio_source": ratio_source,
+        "seconds": seconds,
+        "rate": rate,
+        "rate_source": rate_source,
+        "fits": fits,
+        "reasons": reasons,
+        "warnings": warnings,
+    }
+
+
+def try_plan(job, conn, *args, **kwargs):
+    # The plan is advice: if the catalog can't be read, the export goes ahead without one
+    try:
+        return plan_export(job, conn, *args, **kwargs)
+    except (subprocess.CalledProcessError, ValueError, IndexError, OSError):
+        return None
+
+
+def format_plan(plan):
+    level = f" level {plan['level']}" if plan["level"] is not None else ""
+    lines = [
+        f"Plan for {plan['database']} ({plan['export_type']}{', selected objects' if plan['selection'] else ''}):",
+        f"  {len(plan['tables'])} tables, ~{plan['rows']} rows, {format_bytes(plan['heap_bytes'])} heap + "
+        f"{format_bytes(plan['toast_bytes'])} TOAST",
+        f"  {plan['cpus']} CPU cores, {format_bytes(plan['free_bytes'])} free in {plan['directory']}, "
+        f"{plan['history_runs']} previous exports",
+        f"  settings: format {plan['archive_format']}, {plan['jobs']} jobs, compression {plan['codec']}{level}",
+        f"  estimate: {format_bytes(plan['output_bytes'])} written ({plan['ratio_source']} ratio), "
+        f"{format_duration(plan['seconds'])} at {plan['rate']:.0f} MB/s ({plan['rate_source']})",
+    ]
+    for table, parts in plan["split"]:
+        lines.append(f"  split: {qualified_name(table['schema'], table['name'])} "
+                     f"({format_bytes(table['bytes'])}) into {parts} key ranges")
+    for table in plan["tables"][:LARGEST_TABLES]:
+        if table["bytes"]:
+            lines.append(f"  largest: {qualified_name(table['schema'], table['name'])} "
+                         f"{format_bytes(table['heap'])} + {format_bytes(table['toast'])} TOAST, ~{table['rows']} rows")
+    lines += [f"  why: {reason}" for reason in plan["reasons"]]
+    lines += [f"  warning: {warning}" for warning in plan["warnings"]]
+    return "\n".join(lines)
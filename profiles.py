@@ -0,0 +1,192 @@
+import json
+import os
+import shutil
+
+
+KEYRING_SERVICE = "pg_import_export"
+# Overrides the per-user config directory (portable installs, tests, containers)
+CONFIG_DIR_ENV = "PG_IMPORT_EXPORT_HOME"
+# Where profiles used to live: the working directory the app was started from.
+# History and incremental fingerprints lived next to them and move along.
+LEGACY_PROFILES_FILE = "db_profiles.json"
+LEGACY_FILES = [LEGACY_PROFILES_FILE, "job_history.jsonl", "export_fingerprints.json"]
+
+
+def config_dir():
+    if os.environ.get(CONFIG_DIR_ENV):
+        return os.environ[CONFIG_DIR_ENV]
+    if os.name == "nt":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return os.path.join(base, "pg_import_export")
+
+
+PROFILES_FILE = os.path.join(config_dir(), "db_profiles.json")
+# The profile store in use (--profiles-file); history, caches and recovery files go next to it
+_active_file = PROFILES_FILE
+
+
+def use_profiles_file(path):
+    global _active_file
+    _active_file = path
+
+
+def sibling_path(name, profiles_file=None):
+    # Local caches and stores live next to the profile store
+    directory = os.path.dirname(os.path.abspath(profiles_file or _active_file))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, name)
+
+
+def migrate_legacy_files(path):
+    # First run after the move to the config directory; the old files are left in place
+    directory = os.path.dirname(os.path.abspath(path))
+    for name in LEGACY_FILES:
+        target = path if name == LEGACY_PROFILES_FILE else os.path.join(directory, name)
+        if os.path.exists(name) and not os.path.exists(target):
+            os.makedirs(directory, exist_ok=True)
+            shutil.copyfile(name, target)
+
+
+def load_profiles(path=PROFILES_FILE):
+    if path == PROFILES_FILE:
+        migrate_legacy_files(path)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def save_profiles(profiles, path=PROFILES_FILE):
+    # Written next to the store and renamed over it, so a crash mid-write never
+    # leaves a truncated profile file behind
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(profiles, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+
+def profile_group(profile):
+    # Profiles are grouped by an explicit "group" key, or else by server
+    return profile.get("group") or profile.get("host", "")
+
+
+class ProfileStore:
+    # All profiles stay in memory with a lower-cased search text per profile;
+    # the index is rebuilt on save, which is the only time profiles change
+    def __init__(self, path=PROFILES_FILE, profiles=None):
+        self.path = path
+        self.profiles = load_profiles(path) if profiles is None else profiles
+        self.saved = json.dumps(self.profiles, sort_keys=True)
+        self.reindex()
+
+    def reindex(self):
+        self.index = {
+            name: " ".join(
+                [name, profile.get("host", ""), profile.get("database", ""), profile.get("username", ""),
+                 profile_group(profile)]
+            ).lower()
+            for name, profile in self.profiles.items()
+        }
+
+    def __contains__(self, name):
+        return name in self.profiles
+
+    def __getitem__(self, name):
+        return self.profiles[name]
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def get(self, name, default=None):
+        return self.profiles.get(name, default)
+
+    def names(self):
+        return list(self.profiles)
+
+    def search(self, text="", group=None):
+        # Names matching every word of text (name, host, database, user or group) in group
+        words = text.lower().split()
+        return [
+            name for name, profile in self.profiles.items()
+            if (group is None or profile_group(profile) == group)
+            and all(word in self.index[name] for word in words)
+        ]
+
+    def groups(self):
+        # {group: [names]}, groups and names sorted
+        groups = {}
+        for name, profile in self.profiles.items():
+            groups.setdefault(profile_group(profile), []).append(name)
+        return {group: sorted(groups[group], key=str.lower) for group in sorted(groups, key=str.lower)}
+
+    def put(self, name, profile):
+        self.profiles[name] = profile
+        self.save()
+
+    def delete(self, name):
+        del self.profiles[name]
+        self.save()
+
+    def save(self):
+        # Unchanged stores aren't rewritten
+        self.reindex()
+        text = json.dumps(self.profiles, sort_keys=True)
+        if text == self.saved:
+            return
+        save_profiles(self.profiles, self.path)
+        self.saved = text
+
+
+def password_key(name, username):
+    # Create a unique key for this profile's password
+    return f"{name}_{username}"
+
+
+# keyring is imported lazily: some backends are slow to initialise and
+# headless runs that rely on ~/.pgpass never need it. Lookups (misses too)
+# are cached for the session, since some backends take hundreds of ms each.
+_passwords = {}
+
+
+def get_saved_password(name, profile):
+    if not profile.get("has_saved_password", False):
+        return None
+    key = password_key(name, profile["username"])
+    if key not in _passwords:
+        import keyring
+        _passwords[key] = keyring.get_password(KEYRING_SERVICE, key)
+    return _passwords[key]
+
+
+def set_saved_password(name, username, password):
+    import keyring
+    keyring.set_password(KEYRING_SERVICE, password_key(name, username), password)
+    _passwords[password_key(name, username)] = password
+
+
+def delete_saved_password(name, profile):
+    _passwords.pop(password_key(name, profile.get("username", "")), None)
+    if not profile.get("has_saved_password", False):
+        return
+    import keyring
+    try:
+        keyring.delete_password(KEYRING_SERVICE, password_key(name, profile["username"]))
+    except Exception:
+        pass  # Ignore errors when deleting password
+
+
+def connection_for(name, profile, password=None, database=None):
+    # Connection dict as used by core; password falls back to the keyring
+    return {
+        "host": profile["host"],
+        "port": str(profile["port"]),
+        "username": profile["username"],
+        "password": password if password is not None else get_saved_password(name, profile),
+        "database": database or profile.get("database", ""),
+    }
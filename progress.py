@@ -0,0 +1,136 @@
+import threading
+import time
+
+
+MB = 1024 * 1024
+
+# pg_dump ends every statement, including COPY ... FROM stdin, with ";" at end of line
+STATEMENT_TERMINATOR = b";\n"
+
+# Minimum seconds between two progress reports from the same meter
+REPORT_INTERVAL = 0.5
+
+
+def format_bytes(count):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if count < 1024:
+            return f"{count:.1f} {unit}" if unit != "B" else f"{count} B"
+        count /= 1024
+    return f"{count:.1f} TB"
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class Meter:
+    def __init__(self, label, total=0, report=None):
+        self.label = label
+        self.total = total
+        self.report = report
+        self.bytes = 0
+        self.statements = 0
+        self.started = time.monotonic()
+        self.last_report = 0
+        # Shown after the rate, e.g. why the export is throttled
+        self.note = ""
+        # Statement terminators can straddle chunk boundaries
+        self._tail = b""
+        # Parallel engines share one meter across worker threads
+        self._lock = threading.Lock()
+
+    def add_bytes(self, count):
+        with self._lock:
+            self.bytes += count
+        self.maybe_report()
+
+    def add_statements(self, count):
+        with self._lock:
+            self.statements += count
+
+    def scan(self, data):
+        # A terminator split across two chunks is caught via the carried-over byte
+        window = self._tail + data
+        self.statements += window.count(STATEMENT_TERMINATOR)
+        self._tail = b";" if data.endswith(b";") else b""
+
+    def elapsed(self):
+        return max(time.monotonic() - self.started, 1e-6)
+
+    def rate(self):
+        return self.bytes / self.elapsed()
+
+    def fraction(self):
+        # Estimates can be off, so never claim completion before the job ends
+        if not self.total:
+            return None
+        return min(self.bytes / self.total, 0.99)
+
+    def eta(self):
+        rate = self.rate()
+        if not self.total or not rate or self.bytes >= self.total:
+            return None
+        return (self.total - self.bytes) / rate
+
+    def describe(self):
+        text = f"{self.label}: {format_bytes(self.bytes)}"
+        if self.total:
+            text += f" / {format_bytes(self.total)} ({self.fraction() * 100:.0f}%)"
+        text += f" at {self.rate() / MB:.1f} MB/s"
+        if self.note:
+            text += f" ({self.note})"
+        eta = self.eta()
+        if eta is not None:
+            text += f", ETA {format_duration(eta)}"
+        if self.statements:
+            text += f", {self.statements} statements"
+        return text
+
+    def maybe_report(self, force=False):
+        now = time.monotonic()
+        if self.report and (force or now - self.last_report >= REPORT_INTERVAL):
+            self.last_report = now
+            self.report(self.fraction(), self.describe())
+
+
+class MeteredReader:
+    # Wraps a binary file object; counts bytes read and optionally scans for statements
+    def __init__(self, source, meter, count_bytes=True, count_statements=False):
+        self.source = source
+        self.meter = meter
+        self.count_bytes = count_bytes
+        self.count_statements = count_statements
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        if self.count_statements:
+            self.meter.scan(data)
+        if self.count_bytes:
+            self.meter.add_bytes(len(data))
+        return data
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self.source.close()
+
+
+class MeteredWriter:
+    def __init__(self, target, meter, count_statements=False):
+        self.target = target
+        self.meter = meter
+        self.count_statements = count_statements
+
+    def write(self, data):
+        written = self.target.write(data)
+        if self.count_statements:
+            self.meter.scan(data)
+        self.meter.add_bytes(len(data))
+        return written
+
+    def flush(self):
+        self.target.flush()
@@ -0,0 +1,421 @@
+import hashlib
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import accumulate, compress, repeat
+from operator import add, lt, mul
+from zlib import crc32
+
+from compression import CHUNK_SIZE, clamp_level, compress_chunk, decompress_chunk, default_threads, require_codec
+from parts import ChecksumError
+
+
+# A backup repository keeps every distinct chunk of dump data once, in a file
+# named by its SHA-256; a backup is a manifest listing its chunks in order.
+# Successive dumps of a database are mostly the same bytes, so each new backup
+# only writes the chunks that changed.
+REPOSITORY_FILE = "repository.json"
+CHUNKS_DIR = "chunks"
+BACKUPS_DIR = "backups"
+
+# Chunks end at line ends picked by their content, not at fixed offsets, so
+# rows added or removed early in a dump only change the chunks around them
+MIN_CHUNK = 64 * 1024
+AVG_CHUNK = 512 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+# A line ends a chunk when crc32(line) < len(line) * CUT_THRESHOLD: about one
+# cut per AVG_CHUNK bytes, however long the lines are
+CUT_THRESHOLD = 2 ** 32 // AVG_CHUNK
+# Unreferenced chunks are only deleted once this old (seconds): a backup being
+# written has no manifest yet, and reused chunks get their mtime refreshed
+GC_GRACE = 24 * 3600
+# How long to wait for another export to finish setting up a new repository
+INIT_WAIT = 30
+
+
+def write_json(path, data):
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f, indent=4)
+    os.replace(path + ".tmp", path)
+
+
+def is_repository(path):
+    return os.path.isfile(os.path.join(path, REPOSITORY_FILE))
+
+
+def repository_of(backup_path):
+    return os.path.dirname(os.path.dirname(os.path.abspath(backup_path)))
+
+
+def is_backup(path):
+    # A backup is opened by its manifest, <repository>/backups/<name>.json
+    return (
+        os.path.isfile(path) and path.endswith(".json")
+        and os.path.basename(os.path.dirname(os.path.abspath(path))) == BACKUPS_DIR
+        and is_repository(repository_of(path))
+    )
+
+
+def read_config(path):
+    with open(os.path.join(path, REPOSITORY_FILE), "r") as f:
+        return json.load(f)
+
+
+def open_repository(path, codec="none", level=None):
+    # Created on first use; the chunk codec is fixed from then on
+    if not is_repository(path):
+        create_repository(path, codec, level)
+    return read_config(path)
+
+
+def create_repository(path, codec, level):
+    # Several exports may start on a new repository at once (batch exports all
+    # default to <profile>.repo), so it is built in a temporary directory and
+    # renamed into place: only one rename wins, and the others use its result
+    if codec != "none":
+        require_codec(codec)
+    config = {
+        "version": 1,
+        "codec": codec,
+        "level": clamp_level(codec, level) if codec != "none" else None,
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    path = os.path.abspath(path)
+    temp = os.path.join(
+        os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.init"
+    )
+    try:
+        os.makedirs(os.path.join(temp, CHUNKS_DIR))
+        os.makedirs(os.path.join(temp, BACKUPS_DIR))
+        write_json(os.path.join(temp, REPOSITORY_FILE), config)
+        try:
+            # An empty directory (e.g. from the folder picker) is taken over;
+            # rename won't replace one on Windows
+            os.rmdir(path)
+        except OSError:
+            pass
+        try:
+            os.rename(temp, path)
+            return
+        except OSError:
+            pass  # Another export got there first, or the directory isn't empty
+    finally:
+        shutil.rmtree(temp, ignore_errors=True)
+
+    # A directory without repository.json may still be being set up
+    deadline = time.time() + INIT_WAIT
+    while not is_repository(path):
+        if time.time() >= deadline:
+            raise ValueError(f"Not a backup repository, and not empty: {path}")
+        time.sleep(0.5)
+
+
+def chunk_path(path, digest):
+    return os.path.join(path, CHUNKS_DIR, digest[:2], digest)
+
+
+def backup_name(path, database):
+    name = f"{database}_{datetime.now():%Y%m%d_%H%M%S}"
+    candidate, suffix = name, 1
+    while os.path.exists(os.path.join(path, BACKUPS_DIR, candidate + ".json")):
+        suffix += 1
+        candidate = f"{name}_{suffix}"
+    return candidate
+
+
+class Chunker:
+    # Cuts a byte stream into content-defined chunks, fed in blocks of any size
+    def __init__(self):
+        self.pieces = []
+        self.size = 0
+        # Incomplete last line of the previous block
+        self.line = b""
+
+    def feed(self, data):
+        # Returns the chunks completed by data. The per-line work (split, CRC,
+        # threshold test) is chained through map/compress instead of a Python
+        # loop; Python only visits the cut points.
+        chunks = []
+        block = self.line + data
+        lines = block.split(b"\n")
+        del lines[-1]
+        sizes = list(map(add, map(len, lines), repeat(1)))
+        ends = list(accumulate(sizes))
+        # crc32 of each line with its "\n", against its length * CUT_THRESHOLD
+        crcs = map(crc32, repeat(b"\n"), map(crc32, lines))
+        candidates = list(compress(ends, map(lt, crcs, map(mul, sizes, repeat(CUT_THRESHOLD)))))
+        start = 0
+        first = 0
+        while True:
+            # The chunk began self.size bytes before start; it ends at the first
+            # candidate past MIN_CHUNK, or the first line end past MAX_CHUNK
+            base = start - self.size
+            first = bisect_left(candidates, base + MIN_CHUNK, first)
+            forced = bisect_left(ends, base + MAX_CHUNK)
+            cuts = candidates[first:first + 1] + ends[forced:forced + 1]
+            if not cuts:
+                break
+            end = min(cuts)
+            chunks.append(b"".join(self.pieces) + block[start:end])
+            self.pieces, self.size, start = [], 0, end
+
+        line_start = ends[-1] if ends else 0
+        if line_start > start:
+            self.pieces.append(block[start:line_start])
+            self.size += line_start - start
+        self.line = block[line_start:]
+        # Data without line ends (huge values, binary) is cut at MAX_CHUNK
+        while self.size + len(self.line) >= MAX_CHUNK:
+            take = MAX_CHUNK - self.size
+            chunks.append(b"".join(self.pieces) + self.line[:take])
+            self.pieces, self.size, self.line = [], 0, self.line[take:]
+        return chunks
+
+    def finish(self):
+        data = b"".join(self.pieces) + self.line
+        self.pieces, self.size, self.line = [], 0, b""
+        return data or None
+
+
+def store_chunk(path, config, data):
+    # (digest, size, bytes written): 0 written when the chunk was already stored
+    digest = hashlib.sha256(data).hexdigest()
+    target = chunk_path(path, digest)
+    if os.path.exists(target):
+        os.utime(target)
+        return digest, len(data), 0
+    stored = compress_chunk(config["codec"], config["level"], data) if config["codec"] != "none" else data
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp, "wb") as f:
+        f.write(stored)
+    os.replace(temp, target)
+    return digest, len(data), len(stored)
+
+
+def load_chunk(path, config, digest, size):
+    with open(chunk_path(path, digest), "rb") as f:
+        data = f.read()
+    if config["codec"] != "none":
+        try:
+            data = decompress_chunk(config["codec"], data)
+        except Exception as e:
+            raise ChecksumError(f"Chunk {digest} can't be decompressed, the repository is damaged: {e}")
+    if len(data) != size or hashlib.sha256(data).hexdigest() != digest:
+        raise ChecksumError(f"Checksum mismatch in chunk {digest}: the repository is damaged")
+    return data
+
+
+class BackupWriter:
+    # File-like target for a dump: the stream is cut into chunks on a thread of
+    # its own, and chunks are hashed, compressed and stored on a thread pool while
+    # pg_dump keeps writing. The manifest is written last, so a failed export
+    # leaves no backup behind, only chunks a later one can reuse.
+    def __init__(self, path, name, info, threads=None):
+        self.path = path
+        self.config = read_config(path)
+        self.name = name
+        self.info = info
+        self.chunker = Chunker()
+        threads = threads or default_threads()
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.pending = deque()
+        self.max_pending = 2 * threads
+        self.chunks = []
+        self.bytes = 0
+        self.new_chunks = 0
+        self.stored_bytes = 0
+        self.blocks = queue.Queue(maxsize=4)
+        self.stopped = threading.Event()
+        self.failure = []
+        self.thread = threading.Thread(target=self._chunk, daemon=True)
+        self.thread.start()
+
+    def write(self, data):
+        if self.failure:
+            raise self.failure[0]
+        self.blocks.put(bytes(data))
+
+    def _chunk(self):
+        data = b""
+        try:
+            while data is not None:
+                data = self.blocks.get()
+                if data and not self.stopped.is_set():
+                    for chunk in self.chunker.feed(data):
+                        self._submit(chunk)
+            if not self.stopped.is_set():
+                last = self.chunker.finish()
+                if last:
+                    self._submit(last)
+                while self.pending:
+                    self._collect()
+        except BaseException as e:
+            self.failure.append(e)
+            # Keep taking blocks until the end, so write() can't block on a full queue
+            while data is not None:
+                data = self.blocks.get()
+
+    def _submit(self, chunk):
+        self.pending.append(self.pool.submit(store_chunk, self.path, self.config, chunk))
+        while len(self.pending) >= self.max_pending:
+            self._collect()
+
+    def _collect(self):
+        digest, size, stored = self.pending.popleft().result()
+        self.chunks.append([digest, size])
+        self.bytes += size
+        if stored:
+            self.new_chunks += 1
+            self.stored_bytes += stored
+
+    def close(self):
+        self.blocks.put(None)
+        self.thread.join()
+        self.pool.shutdown()
+        if self.failure:
+            raise self.failure[0]
+        manifest = dict(
+            self.info,
+            name=self.name,
+            created=datetime.now().isoformat(timespec="seconds"),
+            bytes=self.bytes,
+            new_chunks=self.new_chunks,
+            stored_bytes=self.stored_bytes,
+            chunks=self.chunks,
+        )
+        write_json(os.path.join(self.path, BACKUPS_DIR, self.name + ".json"), manifest)
+
+    def abort(self):
+        self.stopped.set()
+        self.blocks.put(None)
+        self.thread.join()
+        for future in self.pending:
+            future.cancel()
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_backup(backup_path):
+    with open(backup_path, "r") as f:
+        return json.load(f)
+
+
+def backup_bytes(backup_path):
+    return read_backup(backup_path)["bytes"]
+
+
+class BackupReader:
+    # Streams a backup's chunks back in order; a few chunks ahead are read,
+    # decompressed and checked against their SHA-256 on worker threads
+    def __init__(self, backup_path, threads=4):
+        self.path = repository_of(backup_path)
+        self.config = read_config(self.path)
+        self.entries = iter(read_backup(backup_path)["chunks"])
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.pending = deque()
+        self.max_pending = 2 * threads
+        self.buffer = memoryview(b"")
+        self._fill()
+
+    def _fill(self):
+        while len(self.pending) < self.max_pending:
+            entry = next(self.entries, None)
+            if entry is None:
+                return
+            self.pending.append(self.pool.submit(load_chunk, self.path, self.config, *entry))
+
+    def read(self, size=CHUNK_SIZE):
+        if size is None or size < 0:
+            size = CHUNK_SIZE
+        while not len(self.buffer):
+            if not self.pending:
+                return b""
+            self.buffer = memoryview(self.pending.popleft().result())
+            self._fill()
+        data = bytes(self.buffer[:size])
+        self.buffer = self.buffer[size:]
+        return data
+
+    def close(self):
+        for future in self.pending:
+            future.cancel()
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def list_backups(path):
+    # Manifests without their chunk lists, oldest first
+    backups = []
+    directory = os.path.join(path, BACKUPS_DIR)
+    for name in os.listdir(directory):
+        if name.endswith(".json"):
+            manifest = read_backup(os.path.join(directory, name))
+            manifest["chunk_count"] = len(manifest.pop("chunks"))
+            manifest["path"] = os.path.join(directory, name)
+            backups.append(manifest)
+    backups.sort(key=lambda backup: backup["created"])
+    return backups
+
+
+def stored_bytes(path):
+    total = 0
+    for root, _, names in os.walk(os.path.join(path, CHUNKS_DIR)):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+    return total
+
+
+def prune(path, keep_days=None, keep_last=None):
+    # Drops backups older than keep_days, except each database's keep_last
+    # newest, then deletes the chunks no remaining backup uses.
+    # Returns (backups removed, chunks deleted, bytes freed).
+    backups = list_backups(path)
+    removed = []
+    if keep_days is not None:
+        cutoff = datetime.now() - timedelta(days=keep_days)
+        by_database = {}
+        for backup in backups:
+            by_database.setdefault(backup.get("database"), []).append(backup)
+        for runs in by_database.values():
+            protected = runs[-keep_last:] if keep_last else []
+            for backup in runs:
+                if backup not in protected and datetime.fromisoformat(backup["created"]) < cutoff:
+                    os.remove(backup["path"])
+                    removed.append(backup["name"])
+
+    referenced = set()
+    directory = os.path.join(path, BACKUPS_DIR)
+    for name in os.listdir(directory):
+        if name.endswith(".json"):
+            referenced.update(digest for digest, size in read_backup(os.path.join(directory, name))["chunks"])
+
+    deleted, freed = 0, 0
+    cutoff = time.time() - GC_GRACE
+    for root, _, names in os.walk(os.path.join(path, CHUNKS_DIR)):
+        for name in names:
+            chunk = os.path.join(root, name)
+            if name not in referenced and os.path.getmtime(chunk) < cutoff:
+                freed += os.path.getsize(chunk)
+                os.remove(chunk)
+                deleted += 1
+    return removed, deleted, freed
@@ -0,0 +1,358 @@
+import itertools
+import json
+import os
+import queue
+import re
+import subprocess
+import threading
+from datetime import datetime
+
+from compression import CHUNK_SIZE, open_decompressed
+from core import pg_env, psql_command
+from progress import Meter, MeteredReader
+
+
+CHECKPOINT_SUFFIX = ".checkpoint.json"
+BATCH_STATEMENTS = 1000
+BATCH_BYTES = 64 * 1024 * 1024
+
+# Tokens that change the lexical state outside of quotes and comments
+NEUTRAL_RE = re.compile(rb"""(?<![\w$])[Ee]'|'|"|\$(?:[A-Za-z_][A-Za-z_0-9]*)?\$|--|/\*|;""")
+COMMENT_RE = re.compile(rb"/\*|\*/")
+ESCAPE_STRING_RE = re.compile(rb"\\.|'", re.S)
+
+COPY_RE = re.compile(rb"^\s*COPY\b[^;]*\bFROM\s+stdin\s*;\s*$", re.I | re.M)
+COPY_END = (b"\\.\n", b"\\.\r\n", b"\\.")
+# Session settings are statements that start with SET or set_config, after any
+# leading comments; a SET clause inside e.g. CREATE FUNCTION doesn't count
+LEADING_RE = rb"(?:\s+|--[^\n]*|/\*.*?\*/)*"
+SET_RE = re.compile(LEADING_RE + rb"SET\s+(?:SESSION\s+)?(?!LOCAL\b)([\w.]+)", re.I | re.S)
+SET_CONFIG_RE = re.compile(LEADING_RE + rb"SELECT\s+(?:pg_catalog\.)?set_config\('([^']+)'", re.I | re.S)
+
+# Statements PostgreSQL refuses to run inside a transaction block
+NON_TRANSACTIONAL_RE = re.compile(
+    rb"^\s*(?:(?:CREATE|DROP|ALTER)\s+DATABASE|(?:CREATE|DROP)\s+TABLESPACE|VACUUM|ALTER\s+SYSTEM"
+    rb"|CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY|REINDEX\b[^;]*\bCONCURRENTLY)\b",
+    re.I | re.M
+)
+
+_markers = itertools.count()
+
+
+def checkpoint_path(filename):
+    return filename + CHECKPOINT_SUFFIX
+
+
+def file_identity(filename):
+    stat = os.stat(filename)
+    return {"file": os.path.abspath(filename), "size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+def load_checkpoint(filename):
+    # Only valid for the exact file it was written for
+    path = checkpoint_path(filename)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        checkpoint = json.load(f)
+    identity = file_identity(filename)
+    if any(checkpoint.get(key) != value for key, value in identity.items()):
+        return None
+    return checkpoint
+
+
+def save_checkpoint(filename, checkpoint):
+    path = checkpoint_path(filename)
+    checkpoint = dict(checkpoint, updated=datetime.now().isoformat(timespec="seconds"), **file_identity(filename))
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f, indent=4)
+    os.replace(path + ".tmp", path)
+
+
+def clear_checkpoint(filename):
+    if os.path.exists(checkpoint_path(filename)):
+        os.remove(checkpoint_path(filename))
+
+
+def read_lines(source):
+    # readline() for any stream with read(), including the decompressors
+    pending = b""
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            if pending:
+                yield pending
+            return
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + b"\n"
+
+
+def skip_bytes(source, count):
+    while count > 0:
+        chunk = source.read(min(count, CHUNK_SIZE))
+        if not chunk:
+            raise ValueError("Import file is shorter than its checkpoint")
+        count -= len(chunk)
+
+
+def find_statement_end(line, state):
+    # Returns the index just past a statement-ending ';' in line, or None.
+    # state is [mode, tag, depth], carried across lines: mode is None, "'", "E'",
+    # '"', "$" (dollar quote with tag) or "/*" (nested to depth).
+    pos = 0
+    while pos < len(line):
+        mode = state[0]
+        if mode is None:
+            match = NEUTRAL_RE.search(line, pos)
+            if not match:
+                return None
+            token = match.group()
+            pos = match.end()
+            if token == b";":
+                return pos
+            if token == b"--":
+                return None
+            if token == b"/*":
+                state[:] = ["/*", None, 1]
+            elif token in (b"'", b'"'):
+                state[:] = [token.decode(), None, 0]
+            elif token[1:] == b"'":
+                state[:] = ["E'", None, 0]
+            else:
+                state[:] = ["$", token, 0]
+        elif mode in ("'", '"'):
+            # A doubled quote closes and immediately reopens, which comes out the same
+            end = line.find(mode.encode(), pos)
+            if end < 0:
+                return None
+            pos = end + 1
+            state[0] = None
+        elif mode == "E'":
+            match = ESCAPE_STRING_RE.search(line, pos)
+            while match and match.group() != b"'":
+                match = ESCAPE_STRING_RE.search(line, match.end())
+            if not match:
+                return None
+            pos = match.end()
+            state[0] = None
+        elif mode == "$":
+            end = line.find(state[1], pos)
+            if end < 0:
+                return None
+            pos = end + len(state[1])
+            state[:] = [None, None, 0]
+        else:
+            match = COMMENT_RE.search(line, pos)
+            if not match:
+                return None
+            pos = match.end()
+            state[2] += 1 if match.group() == b"/*" else -1
+            if state[2] == 0:
+                state[:] = [None, None, 0]
+    return None
+
+
+def only_comments(lines):
+    return all(not line.strip() or line.lstrip().startswith(b"--") for line in lines)
+
+
+def split_statements(source, offset=0, copy_header=None, copy_chunk_bytes=BATCH_BYTES):
+    # Streams (kind, data, end_offset, open_copy) units out of a plain SQL dump.
+    # kind is "sql", "meta" (a psql backslash command) or "copy" (a COPY with its
+    # data); big COPY blocks are cut into several COPYs of copy_chunk_bytes each,
+    # and open_copy is the header to resume with when a block continues.
+    state = [None, None, 0]
+    buffered = []
+    rows = []
+    row_bytes = 0
+
+    def copy_unit(end, more):
+        return ("copy", copy_header + b"".join(rows) + b"\\.\n", end, copy_header if more else None)
+
+    for line in read_lines(source):
+        line_start = offset
+        offset += len(line)
+
+        if copy_header is not None:
+            if line in COPY_END:
+                yield copy_unit(offset, False)
+                copy_header, rows, row_bytes = None, [], 0
+            else:
+                rows.append(line)
+                row_bytes += len(line)
+                if row_bytes >= copy_chunk_bytes:
+                    yield copy_unit(offset, True)
+                    rows, row_bytes = [], 0
+            continue
+
+        if state[0] is None and only_comments(buffered) and line.startswith(b"\\"):
+            yield ("meta", b"".join(buffered) + line, offset, None)
+            buffered = []
+            continue
+
+        while line:
+            end = find_statement_end(line, state)
+            if end is None:
+                buffered.append(line)
+                break
+            statement = b"".join(buffered) + line[:end]
+            buffered = []
+            line, line_start = line[end:], line_start + end
+            if not line.strip():
+                # Keep the newline with the statement so offsets land on line starts
+                statement, line_start, line = statement + line, line_start + len(line), b""
+            if COPY_RE.search(statement):
+                copy_header = statement.lstrip(b"\n") if statement.endswith(b"\n") else statement + b"\n"
+            else:
+                yield ("sql", statement, line_start, None)
+
+    if copy_header is not None and rows:
+        yield copy_unit(offset, False)
+    elif b"".join(buffered).strip():
+        yield ("sql", b"".join(buffered), offset, None)
+
+
+def session_key(kind, data):
+    # Statements that configure the session must be replayed when resuming
+    if kind == "meta":
+        command = data.strip().splitlines()[-1].split()[0].decode()
+        if command in ("\\c", "\\connect"):
+            return "\\connect"
+        # pg_dump's restricted mode (\restrict ... \unrestrict) must be re-entered too
+        return command if command in ("\\restrict", "\\unrestrict") else None
+    if kind != "sql":
+        return None
+    match = SET_RE.match(data) or SET_CONFIG_RE.match(data)
+    return match.group(1).decode().lower() if match else None
+
+
+class Session:
+    def __init__(self, job, conn):
+        # Syncs use a plain SELECT rather than \echo, which pg_dump's \restrict mode forbids.
+        # stdout is drained on a thread, so query output can never fill the pipe.
+        self.job = job
+        self.process = job.start(
+            psql_command(conn, "-X", "-q", "-t", "-A", "-v", "ON_ERROR_STOP=1"),
+            env=pg_env(conn), stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        self.output = queue.Queue()
+        threading.Thread(target=self.drain, daemon=True).start()
+        self.in_transaction = False
+
+    def drain(self):
+        for line in self.process.stdout:
+            self.output.put(line.strip())
+        self.output.put(None)
+
+    def write(self, data):
+        try:
+            self.process.stdin.write(data)
+        except BrokenPipeError:
+            self.fail()
+
+    def begin(self):
+        if not self.in_transaction:
+            self.write(b"BEGIN;\n")
+            self.in_transaction = True
+
+    def sync(self):
+        # Commits any open transaction and waits until psql has executed everything sent
+        if self.in_transaction:
+            self.write(b"COMMIT;\n")
+            self.in_transaction = False
+        marker = f"__pg_import_export_sync_{next(_markers)}__".encode()
+        self.write(b"SELECT '" + marker + b"';\n")
+        try:
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            self.fail()
+        while True:
+            line = self.output.get()
+            if line is None:
+                self.fail()
+            if line == marker:
+                return
+
+    def fail(self):
+        # psql stopped on an error; finish() raises with its stderr
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.job.finish(self.process)
+        raise subprocess.CalledProcessError(self.process.returncode, self.process.args)
+
+    def close(self):
+        self.sync()
+        self.process.stdin.close()
+        self.job.finish(self.process)
+
+
+def import_batches(job, conn, filename, codec=None, batch_statements=BATCH_STATEMENTS,
+                   batch_bytes=BATCH_BYTES, resume=False):
+    # Commits every batch_statements statements or batch_bytes of SQL and records
+    # the position reached in a sidecar checkpoint; a failed import started again
+    # with resume=True skips everything up to the last committed batch
+    checkpoint = load_checkpoint(filename) if resume else None
+    if checkpoint is None:
+        checkpoint = {"offset": 0, "statement": 0, "session": {}, "copy": None}
+    start = checkpoint["offset"]
+
+    meter = Meter("Importing database", os.path.getsize(filename), job.progress)
+    with open(filename, "rb") as raw:
+        if start and not codec:
+            raw.seek(start)
+            meter.add_bytes(start)
+        source = MeteredReader(raw, meter)
+        if codec:
+            source = open_decompressed(source, codec)
+            if start:
+                job.status(f"Skipping to statement {checkpoint['statement']}...")
+                skip_bytes(source, start)
+        if start:
+            job.status(f"Resuming at statement {checkpoint['statement']}")
+
+        session = Session(job, conn)
+        for statement in checkpoint["session"].values():
+            session.write(statement.encode() + b"\n")
+
+        copy_header = checkpoint["copy"].encode() if checkpoint["copy"] else None
+        index = checkpoint["statement"]
+        settings = dict(checkpoint["session"])
+        pending = pending_bytes = 0
+        for kind, data, end, open_copy in split_statements(source, start, copy_header, batch_bytes):
+            job.check_cancelled()
+            key = session_key(kind, data)
+            standalone = kind == "meta" or (kind == "sql" and NON_TRANSACTIONAL_RE.search(data))
+            if standalone:
+                session.sync()
+            else:
+                session.begin()
+            session.write(data if data.endswith(b"\n") else data + b"\n")
+
+            index += 1
+            pending += 1
+            pending_bytes += len(data)
+            meter.add_statements(1)
+            if key == "\\connect":
+                settings = {}
+            if key == "\\unrestrict":
+                settings.pop("\\restrict", None)
+            elif key:
+                settings[key] = data.decode(errors="replace").strip()
+
+            if standalone or pending >= batch_statements or pending_bytes >= batch_bytes:
+                session.sync()
+                save_checkpoint(filename, {
+                    "offset": end,
+                    "statement": index,
+                    "session": settings,
+                    "copy": open_copy.decode() if open_copy else None,
+                })
+                pending = pending_bytes = 0
+
+        session.close()
+    clear_checkpoint(filename)
+    return meter
@@ -0,0 +1,212 @@
+import os
+import re
+import subprocess
+import tempfile
+
+from core import pg_env, query
+from toolchain import client
+
+
+# A selection limits an export or archive restore to some schemas and tables:
+#   schemas / tables:   only these (pg_dump -n / -t); empty means everything
+#   exclude_schemas:    pg_dump -N
+#   exclude_tables:     pg_dump -T
+#   exclude_data:       definition only, pg_dump --exclude-table-data
+# Schemas are names, tables are [schema, table] pairs.
+SELECTION_KEYS = ["schemas", "tables", "exclude_schemas", "exclude_tables", "exclude_data"]
+
+OBJECTS_SQL = """
+SELECT n.nspname, c.relname, greatest(c.reltuples, 0)::bigint, pg_total_relation_size(c.oid)
+FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN ('r', 'p', 'm') AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+  AND n.nspname NOT LIKE 'pg_toast%' AND n.nspname NOT LIKE 'pg_temp%'
+  AND NOT c.relispartition
+ORDER BY n.nspname, c.relname;
+"""
+
+# pg_restore -l lines: "<id>; <catalog oid> <oid> <type> <schema> <tag> <owner>"
+TOC_LINE_RE = re.compile(r"^\d+;\s+\d+\s+\d+\s+(.*)$")
+# Multi-word types first, so "TABLE DATA" isn't read as "TABLE"
+TOC_TYPES = [
+    "MATERIALIZED VIEW DATA", "SEQUENCE OWNED BY", "DATABASE PROPERTIES", "PUBLICATION TABLE",
+    "MATERIALIZED VIEW", "FK CONSTRAINT", "SEQUENCE SET", "TABLE ATTACH", "INDEX ATTACH",
+    "ROW SECURITY", "TABLE DATA", "DEFAULT ACL",
+]
+# Types whose tag is the table itself, and types whose tag starts with the table name
+TABLE_TAGS = {"TABLE", "TABLE DATA", "TABLE ATTACH", "VIEW", "MATERIALIZED VIEW", "MATERIALIZED VIEW DATA"}
+TABLE_PREFIXED_TAGS = {"CONSTRAINT", "FK CONSTRAINT", "TRIGGER", "POLICY", "RULE", "DEFAULT", "ROW SECURITY"}
+DATA_TYPES = {"TABLE DATA", "MATERIALIZED VIEW DATA"}
+SEQUENCE_TYPES = {"SEQUENCE", "SEQUENCE SET", "SEQUENCE OWNED BY"}
+CREATE_INDEX_RE = re.compile(r"^CREATE (?:UNIQUE )?INDEX (\S+) ON (?:ONLY )?(\S+?)\.(\S+) ", re.M)
+
+
+def empty_selection():
+    return {key: [] for key in SELECTION_KEYS}
+
+
+def is_empty(selection):
+    return not selection or not any(selection.get(key) for key in SELECTION_KEYS)
+
+
+def describe(selection):
+    if is_empty(selection):
+        return "All objects"
+    parts = []
+    for key, label in [
+        ("schemas", "schemas"), ("tables", "tables"), ("exclude_schemas", "schemas excluded"),
+        ("exclude_tables", "tables excluded"), ("exclude_data", "without data"),
+    ]:
+        if selection.get(key):
+            parts.append(f"{len(selection[key])} {label}")
+    return ", ".join(parts)
+
+
+def pattern(*names):
+    # Double-quoted pg_dump patterns match literally, whatever the case or special characters
+    return ".".join('"' + name.replace('"', '""') + '"' for name in names)
+
+
+def selection_args(selection):
+    if is_empty(selection):
+        return []
+    args = []
+    for schema in selection.get("schemas", []):
+        args += ["-n", pattern(schema)]
+    for schema, table in selection.get("tables", []):
+        args += ["-t", pattern(schema, table)]
+    for schema in selection.get("exclude_schemas", []):
+        args += ["-N", pattern(schema)]
+    for schema, table in selection.get("exclude_tables", []):
+        args += ["-T", pattern(schema, table)]
+    for schema, table in selection.get("exclude_data", []):
+        args += ["--exclude-table-data", pattern(schema, table)]
+    return args
+
+
+def includes(selection, schema, table=None):
+    # Same rules as pg_dump: exclusions win, and any -n/-t limits to what was named
+    if is_empty(selection):
+        return True
+    if schema in selection.get("exclude_schemas", []):
+        return False
+    if table is not None and [schema, table] in selection.get("exclude_tables", []):
+        return False
+    if not selection.get("schemas") and not selection.get("tables"):
+        return True
+    if schema in selection.get("schemas", []):
+        return True
+    if table is None:
+        return any(entry[0] == schema for entry in selection.get("tables", []))
+    return [schema, table] in selection.get("tables", [])
+
+
+def includes_data(selection, schema, table):
+    return includes(selection, schema, table) and [schema, table] not in (selection or {}).get("exclude_data", [])
+
+
+def list_objects(job, conn):
+    # (schema, table, estimated rows, total bytes) for the picker
+    return [
+        (schema, name, int(rows), int(size)) for schema, name, rows, size in query(job, conn, OBJECTS_SQL)
+    ]
+
+
+def read_toc(job, conn, filename):
+    result = job.run(
+        [client("pg_restore"), "-l", filename],
+        env=pg_env(conn), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    return result.stdout.splitlines()
+
+
+def parse_toc_line(line):
+    # (type, schema, tag) or None for comments
+    match = TOC_LINE_RE.match(line)
+    if not match:
+        return None
+    rest = match.group(1)
+    toc_type = next((name for name in TOC_TYPES if rest.startswith(name + " ")), rest.split(" ", 1)[0])
+    fields = rest[len(toc_type):].split()
+    if len(fields) < 2:
+        return toc_type, "-", ""
+    # The owner is the last word, unless it's empty: pg_restore then ends the
+    # line with the separating space ("TABLE DATA public my table ")
+    words = fields[1:] if rest.endswith(" ") or len(fields) == 2 else fields[1:-1]
+    return toc_type, fields[0], " ".join(words)
+
+
+def toc_objects(job, conn, filename):
+    # The picker's object list for an archive; sizes aren't known there
+    objects = []
+    for line in read_toc(job, conn, filename):
+        entry = parse_toc_line(line)
+        if entry and entry[0] in ("TABLE", "MATERIALIZED VIEW"):
+            objects.append((entry[1], entry[2], None, None))
+    return objects
+
+
+def index_tables(job, conn, filename, lines):
+    # INDEX tags name the index, not its table; ask pg_restore for the DDL to find out
+    with tempfile.NamedTemporaryFile("w", suffix=".list", delete=False) as f:
+        f.write("\n".join(lines) + "\n")
+    try:
+        result = job.run(
+            [client("pg_restore"), "-L", f.name, "-f", "-", filename],
+            env=pg_env(conn), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        )
+    finally:
+        os.remove(f.name)
+    return {
+        (schema.strip('"'), name.strip('"')): table.strip('"')
+        for name, schema, table in CREATE_INDEX_RE.findall(result.stdout)
+    }
+
+
+def write_restore_list(job, conn, filename, selection):
+    # pg_restore -L equivalent of the selection; returns (path, number of entries)
+    lines = read_toc(job, conn, filename)
+    entries = [(line, parse_toc_line(line)) for line in lines]
+    indexes = [line for line, entry in entries if entry and entry[0] == "INDEX"]
+    index_table = index_tables(job, conn, filename, indexes) if indexes else {}
+    table_schemas = {schema for schema, table in selection.get("tables", [])}
+
+    kept = []
+    for line, entry in entries:
+        if entry is None:
+            continue
+        toc_type, schema, tag = entry
+        table = None
+        if toc_type in TABLE_TAGS:
+            table = tag
+        elif toc_type in TABLE_PREFIXED_TAGS:
+            table = tag.split(" ", 1)[0]
+        elif toc_type == "INDEX":
+            table = index_table.get((schema, tag))
+        elif toc_type in ("COMMENT", "ACL") and tag.startswith(("TABLE ", "COLUMN ")):
+            table = tag.split(" ", 1)[1].split(".", 1)[0]
+
+        if schema == "-" and (toc_type == "SCHEMA" or tag.startswith("SCHEMA ")):
+            # A schema and its comment/ACL: treated like the schema's other objects
+            schema = tag.split(" ", 1)[1] if toc_type != "SCHEMA" else tag
+
+        if schema == "-":
+            # Extensions and other database-wide entries
+            keep = not selection.get("schemas") and not selection.get("tables")
+        elif toc_type in SEQUENCE_TYPES and schema in table_schemas:
+            # Sequences behind the selected tables' defaults aren't named in the selection
+            keep = includes(selection, schema)
+        elif table is None:
+            # Functions, types etc. only come along when their whole schema is selected
+            keep = includes(selection, schema) and (
+                not selection.get("tables") or schema in selection.get("schemas", [])
+            )
+        elif toc_type in DATA_TYPES:
+            keep = includes_data(selection, schema, table)
+        else:
+            keep = includes(selection, schema, table)
+        if keep:
+            kept.append(line)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".list", delete=False) as f:
+        f.write("\n".join(kept) + "\n")
+    return f.name, len(kept)
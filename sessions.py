@@ -0,0 +1,220 @@
+import atexit
+import itertools
+import queue
+import subprocess
+import threading
+import time
+
+
+# Idle sessions are closed after this long, and at most MAX_IDLE are kept open
+IDLE_TIMEOUT = 300
+MAX_IDLE = 8
+# A query with no reply for this long (seconds) is given up on and its session
+# killed, so a hung server or psql can't block a worker for good
+QUERY_TIMEOUT = 300
+# How often a waiting query checks for the deadline and for cancellation
+POLL_INTERVAL = 0.5
+
+# Unaligned, tuples only, no prompts: the same output as a one-off `psql -t -A -c`
+SESSION_ARGS = ["-X", "-q", "-t", "-A", "-w", "-v", "ON_ERROR_STOP=0"]
+
+_markers = itertools.count()
+
+
+class SessionLost(Exception):
+    pass
+
+
+class SessionTimeout(SessionLost):
+    pass
+
+
+class Session:
+    def __init__(self, cmd, env):
+        # stderr is merged into stdout so error messages arrive in order with the results
+        self.process = subprocess.Popen(
+            cmd + SESSION_ARGS, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, text=True
+        )
+        self.used = time.monotonic()
+        # Output is read on a side thread, so a wait for it can time out
+        self.output = queue.Queue()
+        self.ended = False
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.output.put(line)
+        self.output.put(None)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def execute(self, sql, timeout=QUERY_TIMEOUT, cancelled=None):
+        # Each query is followed by a unique marker echoing psql's ERROR variable,
+        # so the reply can be read without waiting for the process to exit.
+        # With no reply for timeout seconds, or once cancelled() is true, the
+        # session is killed.
+        marker = f"__pg_import_export_{next(_markers)}__"
+        sql = sql.strip()
+        if not sql.endswith(";"):
+            sql += ";"
+        try:
+            self.process.stdin.write(f"{sql}\n\\echo {marker} :ERROR\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            raise SessionLost(self.drain())
+
+        lines = []
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = self.output.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if cancelled is not None and cancelled():
+                    self.kill()
+                    raise SessionLost("\n".join(lines))
+                if time.monotonic() >= deadline:
+                    self.kill()
+                    raise SessionTimeout(f"No reply from the server within {timeout} seconds")
+                continue
+            if line is None:
+                self.ended = True
+                raise SessionLost("\n".join(lines + [self.drain()]))
+            deadline = time.monotonic() + timeout
+            line = line.rstrip("\n")
+            if line.startswith(marker):
+                error = line[len(marker):].strip()
+                break
+            lines.append(line)
+
+        self.used = time.monotonic()
+        # psql before 11 has no ERROR variable; fall back to spotting its error prefix
+        if error == "true" or (error != "false" and any(line.startswith("psql:") for line in lines)):
+            raise subprocess.CalledProcessError(1, self.process.args, stderr="\n".join(lines))
+        # Anything else psql reports (notices, warnings) isn't part of the result
+        return [line for line in lines if not line.startswith("psql:")]
+
+    def drain(self):
+        # Whatever a dead session printed last, usually the connection error
+        lines = []
+        while not self.ended:
+            try:
+                line = self.output.get(timeout=5)
+            except queue.Empty:
+                break
+            if line is None:
+                self.ended = True
+            else:
+                lines.append(line)
+        self.kill()
+        return "".join(lines).strip()
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+    def close(self):
+        try:
+            self.process.stdin.write("\\q\n")
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+
+
+class SessionPool:
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, max_idle=MAX_IDLE):
+        self.idle_timeout = idle_timeout
+        self.max_idle = max_idle
+        self.idle = []
+        self.lock = threading.Lock()
+        self.reaper = None
+
+    def query(self, job, cmd, env, sql, timeout=QUERY_TIMEOUT):
+        # Sessions are keyed by the full connection (psql arguments, password and
+        # session options), so a changed password or database never reuses an old login
+        key = (tuple(cmd), env.get("PGPASSWORD"), env.get("PGOPTIONS"))
+        session = self.acquire(key)
+        reused = session is not None
+        if session is None:
+            session = Session(cmd, env)
+
+        job.attach(session.process)
+        try:
+            lines = session.execute(sql, timeout, lambda: job.cancelled)
+        except SessionTimeout as e:
+            job.detach(session.process)
+            job.check_cancelled()
+            raise subprocess.CalledProcessError(session.process.returncode, session.process.args, stderr=str(e))
+        except SessionLost as e:
+            job.detach(session.process)
+            job.check_cancelled()
+            if reused:
+                # The server may have dropped an idle connection; retry on a fresh one
+                return self.query(job, cmd, env, sql, timeout)
+            raise subprocess.CalledProcessError(session.process.returncode, session.process.args, stderr=str(e))
+        except BaseException:
+            job.detach(session.process)
+            self.release(key, session)
+            raise
+        job.detach(session.process)
+        self.release(key, session)
+        return lines
+
+    def acquire(self, key):
+        with self.lock:
+            for index in range(len(self.idle) - 1, -1, -1):
+                idle_key, session = self.idle[index]
+                if idle_key == key:
+                    del self.idle[index]
+                    if session.alive():
+                        return session
+                    session.close()
+        return None
+
+    def release(self, key, session):
+        if not session.alive():
+            return
+        with self.lock:
+            self.idle.append((key, session))
+            # Least recently used sessions go first
+            evicted = self.idle[:-self.max_idle] if len(self.idle) > self.max_idle else []
+            self.idle = self.idle[len(evicted):]
+            if self.reaper is None:
+                self.reaper = threading.Thread(target=self._reap, daemon=True)
+                self.reaper.start()
+        for _, old in evicted:
+            old.close()
+
+    def close_idle(self, max_age=None):
+        max_age = self.idle_timeout if max_age is None else max_age
+        now = time.monotonic()
+        with self.lock:
+            expired = [entry for entry in self.idle if now - entry[1].used >= max_age]
+            self.idle = [entry for entry in self.idle if entry not in expired]
+        for _, session in expired:
+            session.close()
+
+    def close_all(self):
+        self.close_idle(0)
+
+    def _reap(self):
+        while True:
+            time.sleep(max(1, self.idle_timeout / 4))
+            self.close_idle()
+
+
+_pool = SessionPool()
+atexit.register(_pool.close_all)
+
+
+def query(job, cmd, env, sql, timeout=QUERY_TIMEOUT):
+    # Runs sql on a pooled psql session for cmd; returns output lines
+    return _pool.query(job, cmd, env, sql, timeout)
+
+
+def close_all():
+    _pool.close_all()
@@ -0,0 +1,32 @@
+import io
+
+from resumable import session_key, split_statements
+
+
+def keys(script):
+    return [session_key(kind, data) for kind, data, *_ in split_statements(io.BytesIO(script))]
+
+
+def test_set_statements_are_session_state():
+    script = (
+        b"SET statement_timeout = 0;\n"
+        b"SELECT pg_catalog.set_config('search_path', '', false);\n"
+        b"--\n-- Name: t; Type: TABLE\n--\n\nSET default_tablespace = '';\n"
+    )
+    assert keys(script) == ["statement_timeout", "search_path", "default_tablespace"]
+
+
+def test_function_set_clause_is_not_session_state():
+    script = (
+        b"SELECT pg_catalog.set_config('search_path', '', false);\n"
+        b"--\n-- Name: f(); Type: FUNCTION\n--\n\n"
+        b"CREATE FUNCTION public.f() RETURNS integer\n"
+        b"    LANGUAGE sql\n"
+        b"    SET search_path TO 'public'\n"
+        b"    AS $$SELECT 1$$;\n"
+    )
+    assert keys(script) == ["search_path", None]
+
+
+def test_set_local_is_not_session_state():
+    assert keys(b"SET LOCAL work_mem = '1GB';\n") == [None]
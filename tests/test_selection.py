@@ -0,0 +1,16 @@
+from selection import parse_toc_line
+
+
+def test_owner_is_dropped_from_the_tag():
+    assert parse_toc_line("215; 1259 16390 TABLE public orders app") == ("TABLE", "public", "orders")
+    assert parse_toc_line("3342; 0 16390 TABLE DATA public my table app") == ("TABLE DATA", "public", "my table")
+
+
+def test_empty_owner_keeps_the_whole_tag():
+    assert parse_toc_line("3342; 0 16390 TABLE DATA public my table ") == ("TABLE DATA", "public", "my table")
+    assert parse_toc_line("3343; 0 16391 TABLE DATA public orders ") == ("TABLE DATA", "public", "orders")
+
+
+def test_comments_and_database_wide_entries():
+    assert parse_toc_line(";     Dumped from database version 16.2") is None
+    assert parse_toc_line("2; 3079 16384 EXTENSION - pgcrypto ") == ("EXTENSION", "-", "pgcrypto")
@@ -0,0 +1,189 @@
+import subprocess
+import threading
+import time
+
+from core import query
+from jobs import JobCancelled
+from progress import MB
+
+
+# Throttle settings, passed around as a dict like selections:
+#   max_mb_per_second:  hard cap on the dump stream; None for no cap
+#   busy_sessions:      back off while more client sessions than this are active
+#   max_lag_mb:         back off while a replica is further behind than this
+THROTTLE_KEYS = ["max_mb_per_second", "busy_sessions", "max_lag_mb"]
+# What the GUI's "back off when busy" uses
+DEFAULT_BUSY_SESSIONS = 20
+DEFAULT_MAX_LAG_MB = 256
+
+# Seconds between two load samples
+SAMPLE_INTERVAL = 5
+# While busy the rate is cut to this fraction every sample, and raised by RECOVERY once it's quiet
+BACKOFF = 0.5
+RECOVERY = 1.5
+# Never throttle below this, so a dump on a constantly busy server still finishes
+MIN_BYTES_PER_SECOND = 256 * 1024
+# Data allowed through at once after a pause
+BURST_SECONDS = 1
+# Longest single sleep, so cancelling stays responsive
+MAX_SLEEP = 0.25
+
+# Our own connections (pg_env sets PGAPPNAME) don't count as load. Replication
+# lag is only known on a primary; a standby reports none.
+LOAD_SQL = """
+SELECT count(*) FILTER (
+           WHERE state = 'active' AND backend_type = 'client backend' AND pid <> pg_backend_pid()
+             AND application_name NOT IN ('pg_import_export', 'pg_dump')
+       ),
+       CASE WHEN pg_is_in_recovery() THEN 0 ELSE (
+           SELECT coalesce(max(pg_wal_lsn_diff(pg_current_wal_lsn(), replay_lsn)), 0)::bigint
+           FROM pg_stat_replication
+       ) END
+FROM pg_stat_activity;
+"""
+
+
+def is_throttled(throttle):
+    return bool(throttle) and any(throttle.get(key) for key in THROTTLE_KEYS)
+
+
+def adaptive(throttle):
+    return bool(throttle) and bool(throttle.get("busy_sessions") or throttle.get("max_lag_mb"))
+
+
+def describe(throttle):
+    if not is_throttled(throttle):
+        return "Unthrottled"
+    parts = []
+    if throttle.get("max_mb_per_second"):
+        parts.append(f"max {throttle['max_mb_per_second']} MB/s")
+    if throttle.get("busy_sessions"):
+        parts.append(f"back off above {throttle['busy_sessions']} active sessions")
+    if throttle.get("max_lag_mb"):
+        parts.append(f"back off above {throttle['max_lag_mb']} MB replica lag")
+    return ", ".join(parts)
+
+
+class Throttle:
+    # Token bucket shared by every stream of one export (parallel workers
+    # included). Reading the dump more slowly makes pg_dump/COPY block on its
+    # pipe, which in turn slows the server backend feeding it.
+    def __init__(self, job, conn, settings):
+        self.job = job
+        self.conn = conn
+        self.settings = settings or {}
+        # The export's Meter, which shows why the rate is limited
+        self.meter = None
+        cap = self.settings.get("max_mb_per_second")
+        self.cap = float(cap) * MB if cap else None
+        self.limit = self.cap
+        self.allowance = 0.0
+        self.stamp = time.monotonic()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.monitor = None
+
+    def start(self):
+        if adaptive(self.settings):
+            self.monitor = threading.Thread(target=self._watch, daemon=True)
+            self.monitor.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.monitor is not None:
+            self.monitor.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def consume(self, count):
+        with self.lock:
+            self.bytes += count
+            limit = self.limit
+            if limit is None:
+                return
+            now = time.monotonic()
+            self.allowance = min(limit * BURST_SECONDS, self.allowance + (now - self.stamp) * limit)
+            self.stamp = now
+            self.allowance -= count
+            wait = -self.allowance / limit if self.allowance < 0 else 0
+        while wait > 0:
+            self.job.check_cancelled()
+            time.sleep(min(wait, MAX_SLEEP))
+            wait -= MAX_SLEEP
+
+    def sample(self):
+        # (active sessions, replication lag in bytes)
+        row = query(self.job, self.conn, LOAD_SQL)[0]
+        return int(row[0]), int(row[1])
+
+    def adjust(self, active, lag, rate):
+        # Multiplicative decrease while busy, gradual recovery up to the cap (or
+        # to no limit at all) once the server is quiet again
+        busy_sessions = self.settings.get("busy_sessions")
+        max_lag = self.settings.get("max_lag_mb")
+        reasons = []
+        if busy_sessions and active > int(busy_sessions):
+            reasons.append(f"{active} active sessions")
+        if max_lag and lag > float(max_lag) * MB:
+            reasons.append(f"replica {lag / MB:.0f} MB behind")
+
+        with self.lock:
+            if reasons:
+                current = self.limit if self.limit is not None else max(rate, MIN_BYTES_PER_SECOND)
+                self.limit = max(MIN_BYTES_PER_SECOND, current * BACKOFF)
+            elif self.limit is not None and self.limit != self.cap:
+                self.limit *= RECOVERY
+                if self.cap is not None and self.limit >= self.cap:
+                    self.limit = self.cap
+                elif self.cap is None and rate < self.limit / RECOVERY * 0.9:
+                    # The dump no longer uses what it's allowed: lift the limit
+                    self.limit = None
+            limit = self.limit
+
+        if reasons:
+            note = f"throttled to {limit / MB:.1f} MB/s: {', '.join(reasons)}"
+        elif limit is not None and limit != self.cap:
+            note = f"recovering, {limit / MB:.1f} MB/s"
+        else:
+            note = ""
+        if self.meter is not None:
+            self.meter.note = note
+
+    def _watch(self):
+        last_bytes, last_time = 0, time.monotonic()
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            try:
+                active, lag = self.sample()
+            except (subprocess.CalledProcessError, ValueError, IndexError):
+                continue  # A failed sample leaves the rate as it is
+            except JobCancelled:
+                return
+            now = time.monotonic()
+            with self.lock:
+                count = self.bytes
+            rate = (count - last_bytes) / max(now - last_time, 1e-6)
+            last_bytes, last_time = count, now
+            self.adjust(active, lag, rate)
+
+
+class ThrottledReader:
+    def __init__(self, source, throttle):
+        self.source = source
+        self.throttle = throttle
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.throttle.consume(len(data))
+        return data
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self.source.close()
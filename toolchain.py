@@ -0,0 +1,227 @@
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+from core import connection_args, pg_env
+from profiles import sibling_path
+
+
+# Picks the psql/pg_dump/pg_restore/vacuumdb to run against each server. Every client
+# found on PATH or in the usual per-version install directories is probed once
+# with --version (re-probed when the binary changes), and each server's
+# server_version_num is looked up once and cached next to the profiles.
+TOOLS = ["psql", "pg_dump", "pg_restore", "vacuumdb"]
+TOOLCHAIN_FILE = "toolchain.json"
+PG_BIN_GLOBS = [
+    "/usr/lib/postgresql/*/bin", "/usr/pgsql-*/bin", "/usr/local/pgsql/bin",
+    "/opt/homebrew/opt/postgresql*/bin", "/usr/local/opt/postgresql*/bin",
+    "/Applications/Postgres.app/Contents/Versions/*/bin",
+    "C:\\Program Files\\PostgreSQL\\*\\bin",
+]
+VERSION_RE = re.compile(r"\(PostgreSQL\) (\d+)(?:\.(\d+))?")
+# Client versions are re-probed after this long even if the binary looks
+# unchanged (wrappers like Debian's pg_wrapper answer for whatever is installed)
+CLIENT_TTL = 7 * 24 * 3600
+# Servers are asked again after this long, so an upgraded server gets a matching pg_dump
+SERVER_TTL = 24 * 3600
+# An unreachable server isn't asked again for this long
+FAILURE_RETRY = 60
+VERSION_TIMEOUT = 15
+
+_lock = threading.Lock()
+_cache = None
+_clients = None
+_failures = {}
+
+
+def major(version):
+    # 16.2 -> (16,), 9.6.24 -> (9, 6): the part that has to match between client and server
+    version = tuple(version)
+    return version[:1] if version[0] >= 10 else version[:2]
+
+
+def format_version(version):
+    return ".".join(str(part) for part in version)
+
+
+def parse_server_version(number):
+    # server_version_num: 160002 -> (16, 2), 90624 -> (9, 6, 24)
+    number = int(number)
+    if number >= 100000:
+        return (number // 10000, number % 10000)
+    return (number // 10000, number // 100 % 100, number % 100)
+
+
+def load_cache():
+    global _cache
+    if _cache is None:
+        try:
+            with open(sibling_path(TOOLCHAIN_FILE), "r") as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            _cache = {}
+        _cache.setdefault("clients", {})
+        _cache.setdefault("servers", {})
+    return _cache
+
+
+def save_cache():
+    path = sibling_path(TOOLCHAIN_FILE)
+    try:
+        with open(path + ".tmp", "w") as f:
+            json.dump(_cache, f, indent=4)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        pass  # Only a cache: the next run probes again
+
+
+def bin_dirs():
+    # PATH first, in order, then the install locations that are rarely on it
+    dirs = os.environ.get("PATH", "").split(os.pathsep)
+    dirs += sorted(path for pattern in PG_BIN_GLOBS for path in glob.glob(pattern))
+    seen = set()
+    for directory in dirs:
+        key = os.path.normcase(os.path.abspath(directory)) if directory else None
+        if key and key not in seen and os.path.isdir(directory):
+            seen.add(key)
+            yield directory
+
+
+def probe(path, cached, now):
+    mtime = os.path.getmtime(path)
+    if cached and cached["mtime"] == mtime and now - cached["checked"] < CLIENT_TTL:
+        return cached
+    try:
+        output = subprocess.run(
+            [path, "--version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+            timeout=VERSION_TIMEOUT
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = VERSION_RE.search(output)
+    if not match:
+        return None
+    version = [int(match.group(1))] + ([int(match.group(2))] if match.group(2) else [])
+    return {"mtime": mtime, "checked": now, "version": version}
+
+
+def discover():
+    # [{"tool", "path", "version"}] for every client binary found, in PATH order
+    cache = load_cache()
+    now = time.time()
+    clients = []
+    probed = {}
+    for directory in bin_dirs():
+        for tool in TOOLS:
+            path = shutil.which(tool, path=directory)
+            if not path:
+                continue
+            path = os.path.abspath(path)
+            entry = probe(path, cache["clients"].get(path), now)
+            if entry is None:
+                continue
+            probed[path] = entry
+            clients.append({"tool": tool, "path": path, "version": tuple(entry["version"])})
+    if probed != cache["clients"]:
+        cache["clients"] = probed
+        save_cache()
+    return clients
+
+
+def clients(refresh=False):
+    global _clients
+    with _lock:
+        if refresh:
+            load_cache()["clients"] = {}
+        if _clients is None or refresh:
+            _clients = discover()
+        return list(_clients)
+
+
+def newest(candidates):
+    # Highest version; the first one found (PATH order) among equals
+    return max(candidates, key=lambda client: client["version"])
+
+
+def server_key(conn):
+    return f"{conn['host']}:{conn['port']}"
+
+
+def server_version(conn, refresh=False):
+    # (major, minor[, patch]) of the server behind conn, or None when it can't be reached.
+    # Asked with the newest psql, which talks to any server version.
+    key = server_key(conn)
+    found = [client for client in clients() if client["tool"] == "psql"]
+    with _lock:
+        entry = load_cache()["servers"].get(key)
+        if entry and not refresh and time.time() - entry["checked"] < SERVER_TTL:
+            return parse_server_version(entry["version_num"])
+        if not found or time.time() - _failures.get(key, 0) < FAILURE_RETRY:
+            return None
+
+    env = pg_env(conn)
+    env.setdefault("PGCONNECT_TIMEOUT", str(VERSION_TIMEOUT))
+    try:
+        result = subprocess.run(
+            [newest(found)["path"]] + connection_args(conn, conn.get("database") or "postgres")
+            + ["-X", "-q", "-t", "-A", "-w", "-c", "SHOW server_version_num"],
+            env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, timeout=VERSION_TIMEOUT * 2
+        )
+        number = int(result.stdout.strip())
+    except (OSError, subprocess.SubprocessError, ValueError):
+        # Not cached: the job's own connection attempt reports the real error
+        with _lock:
+            _failures[key] = time.time()
+        return None
+
+    with _lock:
+        _failures.pop(key, None)
+        servers = load_cache()["servers"]
+        # Expired entries go, so throwaway servers (benchmark clusters) don't pile up
+        for stale in [name for name, entry in servers.items() if time.time() - entry["checked"] >= SERVER_TTL]:
+            del servers[stale]
+        servers[key] = {"version_num": number, "checked": time.time()}
+        save_cache()
+    return parse_server_version(number)
+
+
+def choose(tool, found, server=None):
+    # pg_dump must be the server's major version or newer (it refuses newer
+    # servers); psql prefers a matching major, so its output and catalog
+    # queries behave as on that server; pg_restore reads any older archive,
+    # so the newest one always works.
+    candidates = [client for client in found if client["tool"] == tool]
+    if not candidates:
+        return None
+    if server is None or tool == "pg_restore":
+        return newest(candidates)
+    wanted = major(server)
+    matching = [client for client in candidates if major(client["version"]) == wanted]
+    if matching:
+        return newest(matching)
+    best = newest(candidates)
+    if tool == "pg_dump" and major(best["version"]) < wanted:
+        raise RuntimeError(
+            f"The server runs PostgreSQL {format_version(server)} but the newest pg_dump found is "
+            f"{format_version(best['version'])} ({best['path']}), which can't dump it. "
+            f"Install the PostgreSQL {format_version(wanted)} client tools."
+        )
+    return best
+
+
+def chosen(tool, conn=None):
+    # {"tool", "path", "version"} of the tool to run against conn, None when none was found
+    return choose(tool, clients(), server_version(conn) if conn else None)
+
+
+def client(tool, conn=None):
+    # Full path of the tool to run against conn; the bare name when none was
+    # found, so the usual "not found" error comes from the command itself
+    found = chosen(tool, conn)
+    return found["path"] if found else tool
@@ -0,0 +1,157 @@
+import queue
+import subprocess
+import threading
+
+from copy_engine import (
+    SPLIT_BYTES, copy_out_commands, exported_snapshot, large_objects_command, list_tables, plan_units,
+    qualified_name, run_parallel, sequence_statements
+)
+from core import connection_args, dump_command, estimate_dump_size, pg_env, psql_command, resolve_jobs
+from progress import Meter, MeteredReader
+from toolchain import client
+
+
+# Source and target are decoupled by an in-memory queue of this many bytes in
+# total (split across parallel streams), so neither side waits on the other's
+# bursts while memory stays bounded; nothing is written to disk
+BUFFER_BYTES = 64 * 1024 * 1024
+STREAM_CHUNK = 1024 * 1024
+
+
+def pump(source, target, buffer_bytes=BUFFER_BYTES, on_broken=None):
+    # Copies source to target through a bounded queue filled by a reader thread.
+    # If the target stops reading, on_broken() is called to stop whatever feeds
+    # source and False is returned (the target's exit status says why).
+    chunks = queue.Queue(maxsize=max(1, buffer_bytes // STREAM_CHUNK))
+    stopped = threading.Event()
+    failure = []
+
+    def read():
+        try:
+            while not stopped.is_set():
+                chunk = source.read(STREAM_CHUNK)
+                chunks.put(chunk)
+                if not chunk:
+                    return
+        except BaseException as e:
+            failure.append(e)
+            chunks.put(b"")
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    complete = True
+    try:
+        while True:
+            chunk = chunks.get()
+            if not chunk:
+                break
+            target.write(chunk)
+        target.close()
+    except BrokenPipeError:
+        complete = False
+        stopped.set()
+        if on_broken:
+            on_broken()
+        # Unblock the reader so it notices the stop
+        while reader.is_alive():
+            try:
+                chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    reader.join()
+    if failure:
+        raise failure[0]
+    return complete
+
+
+def stream(job, producer, consumer, source, buffer_bytes):
+    # If the target gives up, the source is stopped so the target's error is the one reported
+    pump(source, consumer.stdin, buffer_bytes, on_broken=producer.terminate)
+    job.finish(consumer)
+    job.finish(producer)
+
+
+def load_command(target, *args):
+    return psql_command(target, "-X", "-q", "-v", "ON_ERROR_STOP=1", *args)
+
+
+def copy_sql(job, source, target, export_type, buffer_bytes):
+    # One pg_dump piped into one psql: the whole dump runs in a single snapshot
+    meter = Meter("Copying database", estimate_dump_size(job, source, export_type), job.progress)
+    dump = job.start(dump_command(source, export_type), env=pg_env(source), stdout=subprocess.PIPE)
+    load = job.start(load_command(target), env=pg_env(target), stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    stream(job, dump, load, MeteredReader(dump.stdout, meter, count_statements=True), buffer_bytes)
+    return meter
+
+
+def copy_section(job, source, target, section, snapshot, buffer_bytes):
+    dump = job.start(
+        [client("pg_dump", source)] + connection_args(source) + ["--section", section, "--snapshot", snapshot],
+        env=pg_env(source), stdout=subprocess.PIPE
+    )
+    load = job.start(load_command(target), env=pg_env(target), stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    stream(job, dump, load, dump.stdout, buffer_bytes)
+
+
+def copy_unit(job, source, target, unit, snapshot, meter, buffer_bytes):
+    table = unit["table"]
+    dump = job.start(
+        psql_command(source, "-X", "-q", "-v", "ON_ERROR_STOP=1", *copy_out_commands(unit, snapshot)),
+        env=pg_env(source), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE
+    )
+    load = job.start(
+        load_command(target, "-c", f"COPY {qualified_name(table['schema'], table['name'])} FROM STDIN"),
+        env=pg_env(target), stdin=subprocess.PIPE, stdout=subprocess.DEVNULL
+    )
+    stream(job, dump, load, MeteredReader(dump.stdout, meter), buffer_bytes)
+    meter.add_statements(1)
+
+
+def copy_sequences_and_large_objects(job, source, target, snapshot, buffer_bytes):
+    # The parts of pg_dump's data section that per-table COPY leaves out
+    job.status("Copying sequence values and large objects...")
+    statements = sequence_statements(job, source, snapshot)
+    if statements:
+        job.run(
+            load_command(target), input="\n".join(statements) + "\n", env=pg_env(target),
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+        )
+    command = large_objects_command(job, source, snapshot)
+    if command:
+        dump = job.start(command, env=pg_env(source), stdout=subprocess.PIPE)
+        load = job.start(load_command(target), env=pg_env(target), stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+        stream(job, dump, load, dump.stdout, buffer_bytes)
+
+
+def copy_tables(job, source, target, export_type, jobs, buffer_bytes, split_bytes=SPLIT_BYTES):
+    # Like the per-table export, but every COPY OUT feeds a COPY IN on the target.
+    # The snapshot stays open until post-data is dumped, after the data is loaded.
+    meter = Meter(f"Copying tables ({jobs} jobs)", 0, job.progress)
+    with exported_snapshot(job, source) as snapshot:
+        if export_type != "data":
+            job.status("Creating tables...")
+            copy_section(job, source, target, "pre-data", snapshot, buffer_bytes)
+
+        if export_type != "schema":
+            job.status("Planning table copy...")
+            units = plan_units(job, source, list_tables(job, source), split_bytes)
+            meter.total = sum(unit["bytes"] for unit in units)
+            per_stream = max(STREAM_CHUNK, buffer_bytes // jobs)
+            workers = job.child()
+            run_parallel(jobs, [
+                (copy_unit, (workers, source, target, unit, snapshot, meter, per_stream)) for unit in units
+            ], workers)
+            copy_sequences_and_large_objects(job, source, target, snapshot, buffer_bytes)
+
+        if export_type != "data":
+            job.status("Creating indexes and constraints...")
+            copy_section(job, source, target, "post-data", snapshot, buffer_bytes)
+    return meter
+
+
+def copy_database(job, source, target, export_type="full", jobs=None, parallel=False,
+                  buffer_bytes=BUFFER_BYTES):
+    # Streams source into target without an intermediate file; returns the Meter
+    if parallel:
+        return copy_tables(job, source, target, export_type, resolve_jobs(jobs), buffer_bytes)
+    return copy_sql(job, source, target, export_type, buffer_bytes)
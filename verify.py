@@ -0,0 +1,248 @@
+import os
+import random
+import re
+import subprocess
+
+from compression import open_decompressed, zstandard
+from copy_engine import qualified_name, run_parallel
+from core import error_text, inspect_import_file, open_dump, pg_env, query, resolve_jobs
+from incremental import CHAIN_FILES, resolve_chain
+from parts import is_split
+from repository import is_backup
+from progress import Meter, MeteredReader
+from resumable import read_lines
+from toolchain import client
+
+
+# Checks a backup without restoring it: the file is read end to end (so
+# truncation, decompression errors and part checksums surface), COPY rows are
+# counted per table and, given a connection, compared with the source database.
+
+# Row counts further than this from pg_class.reltuples get an exact count(*)
+ESTIMATE_TOLERANCE = 0.10
+# ... unless the difference is this small, which estimates are never exact about
+ESTIMATE_SLACK = 1000
+# Tables that get an exact count(*) besides the suspicious ones
+SAMPLE_TABLES = 8
+# An exact count scans the whole table, so it gets longer than a catalog query (seconds)
+COUNT_TIMEOUT = 3600
+
+COPY_HEADER_RE = re.compile(rb"^COPY (.+?) (?:\(.*\) )?FROM stdin;\r?\n?$")
+COPY_END = (b"\\.\n", b"\\.\r\n", b"\\.")
+# pg_dump and pg_dumpall both end with "-- PostgreSQL database [cluster] dump complete"
+DUMP_COMPLETE_RE = re.compile(rb"^-- PostgreSQL database (?:cluster )?dump complete")
+IDENTIFIER_RE = re.compile(r'"((?:[^"]|"")*)"|([^."]+)')
+
+# What damaged compressed data, a failed part checksum or pg_restore rejecting an archive raise
+READ_ERRORS = (OSError, EOFError, ValueError, RuntimeError, subprocess.CalledProcessError) + (
+    (zstandard.ZstdError,) if zstandard is not None else ()
+)
+
+# Names are hex-encoded: they may contain "|", the column separator
+ESTIMATES_SQL = """
+SELECT encode(convert_to(n.nspname, 'UTF8'), 'hex'), encode(convert_to(c.relname, 'UTF8'), 'hex'),
+       c.reltuples::bigint
+FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN ('r', 'p', 'm') AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+  AND n.nspname NOT LIKE 'pg_toast%' AND n.nspname NOT LIKE 'pg_temp%';
+"""
+
+
+def decode(value):
+    return bytes.fromhex(value.strip()).decode("utf-8")
+
+
+def parse_qualified(name):
+    # 'public.users' / '"My Schema"."Users"' -> (schema, table)
+    parts = [quoted.replace('""', '"') if quoted else plain for quoted, plain in IDENTIFIER_RE.findall(name)]
+    if len(parts) == 1:
+        return "public", parts[0]
+    return parts[0], parts[1]
+
+
+def scan_sql(source, report):
+    # Counts COPY rows per table in a SQL script; records problems in report
+    rows = report["rows"]
+    table = None
+    complete = False
+    for line in read_lines(source):
+        if table is not None:
+            if line in COPY_END:
+                table = None
+            else:
+                rows[table] += 1
+            continue
+        if line.startswith(b"COPY "):
+            match = COPY_HEADER_RE.match(line)
+            if match:
+                table = parse_qualified(match.group(1).decode("utf-8", errors="replace"))
+                rows.setdefault(table, 0)
+        elif DUMP_COMPLETE_RE.match(line):
+            complete = True
+    if table is not None:
+        report["problems"].append(f"Ends inside the data of {qualified_name(*table)}: the dump is truncated")
+    return complete
+
+
+def verify_plain(job, filename, codec, report):
+    # Reading every part once is the check; nothing runs the bytes
+    raw, size = open_dump(filename, check_first=False)
+    meter = Meter("Verifying dump", size, job.progress)
+    with raw:
+        source = MeteredReader(raw, meter)
+        if codec:
+            source = open_decompressed(source, codec)
+        complete = scan_sql(source, report)
+    if not complete:
+        report["problems"].append("The 'dump complete' trailer is missing: the dump is truncated")
+    if is_split(filename):
+        report["checks"].append("Every part matched its SHA-256")
+    elif is_backup(filename):
+        report["checks"].append("Every chunk matched its SHA-256")
+
+
+def verify_archive(job, conn, filename, report):
+    # The TOC must list cleanly, then pg_restore renders the whole archive as a
+    # script (no database involved): every data block is read and decompressed,
+    # which validates the compression checksums, and its COPY rows get counted
+    job.status("Reading archive table of contents...")
+    result = job.run(
+        [client("pg_restore"), "-l", filename], env=pg_env(conn), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    entries = [line for line in result.stdout.splitlines() if line.strip() and not line.startswith(";")]
+    report["checks"].append(f"Table of contents lists {len(entries)} entries")
+    data_entries = sum(1 for line in entries if " TABLE DATA " in line)
+
+    job.status("Reading archive data...")
+    process = job.start([client("pg_restore"), filename], env=pg_env(conn), stdout=subprocess.PIPE)
+    scan_sql(process.stdout, report)
+    job.finish(process)
+    if len(report["rows"]) < data_entries:
+        report["problems"].append(
+            f"Only {len(report['rows'])} of {data_entries} table data entries could be read"
+        )
+    report["checks"].append("Every data block was read and decompressed")
+
+
+def count_copy_file(path, codec):
+    count = 0
+    with open(path, "rb") as raw:
+        source = open_decompressed(raw, codec) if codec != "none" else raw
+        for line in read_lines(source):
+            count += 1
+    return count
+
+
+def verify_tables(job, filename, jobs, report):
+    # Per-table exports (and incremental chains): every data file must exist and decompress
+    manifest = resolve_chain(filename)
+    files = [(table, entry) for table in manifest["tables"] for entry in table["files"]]
+    for key in CHAIN_FILES:
+        if manifest.get(key) and not os.path.exists(manifest[key]):
+            report["problems"].append(f"Missing {key.replace('_', '-')} file: {manifest[key]}")
+    missing = [entry["path"] for table, entry in files if not os.path.exists(entry["path"])]
+    for path in missing:
+        report["problems"].append(f"Missing data file: {path}")
+    present = [(table, entry) for table, entry in files if entry["path"] not in missing]
+
+    meter = Meter(
+        f"Verifying table files ({jobs} jobs)", sum(os.path.getsize(entry["path"]) for _, entry in present),
+        job.progress
+    )
+
+    workers = job.child()
+
+    def count(table, entry):
+        workers.check_cancelled()
+        try:
+            rows = count_copy_file(entry["path"], entry.get("codec", "none"))
+        except READ_ERRORS as e:
+            report["problems"].append(f"Unreadable data file {entry['path']}: {e}")
+            rows = 0
+        meter.add_bytes(os.path.getsize(entry["path"]))
+        meter.add_statements(1)
+        return rows
+
+    counts = run_parallel(jobs, [(count, (table, entry)) for table, entry in present], workers)
+    for (table, entry), rows in zip(present, counts):
+        key = (table["schema"], table["name"])
+        report["rows"][key] = report["rows"].get(key, 0) + rows
+    report["checks"].append(f"{len(present)} data files read and decompressed")
+
+
+def compare_source(job, conn, jobs, report, sample):
+    # reltuples for every table at once, then exact counts in parallel for the
+    # tables that look off plus a random sample of the rest
+    job.status("Comparing with the source database...")
+    estimates = {(decode(schema), decode(name)): int(rows) for schema, name, rows in query(job, conn, ESTIMATES_SQL)}
+    tables = report["tables"]
+    suspicious = []
+    for key, rows in sorted(report["rows"].items()):
+        estimate = estimates.get(key)
+        entry = {"schema": key[0], "name": key[1], "dump_rows": rows, "estimate": estimate, "count": None}
+        tables.append(entry)
+        if estimate is None:
+            report["warnings"].append(f"{qualified_name(*key)} is no longer in the source database")
+        elif estimate >= 0 and abs(rows - estimate) > max(ESTIMATE_SLACK, estimate * ESTIMATE_TOLERANCE):
+            suspicious.append(entry)
+
+    others = [entry for entry in tables if entry not in suspicious and entry["estimate"] is not None]
+    checked = suspicious + random.sample(others, min(sample, len(others)))
+
+    workers = job.child()
+
+    def count(entry):
+        rows = query(
+            workers, conn, f"SELECT count(*) FROM {qualified_name(entry['schema'], entry['name'])};",
+            timeout=COUNT_TIMEOUT
+        )
+        entry["count"] = int(rows[0][0])
+
+    run_parallel(jobs, [(count, (entry,)) for entry in checked], workers)
+    for entry in checked:
+        if entry["count"] != entry["dump_rows"]:
+            # The source keeps changing after the dump, so this alone isn't proof of a bad backup
+            report["warnings"].append(
+                f"{qualified_name(entry['schema'], entry['name'])}: {entry['dump_rows']} rows in the backup, "
+                f"{entry['count']} in the source now"
+            )
+    report["checks"].append(f"Exact row counts compared for {len(checked)} of {len(tables)} tables")
+
+    dumped = set(report["rows"])
+    for key, estimate in estimates.items():
+        if key not in dumped and estimate > 0:
+            report["warnings"].append(f"{qualified_name(*key)} (~{estimate} rows) has no data in the backup")
+
+
+def verify_backup(job, filename, conn=None, jobs=None, sample=SAMPLE_TABLES):
+    # Returns a report: "problems" mean the backup is damaged, "warnings" are
+    # differences from the source that may just be changes since the dump
+    filename, codec, archive_format = inspect_import_file(filename)
+    jobs = resolve_jobs(jobs)
+    report = {
+        "file": filename, "format": archive_format, "rows": {}, "tables": [],
+        "checks": [], "problems": [], "warnings": [],
+    }
+    try:
+        if archive_format == "plain":
+            verify_plain(job, filename, codec, report)
+        elif archive_format == "copy":
+            verify_tables(job, filename, jobs, report)
+        else:
+            verify_archive(job, conn or {}, filename, report)
+    except READ_ERRORS as e:
+        report["problems"].append(f"Could not read the backup: {error_text(e)}")
+    report["checks"].append(f"{sum(report['rows'].values())} rows in {len(report['rows'])} tables")
+
+    if conn and not report["problems"]:
+        compare_source(job, conn, jobs, report, sample)
+    report["ok"] = not report["problems"]
+    return report
+
+
+def format_report(report):
+    lines = [f"{'OK' if report['ok'] else 'FAILED'}: {report['file']} ({report['format']})"]
+    lines += [f"  checked: {check}" for check in report["checks"]]
+    lines += [f"  problem: {problem}" for problem in report["problems"]]
+    lines += [f"  warning: {warning}" for warning in report["warnings"]]
+    return "\n".join(lines)